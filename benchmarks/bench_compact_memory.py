@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# compares the memory held by a GraphDB in snapshot (dict-of-lists) form, its
+# in-memory form and the CompactGraphDB form, for synthetic libraries
+
+import sys
+import tempfile
+from pathlib import Path
+
+from synthetic_library import write_zotero_csv
+
+from scribl.compact_graphdb import compare_memory
+from scribl.process_graphdb_data import GraphDB
+
+
+def main(argv=sys.argv):
+    sizes = [int(size) for size in argv[1:]] or [1000, 10000, 50000]
+    print(f"{'articles':>10} {'dict_of_lists':>15} {'graphdb':>15} {'compact':>15}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for narticles in sizes:
+            csv_filepath = Path(tmpdir) / f"synthetic_{narticles}.csv"
+            write_zotero_csv(csv_filepath, narticles)
+            memory = compare_memory(GraphDB(csv_filepath))
+            print(
+                f"{narticles:>10} {memory['dict_of_lists']:>15,} "
+                f"{memory['graphdb']:>15,} {memory['compact']:>15,}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# time of GraphDB.generate_db_diff between a synthetic library and an earlier
+# snapshot of it missing the last 10% of articles, the entity pools grow with
+# the library so the time per entity should stay flat as the size goes up
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic_library import write_zotero_csv
+
+from scribl.process_graphdb_data import GraphDB
+
+
+def db_size(graphdb):
+    nentities = sum(len(graphdb.db[item_type]) for item_type in graphdb.db)
+    nrelations = sum(
+        len(relations) for relations in graphdb.db["relationships"].values()
+    )
+    return nentities + nrelations
+
+
+def main(argv=sys.argv):
+    sizes = [int(size) for size in argv[1:]] or [2000, 10000, 50000]
+    print(
+        f"{'articles':>10} {'items':>10} {'changes':>9} {'seconds':>8} {'us/item':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for narticles in sizes:
+            pools = {
+                "nagents": max(narticles // 5, 100),
+                "nprocesses": max(narticles // 10, 50),
+            }
+            new_filepath = Path(tmpdir) / f"synthetic_{narticles}.csv"
+            old_filepath = Path(tmpdir) / f"synthetic_{narticles}_old.csv"
+            write_zotero_csv(new_filepath, narticles, **pools)
+            write_zotero_csv(old_filepath, narticles * 9 // 10, **pools)
+            new_graphdb = GraphDB(new_filepath)
+            old_graphdb = GraphDB(old_filepath)
+            start_time = time.perf_counter()
+            db_diff = new_graphdb.generate_db_diff(old_graphdb)
+            elapsed = time.perf_counter() - start_time
+            nitems = db_size(new_graphdb)
+            nchanges = sum(
+                len(db_diff[item_type])
+                for item_type in db_diff
+                if item_type != "relationships"
+            ) + sum(len(relations) for relations in db_diff["relationships"].values())
+            print(
+                f"{narticles:>10} {nitems:>10} {nchanges:>9} {elapsed:>8.3f} "
+                f"{elapsed / nitems * 1e6:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# peak memory (traced by tracemalloc, on top of the loaded graph DB) of writing
+# Cypher and GraphML exports of synthetic libraries to a file, building the
+# whole text first vs streaming statements and XML fragments to the file
+
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from synthetic_library import write_zotero_csv
+
+from scribl.process_graphdb_data import GraphDB
+
+
+def string_cypher(graphdb, file):
+    file.write(graphdb.export_cypher_text(graphdb.generate_cypher()))
+
+
+def stream_cypher(graphdb, file):
+    graphdb.write_cypher_text(file, graphdb.iter_cypher())
+
+
+def string_graphml(graphdb, file):
+    file.write(graphdb.export_graphml_text(graphdb.generate_graphml()))
+
+
+def stream_graphml(graphdb, file):
+    graphdb.write_graphml_text(file, graphdb.iter_graphml())
+
+
+def peak_memory(export, graphdb, filepath):
+    tracemalloc.start()
+    with open(filepath, "w") as file:
+        export(graphdb, file)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(argv=sys.argv):
+    sizes = [int(size) for size in argv[1:]] or [1000, 10000, 50000]
+    exports = [string_cypher, stream_cypher, string_graphml, stream_graphml]
+    print(
+        f"{'articles':>10} {'output':>8}"
+        + "".join(f" {e.__name__:>15}" for e in exports)
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for narticles in sizes:
+            csv_filepath = Path(tmpdir) / f"synthetic_{narticles}.csv"
+            write_zotero_csv(csv_filepath, narticles)
+            graphdb = GraphDB(csv_filepath)
+            output_filepath = Path(tmpdir) / "export.txt"
+            peaks = [
+                peak_memory(export, graphdb, output_filepath) for export in exports
+            ]
+            output_size = output_filepath.stat().st_size  # GraphML file
+            print(
+                f"{narticles:>10} {output_size / 2**20:>7.1f}M"
+                + "".join(f" {peak / 2**20:>14.1f}M" for peak in peaks)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# time to draw one figure per category of a synthetic library, one
+# export_graphml_figure call at a time vs export_graphml_figures with a pool
+# of worker processes, the library is kept under 500 nodes so the whole graph
+# layout doesn't need scipy
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic_library import write_zotero_csv
+
+from scribl.manage_graphdb import GraphDBInstance
+
+
+def main(argv=sys.argv):
+    narticles = int(argv[1]) if len(argv) > 1 else 120
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_filepath = Path(tmpdir) / f"synthetic_{narticles}.csv"
+        write_zotero_csv(
+            csv_filepath, narticles, nagents=150, nprocesses=80, ncategories=12
+        )
+        gdb = GraphDBInstance(Path(tmpdir) / "graphdb")
+        gdb.import_zotero_csv(csv_filepath)
+        gdb.load_zotero_csv()
+        categories = gdb.graphdb.catalog("category")
+        print(
+            f"{narticles} articles, {gdb.graphdb.to_networkx().number_of_nodes()} nodes, {len(categories)} figures"
+        )
+        print(f"{'method':>20} {'seconds':>8} {'s/figure':>9}")
+        start_time = time.perf_counter()
+        for n, category in enumerate(categories):
+            gdb.export_graphml_figure(
+                filepath=Path(tmpdir) / f"single_{n}.png",
+                subgraph=gdb.graphdb.subgraph(category=category),
+            )
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{'one at a time':>20} {elapsed:>8.2f} {elapsed / len(categories):>9.2f}"
+        )
+        for workers in [1, 2, 4]:
+            figures = {
+                Path(tmpdir) / f"batch_{workers}_{n}.png": {"category": category}
+                for n, category in enumerate(categories)
+            }
+            start_time = time.perf_counter()
+            gdb.export_graphml_figures(figures, workers=workers)
+            elapsed = time.perf_counter() - start_time
+            method = f"{workers} workers"
+            print(f"{method:>20} {elapsed:>8.2f} {elapsed / len(categories):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# startup cost of the scribl CLI: cumulative import time of scribl.scribl as
+# reported by python -X importtime, and the slowest top-level imports under it,
+# exits with status 1 when the best run is over budget so it can gate CI
+
+import subprocess
+import sys
+
+budget = 0.5  # seconds, eager imports of the plotting libraries took over a second
+
+
+def import_times(module="scribl.scribl"):
+    # {module: (self seconds, cumulative seconds, nesting depth)} from one
+    # fresh interpreter
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]:
+            continue
+        self_us, cumulative_us, name = line[12:].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6, depth)
+    return times
+
+
+def main(argv=sys.argv):
+    nruns = int(argv[1]) if len(argv) > 1 else 5
+    totals = []
+    for _ in range(nruns):
+        times = import_times()
+        totals.append(times["scribl.scribl"][1])
+    print(f"import scribl.scribl, best of {nruns}: {min(totals) * 1000:.0f} ms")
+    print(f"budget: {budget * 1000:.0f} ms")
+    print(f"{'cumulative ms':>14} module")
+    slowest = sorted(times.items(), key=lambda entry: -entry[1][1])
+    for name, (_, cumulative, depth) in slowest[:20]:
+        print(f"{cumulative * 1000:>14.1f} {'  ' * depth}{name}")
+    if min(totals) > budget:
+        print(f"over budget by {(min(totals) - budget) * 1000:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
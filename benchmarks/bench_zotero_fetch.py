@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# throughput of paginated Zotero API item fetches against a local mock server
+# that adds a fixed latency to every request, sequential vs concurrent pages
+
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scribl.process_zotero import ZoteroAPI
+
+latency = 0.05  # seconds per request, roughly a round trip to api.zotero.org
+
+
+class MockZoteroHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        start = int(params.get("start", 0))
+        limit = int(params.get("limit", 25))
+        nitems = self.server.nitems
+        items = [
+            {
+                "key": f"K{n:07d}",
+                "version": 1,
+                "data": {"key": f"K{n:07d}", "title": f"Article {n}", "tags": []},
+            }
+            for n in range(start, min(start + limit, nitems))
+        ]
+        time.sleep(latency)
+        payload = json.dumps(items).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Last-Modified-Version", "1")
+        self.send_header("Total-Results", str(nitems))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockZoteroServer(ThreadingHTTPServer):
+    request_queue_size = 64
+
+
+def main(argv=sys.argv):
+    nitems = int(argv[1]) if len(argv) > 1 else 20000
+    server = MockZoteroServer(("127.0.0.1", 0), MockZoteroHandler)
+    server.nitems = nitems
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{nitems} items, {latency * 1000:.0f} ms per request")
+    print(f"{'workers':>8} {'requests':>9} {'seconds':>8} {'items/s':>9}")
+    for workers in [1, 4, 8, 16]:
+        api = ZoteroAPI(1, "group", base_url=base_url, workers=workers)
+        start_time = time.perf_counter()
+        nfetched = sum(1 for item in api.top_items())
+        elapsed = time.perf_counter() - start_time
+        assert nfetched == nitems
+        print(
+            f"{workers:>8} {api.nrequests:>9} {elapsed:>8.2f} {nitems / elapsed:>9.0f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+# generates synthetic Zotero CSV exports of arbitrary size for the benchmarks,
+# entity names are drawn from fixed pools so tags repeat across articles the
+# way they do in curated libraries
+
+import csv
+import random
+import sys
+from argparse import ArgumentParser
+
+columns = [
+    "Key",
+    "Item Type",
+    "Publication Year",
+    "Author",
+    "Title",
+    "Publication Title",
+    "Url",
+    "Abstract Note",
+    "Journal Abbreviation",
+    "Manual Tags",
+]
+
+
+def generate_tags(rng, nagents, nprocesses, ncategories):
+    statements = []
+    for category in rng.sample(range(ncategories), rng.randint(1, 2)):
+        statements.append(f"::category category {category}")
+    agents = rng.sample(range(nagents), rng.randint(3, 8))
+    processes = rng.sample(range(nprocesses), rng.randint(2, 5))
+    for n, agent in enumerate(agents):
+        statement = f"::agent agent{agent} :protein :url https://www.uniprot.org/uniprot/P{agent:05d}"
+        if n > 0:
+            statement += f" {rng.choice('|~')} agent{agents[n - 1]}"
+        statements.append(statement)
+    for n, process in enumerate(processes):
+        statement = f"::process process {process} @ agent{rng.choice(agents)}"
+        if n > 0:
+            statement += f" {rng.choice('><=')} process {processes[n - 1]}"
+        statements.append(statement)
+    return "; ".join(statements)
+
+
+def generate_rows(narticles, nagents=2000, nprocesses=1000, ncategories=50, seed=1):
+    rng = random.Random(seed)
+    for n in range(narticles):
+        yield [
+            f"K{n:07d}",
+            "journalArticle",
+            str(rng.randint(1990, 2025)),
+            f"Author{n % 997}, A.; Author{n % 991}, B.",
+            f"Synthetic article number {n}",
+            "Journal of Synthetic Biology",
+            f"https://example.org/articles/{n}",
+            "Lorem ipsum dolor sit amet. " * 20,
+            "J. Synth. Biol.",
+            generate_tags(rng, nagents, nprocesses, ncategories),
+        ]
+
+
+def write_zotero_csv(filepath, narticles, **kwargs):
+    with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(columns)
+        writer.writerows(generate_rows(narticles, **kwargs))
+    return filepath
+
+
+def main(argv=sys.argv):
+    parser = ArgumentParser(description="Generate a synthetic Zotero CSV export")
+    parser.add_argument("filepath", help="path of CSV file to write")
+    parser.add_argument("-n", "--articles", type=int, default=10000)
+    args = parser.parse_args(argv[1:])
+    write_zotero_csv(args.filepath, args.articles)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,9 @@ except metadata_lib.PackageNotFoundError:
 
 ZOTERO_EXPORT = 0
 DB_EXPORT = 1
+ZOTERO_SQLITE = 2
+ZOTERO_API_CACHE = 3
+ZOTERO_RECORDS = 4
 
 prefix = ":"
 statement_prefix = f"{prefix}{prefix}"
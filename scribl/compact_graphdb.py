@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+import sys
+from array import array
+from itertools import chain
+
+from scribl.process_graphdb_data import (
+    GraphDB,
+    OrderedSet,
+    convert_db_fields,
+    entity_fields,
+)
+
+
+class SymbolTable:
+    # interns entity names (and article keys) to consecutive integer ids
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = name_id
+            return name_id
+
+    def lookup(self, name):
+        return self.ids.get(name)
+
+    def __getitem__(self, name_id):
+        return self.names[name_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class EdgeList:
+    # edges of one relationship type as parallel int32 source/target columns,
+    # iterating gives back (partner1, partner2) name tuples like the list store
+    def __init__(self, symbols, relations=()):
+        self.symbols = symbols
+        self.sources = array("i")
+        self.targets = array("i")
+        self.pairs = None  # membership set, only built if it's needed
+        # CSR index of the edges touching each id, only built if it's needed
+        self.offsets = None
+        self.incident = None
+        for relation in relations:
+            self.append(relation)
+
+    def append(self, relation):
+        source = self.symbols.intern(relation[0])
+        target = self.symbols.intern(relation[1])
+        self.sources.append(source)
+        self.targets.append(target)
+        if self.pairs is not None:
+            self.pairs.add((source, target))
+        self.offsets = None
+        self.incident = None
+
+    def build_index(self):
+        # the edge numbers touching id n are incident[offsets[n]:offsets[n + 1]]
+        # in edge order (a self-loop once), offsets only run to the largest id
+        # in the columns, built with a counting sort over the edges
+        nids = max(chain(self.sources, self.targets)) + 1 if len(self) else 0
+        offsets = array("i", [0]) * (nids + 1)
+        for source, target in zip(self.sources, self.targets):
+            offsets[source + 1] += 1
+            if target != source:
+                offsets[target + 1] += 1
+        for n in range(nids):
+            offsets[n + 1] += offsets[n]
+        incident = array("i", [0]) * offsets[nids]
+        fill = array("i", offsets)
+        for edge, (source, target) in enumerate(zip(self.sources, self.targets)):
+            incident[fill[source]] = edge
+            fill[source] += 1
+            if target != source:
+                incident[fill[target]] = edge
+                fill[target] += 1
+        self.offsets = offsets
+        self.incident = incident
+
+    def incident_to(self, name_id):
+        # edge numbers touching an id, proportional to its degree
+        if self.offsets is None:
+            self.build_index()
+        if name_id >= len(self.offsets) - 1:
+            return array("i")
+        return self.incident[self.offsets[name_id] : self.offsets[name_id + 1]]
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        names = self.symbols.names
+        for source, target in zip(self.sources, self.targets):
+            yield (names[source], names[target])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[n] for n in range(*index.indices(len(self)))]
+        names = self.symbols.names
+        return (names[self.sources[index]], names[self.targets[index]])
+
+    def __contains__(self, relation):
+        source = self.symbols.lookup(relation[0])
+        target = self.symbols.lookup(relation[1])
+        if source is None or target is None:
+            return False
+        if self.pairs is None:
+            self.pairs = set(zip(self.sources, self.targets))
+        return (source, target) in self.pairs
+
+    def __eq__(self, other):
+        if isinstance(other, (EdgeList, OrderedSet, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"EdgeList({list(self)!r})"
+
+
+class CompactGraphDB(GraphDB):
+    # read-only compact copy of a GraphDB: names are interned in a symbol table,
+    # edges are int32 columns and entity fields are tuples, the rest of the
+    # GraphDB API (catalog, get, show_relationships, exporters) works unchanged
+    def __init__(self, graphdb):
+        self.symbols = SymbolTable()
+        self.inference_rules = list(graphdb.inference_rules)
+        self.provenance = graphdb.provenance
+        self.article_years = None
+        self.db = {}
+        for key, value in graphdb.db.items():
+            if key in entity_fields:
+                self.db[key] = {}
+                for item, fields in value.items():
+                    name = self.symbols[self.symbols.intern(item)]
+                    self.db[key][name] = {
+                        field: tuple(sys.intern(entry) for entry in entries)
+                        for field, entries in fields.items()
+                    }
+            elif key == "relationships":
+                self.db[key] = {
+                    rtype: EdgeList(self.symbols, relations)
+                    for rtype, relations in value.items()
+                }
+                for edges in self.db[key].values():
+                    edges.build_index()
+            else:
+                self.db[key] = value
+
+    def add_relation(self, rtype, relation):  # noqa: ARG002
+        error_message = "CompactGraphDB is read-only"
+        raise TypeError(error_message)
+
+    remove_relation = add_relation
+
+    def update(self, db_data_filepath, workers=1, export_type=None):  # noqa: ARG002
+        error_message = "CompactGraphDB is read-only"
+        raise TypeError(error_message)
+
+    def relations_of(self, entity, rtype):
+        # relations of one type touching entity, from the CSR edge index
+        entity_id = self.symbols.lookup(entity)
+        if entity_id is None:
+            return []
+        edges = self.db["relationships"][rtype]
+        names = self.symbols.names
+        return [
+            (names[edges.sources[edge]], names[edges.targets[edge]])
+            for edge in edges.incident_to(entity_id)
+        ]
+
+    def show_relationships(self, item_type, item_name):
+        try:
+            self.db[item_type][item_name]
+        except KeyError:
+            return {}
+        result = {"search": (item_type, item_name)}
+        for rtype in self.db["relationships"]:
+            result[rtype] = self.relations_of(item_name, rtype)
+        return result
+
+    def neighbors(self, entity, rtype=None, direction="both"):
+        if direction not in ["out", "in", "both"]:
+            error_message = (
+                f"Unknown direction '{direction}', expected 'out', 'in' or 'both'"
+            )
+            raise ValueError(error_message)
+        rtypes = list(self.db["relationships"]) if rtype is None else [rtype]
+        result = {}
+        for current_rtype in rtypes:
+            for partner1, partner2 in self.relations_of(entity, current_rtype):
+                if partner1 == entity and direction in ["out", "both"]:
+                    result[partner2] = None
+                if partner2 == entity and direction in ["in", "both"]:
+                    result[partner1] = None
+        return list(result)
+
+
+def deep_getsizeof(obj, seen=None):
+    # approximate memory held by obj and everything it references (once each)
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_getsizeof(key, seen) + deep_getsizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_getsizeof(item, seen)
+    elif isinstance(obj, EdgeList):
+        size += deep_getsizeof(obj.sources, seen) + deep_getsizeof(obj.targets, seen)
+        size += deep_getsizeof(obj.offsets, seen) + deep_getsizeof(obj.incident, seen)
+        size += deep_getsizeof(obj.pairs, seen) + deep_getsizeof(obj.symbols, seen)
+    elif isinstance(obj, SymbolTable):
+        size += deep_getsizeof(obj.names, seen) + deep_getsizeof(obj.ids, seen)
+    elif hasattr(obj, "__slots__"):
+        for slot in obj.__slots__:
+            size += deep_getsizeof(getattr(obj, slot, None), seen)
+    return size
+
+
+def compare_memory(graphdb, compact_graphdb=None):
+    # bytes held by the db in snapshot (dict-of-lists) form, in the in-memory
+    # GraphDB form and in the compact form
+    if compact_graphdb is None:
+        compact_graphdb = CompactGraphDB(graphdb)
+    return {
+        "dict_of_lists": deep_getsizeof(convert_db_fields(graphdb.db, list)),
+        "graphdb": deep_getsizeof(graphdb.db),
+        "compact": deep_getsizeof(compact_graphdb.db),
+    }
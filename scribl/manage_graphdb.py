@@ -4,21 +4,21 @@ __author__ = "Amber Biology"
 
 import datetime
 import os
+import pickle
 import shutil
 import tempfile
 from pathlib import Path
 
-import matplotlib
-
-matplotlib.use("Agg")  # must come before pyplot import
-
-import matplotlib.pyplot as plt
-import networkx as nx
-from dateutil import parser as dateparser
-
 import scribl
 from scribl.process_graphdb_data import GraphDB
-from scribl.process_zotero import zotero_library_to_csv
+from scribl.process_zotero import (
+    ZoteroAPI,
+    ZoteroItemCache,
+    write_zotero_csv,
+    zotero_api_url,
+    zotero_library_records,
+    zotero_library_to_csv,
+)
 
 
 # utility function to generate timestamps
@@ -29,6 +29,127 @@ def generate_timestamp(text_format=False):
     return now.strftime("%Y_%m_%d_%H%M%S")
 
 
+# spring is the force directed layout figures have always used, spectral
+# positions come from eigenvectors of the graph Laplacian and scale to larger
+# graphs (both use scipy sparse matrices above 500 nodes)
+figure_layouts = ["spring", "spectral"]
+figure_layout_seed = 3113794652
+
+
+def draw_graph_figure(G, pos, filepath, edge_label_limit=500, verbose=False):
+    # draws G (from GraphDB.to_networkx) on its own Agg figure, rather than
+    # the global pyplot one, so figures can be drawn one after another (or
+    # side by side in worker processes) without sharing any state
+    # plotting libraries are only imported when a figure is drawn, as they
+    # are most of the import time of scribl
+    import networkx as nx  # noqa: PLC0415
+    from dateutil import parser as dateparser  # noqa: PLC0415
+    from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: PLC0415
+    from matplotlib.figure import Figure  # noqa: PLC0415
+
+    # get info needed for labels and node colours
+    new_node_labels = {}
+    article_nodes = []
+    category_nodes = []
+    resource_nodes = []
+    agent_nodes = []
+    other_nodes = []
+    for node in G.nodes.items():
+        key, d = node
+        wrapped_label = "\n".join(d["name"].split(" "))
+        if d["type"] == "ARTICLE":
+            # convert labels to be Author-Date, i.e. "Einstein (1912)"
+            new_node_labels[key] = (
+                d["author"].split(";")[0].split(",")[0]
+                + "\n("
+                + str(dateparser.parse(d["year"]).year)
+                + ")"
+            )
+            article_nodes.append(key)
+        elif d["type"] == "CATEGORY":
+            # wrap lines at spaces
+            new_node_labels[key] = wrapped_label
+            category_nodes.append(key)
+        elif d["type"] == "RESOURCE":
+            new_node_labels[key] = wrapped_label
+            resource_nodes.append(key)
+        elif d["type"] == "AGENT":
+            new_node_labels[key] = wrapped_label
+            agent_nodes.append(key)
+        else:
+            new_node_labels[key] = wrapped_label
+            other_nodes.append(key)
+
+    # generate and save figure as a matplotlib figure
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    node_size = 2000
+    font_size = 8
+
+    # do nodes first, categories in olive and articles in red
+    for nodelist, node_color in [
+        (category_nodes, "tab:olive"),
+        (article_nodes, "tab:red"),
+        (resource_nodes, "tab:green"),
+        (agent_nodes, "tab:blue"),
+        (other_nodes, "tab:purple"),
+    ]:
+        nx.draw_networkx_nodes(
+            G,
+            pos,
+            nodelist=nodelist,
+            node_color=node_color,
+            node_size=node_size,
+            ax=ax,
+        )
+    nx.draw_networkx_labels(G, pos, labels=new_node_labels, font_size=font_size, ax=ax)
+
+    # now edges
+    nx.draw_networkx_edges(G, pos, node_size=node_size, alpha=0.3, width=0.7, ax=ax)
+    # can't use `get_edge_attributes()` for multiedge graphs
+    # https://stackoverflow.com/questions/75810397/how-to-draw-edge-labels-when-there-are-multi-edges-in-networkx
+    # edge labels are unreadable (and slow to place) on large graphs
+    if G.number_of_edges() <= edge_label_limit:
+        edge_labels = {(n1, n2): d["label"] for n1, n2, d in G.edges(data=True)}
+
+        nx.draw_networkx_edge_labels(
+            G, pos, edge_labels=edge_labels, font_size=font_size, ax=ax
+        )
+    elif verbose:
+        print(
+            f"{G.number_of_edges()} edges, over the limit of {edge_label_limit}, edge labels not drawn"
+        )
+
+    figure.tight_layout()
+    ax.axis("off")
+    figure.savefig(filepath)
+
+
+# graph DB and node positions shared by all the figures drawn in a process
+_worker_graphdb = None
+_worker_positions = None
+
+
+def _init_figure_worker(graphdb, positions):
+    # graphdb is a GraphDB, or the path of a snapshot of one (in worker processes)
+    global _worker_graphdb, _worker_positions  # noqa: PLW0603
+    if not isinstance(graphdb, GraphDB):
+        graphdb = GraphDB(graphdb, export_type=scribl.DB_EXPORT)
+    _worker_graphdb = graphdb
+    _worker_positions = positions
+
+
+def _draw_figure_job(job):
+    filepath, options, edge_label_limit = job
+    graphdb = _worker_graphdb.subgraph(**options) if options else _worker_graphdb
+    G = graphdb.to_networkx()
+    pos = {node: _worker_positions[node] for node in G}
+    draw_graph_figure(G, pos, filepath, edge_label_limit=edge_label_limit)
+    return filepath
+
+
 class GraphDBInstance:
     def __init__(self, db_folder_path, overwrite=False, verbose=False):
         self.zotero_keys = scribl.default_keymap["zotero_keys"]
@@ -38,9 +159,15 @@ class GraphDBInstance:
         self.config_folder = self.db_folder_path / "config"
         self.db_snapshots_folder = self.db_folder_path / "db_snapshots"
         self.zotero_csv_exports_folder = self.db_folder_path / "zotero_csv_exports"
+        # items synced from the Zotero API, created on first sync
+        self.zotero_cache_folder = self.db_folder_path / "zotero_cache"
+        # node positions of the last figure, created on first figure export
+        self.figure_layout_folder = self.db_folder_path / "figure_layout"
 
         self.db_backup_folder = self.db_folder_path / "backup"
         self.graphdb = None
+        self.current_zotero_csv = None
+        self.current_timestamp = None
 
         create_new = False
 
@@ -213,6 +340,9 @@ class GraphDBInstance:
         zotero_keys=None,
         cypher_keys=None,
         verbose=False,
+        workers=1,
+        incremental=False,
+        stream=False,
     ):
         if verbose:
             print("Loading csv data into graph DB ...")
@@ -229,16 +359,166 @@ class GraphDBInstance:
             print("Cancelled! DB data not found at", zotero_csv_filename)
             return None
         self.current_zotero_csv = self.zotero_csv_exports_folder / zotero_csv_filename
-        # load , process, and validate csv data
-        self.graphdb = GraphDB(
-            self.current_zotero_csv, zotero_keys=zotero_keys, cypher_keys=cypher_keys
+        self.load_graphdb(
+            self.current_zotero_csv,
+            scribl.ZOTERO_EXPORT,
+            zotero_keys=zotero_keys,
+            cypher_keys=cypher_keys,
+            verbose=verbose,
+            workers=workers,
+            incremental=incremental,
+            stream=stream,
+        )
+        return self.report_load(self.current_zotero_csv.name, verbose=verbose)
+
+    def load_graphdb(
+        self,
+        zotero_source,
+        export_type,
+        zotero_keys=None,
+        cypher_keys=None,
+        verbose=False,
+        workers=1,
+        incremental=False,
+        stream=False,
+    ):
+        # load , process, and validate zotero data, or only re-process the
+        # articles that changed since the last load (or, in a new process,
+        # since the last snapshot) when updating incrementally
+        snapshots = self.get_db_snapshots()
+        if incremental and self.graphdb is None and len(snapshots) > 0:
+            db_snapshot_path = self.db_snapshots_folder / snapshots[-1]
+            self.graphdb = GraphDB(
+                db_snapshot_path,
+                export_type=scribl.DB_EXPORT,
+                zotero_keys=zotero_keys,
+                cypher_keys=cypher_keys,
+                stream=stream,
+            )
+            if verbose:
+                print(f"Updating graph DB snapshot: {db_snapshot_path}")
+        if (
+            incremental
+            and self.graphdb is not None
+            and self.graphdb.provenance is not None
+        ):
+            changes = self.graphdb.update(
+                zotero_source, workers=workers, export_type=export_type
+            )
+            if verbose:
+                for change, article_keys in changes.items():
+                    print(f"{len(article_keys)} articles {change}")
+        else:
+            self.graphdb = GraphDB(
+                zotero_source,
+                export_type=export_type,
+                zotero_keys=zotero_keys,
+                cypher_keys=cypher_keys,
+                workers=workers,
+                stream=stream,
+            )
+
+    def load_zotero_library(
+        self,
+        zotero_library_id,
+        zotero_library_type,
+        zotero_api_key=None,
+        base_url=zotero_api_url,
+        archive_csv=False,
+        zotero_keys=None,
+        cypher_keys=None,
+        verbose=False,
+        workers=1,
+        incremental=False,
+    ):
+        # build the graph DB straight from the items fetched from the Zotero API,
+        # optionally archiving them as a CSV export as well
+        if verbose:
+            print("Loading Zotero library into graph DB ...")
+        zotero_db = zotero_library_records(
+            zotero_library_id,
+            zotero_library_type,
+            zotero_api_key,
+            base_url=base_url,
+            verbose=verbose,
+        )
+        self.current_zotero_csv = None
+        self.current_timestamp = generate_timestamp()
+        if archive_csv:
+            self.current_zotero_csv = (
+                self.zotero_csv_exports_folder
+                / f"{self.current_timestamp}_zotero_data.csv"
+            )
+            write_zotero_csv(zotero_db, self.current_zotero_csv)
+            if verbose:
+                print(f"{self.current_zotero_csv} added to Zotero exports folder")
+        self.load_graphdb(
+            zotero_db,
+            scribl.ZOTERO_RECORDS,
+            zotero_keys=zotero_keys,
+            cypher_keys=cypher_keys,
+            verbose=verbose,
+            workers=workers,
+            incremental=incremental,
+        )
+        return self.report_load(f"Zotero {zotero_db.library} library", verbose=verbose)
+
+    def sync_zotero_library(
+        self,
+        zotero_library_id,
+        zotero_library_type,
+        zotero_api_key=None,
+        base_url=zotero_api_url,
+        verbose=False,
+        workers=4,
+    ):
+        # bring the local item cache up to date, fetching only the items changed
+        # (or deleted) since the library version of the last sync, with pages
+        # fetched by `workers` threads
+        api = ZoteroAPI(
+            zotero_library_id,
+            zotero_library_type,
+            zotero_api_key,
+            base_url=base_url,
+            workers=workers,
+        )
+        cache = ZoteroItemCache(self.zotero_cache_folder, stream=True)
+        return cache.sync(api, verbose=verbose)
+
+    def load_zotero_cache(
+        self,
+        zotero_keys=None,
+        cypher_keys=None,
+        verbose=False,
+        workers=1,
+        incremental=False,
+        stream=False,
+    ):
+        if verbose:
+            print("Loading synced Zotero items into graph DB ...")
+        if not Path.exists(self.zotero_cache_folder / ZoteroItemCache.cache_filename):
+            print("Cancelled! No synced Zotero library")
+            return None
+        self.current_zotero_csv = None
+        self.current_timestamp = generate_timestamp()
+        self.load_graphdb(
+            self.zotero_cache_folder,
+            scribl.ZOTERO_API_CACHE,
+            zotero_keys=zotero_keys,
+            cypher_keys=cypher_keys,
+            verbose=verbose,
+            workers=workers,
+            incremental=incremental,
+            stream=stream,
         )
+        return self.report_load("synced Zotero items", verbose=verbose)
 
+    def report_load(self, source_name, verbose=False):
         # save summary
         summary = self.graphdb.db["warnings"], self.graphdb.db["errors"]
 
         if verbose:
-            print(f"{self.current_zotero_csv.name} loaded into graph DB")
+            print(f"{source_name} loaded into graph DB")
             nwarning = 0
             nerror = 0
             for article_key_pair in summary[0]:
@@ -270,6 +550,9 @@ class GraphDBInstance:
         return (summary[0], summary[1])
 
     def get_current_timestamp(self):
+        # graph DBs loaded from synced items are stamped with the load time
+        if self.current_zotero_csv is None and self.current_timestamp is not None:
+            return self.current_timestamp
         # Extract the filename from the path
         filename = self.current_zotero_csv.name
         # Remove the '_zotero_data.csv' suffix to get the timestamp
@@ -315,9 +598,28 @@ class GraphDBInstance:
 
         return db_snapshot
 
-    def export_cypher_text(self, diff=None, verbose=False, filepath=None):
-        cypher = self.graphdb.generate_cypher(diff_db=diff)
-        cypher_text = self.graphdb.export_cypher_text(cypher)
+    def export_cypher_text(
+        self,
+        diff=None,
+        verbose=False,
+        filepath=None,
+        changes=None,
+        batch_size=None,
+        constraints=False,
+        transaction_rows=None,
+        subgraph=None,
+    ):
+        # the Cypher text (also saved to filepath, if given) of the graph DB,
+        # or of a subgraph (from GraphDB.subgraph), write_cypher_file streams
+        # it to a file instead
+        graphdb = self.cypher_graphdb(diff=diff, changes=changes, subgraph=subgraph)
+        cypher = graphdb.iter_cypher(
+            diff_db=diff,
+            changes=changes,
+            batch_size=batch_size,
+            transaction_rows=transaction_rows,
+        )
+        cypher_text = graphdb.export_cypher_text(cypher, constraints=constraints)
 
         if filepath:
             with open(filepath, "w") as cypher_file:
@@ -328,6 +630,63 @@ class GraphDBInstance:
 
         return cypher_text
 
+    def write_cypher_file(
+        self,
+        filepath,
+        diff=None,
+        verbose=False,
+        changes=None,
+        batch_size=None,
+        constraints=False,
+        transaction_rows=None,
+        subgraph=None,
+    ):
+        # export_cypher_text streamed to filepath one statement at a time, so
+        # the whole text is never held in memory, returns the file path
+        graphdb = self.cypher_graphdb(diff=diff, changes=changes, subgraph=subgraph)
+        cypher = graphdb.iter_cypher(
+            diff_db=diff,
+            changes=changes,
+            batch_size=batch_size,
+            transaction_rows=transaction_rows,
+        )
+        with open(filepath, "w") as cypher_file:
+            graphdb.write_cypher_text(cypher_file, cypher, constraints=constraints)
+
+        if verbose:
+            print(f"Cypher text exported to file: {filepath}")
+
+        return filepath
+
+    def cypher_graphdb(self, diff=None, changes=None, subgraph=None):
+        # the graph DB the Cypher is exported from
+        if subgraph is None:
+            return self.graphdb
+        if diff is not None or changes is not None:
+            error_message = "A Cypher diff can't be restricted to a subgraph"
+            raise ValueError(error_message)
+        return subgraph
+
+    def export_bulk_import(
+        self, dirpath, verbose=False, array_delimiter="|", database="neo4j"
+    ):
+        # node and relationship CSVs for an initial neo4j-admin import of the
+        # graph DB, with the import command saved alongside them as import.sh
+        dirpath = Path(dirpath)
+        dirpath.mkdir(parents=True, exist_ok=True)
+        command = self.graphdb.export_bulk_import(
+            dirpath, array_delimiter=array_delimiter, database=database
+        )
+        with open(dirpath / "import.sh", "w") as script_file:
+            script_file.write('#!/bin/sh\ncd "$(dirname "$0")"\n')
+            script_file.write(f"{command}\n")
+
+        if verbose:
+            print(f"Bulk import files written to: {dirpath}")
+            print(command)
+
+        return command
+
     def backup_db(self, verbose=False):
         if verbose:
             print("Backing up graph DB ...")
@@ -354,6 +713,27 @@ class GraphDBInstance:
 
         return db_diff
 
+    def generate_db_changes(self, db_snapshot_filename=None, verbose=False):
+        # added, removed and changed entities and relations since a snapshot
+        # (by default the latest), export_cypher_text(changes=...) turns them
+        # into the Cypher that brings a graph loaded from that snapshot up to date
+        if db_snapshot_filename is None:
+            snapshots = self.get_db_snapshots()
+            db_snapshot_filename = self.db_snapshots_folder / snapshots[-1]
+        other_db = GraphDB(db_snapshot_filename, export_type=scribl.DB_EXPORT)
+        db_changes = self.graphdb.generate_db_changes(other_db)
+
+        if verbose:
+            for change in ["added", "removed", "changed"]:
+                counts = {
+                    item_type: len(items)
+                    for item_type, items in db_changes[change].items()
+                    if item_type != "relationships"
+                }
+                print(f"{change}: {counts}")
+
+        return db_changes
+
     def inspect_db(self, list_contents=None, verbose=False, contents_length=5):
         list_contents = list_contents or []
         result = {}
@@ -425,9 +805,11 @@ class GraphDBInstance:
 
         return label_check
 
-    def export_graphml_text(self, verbose=False, filepath=None):
-        graphml = self.graphdb.generate_graphml()
-        graphml_text = self.graphdb.export_graphml_text(graphml)
+    def export_graphml_text(self, verbose=False, filepath=None, subgraph=None):
+        # the GraphML text (also saved to filepath, if given) of the graph DB,
+        # or of the subgraph, write_graphml_file streams it to a file instead
+        graphdb = self.graphdb if subgraph is None else subgraph
+        graphml_text = graphdb.export_graphml_text(graphdb.iter_graphml())
 
         if filepath:
             with open(filepath, "w") as graphml_file:
@@ -438,79 +820,138 @@ class GraphDBInstance:
 
         return graphml_text
 
-    def export_graphml_figure(self, verbose=False, filepath=None):
-        # read GraphML into NetworkX for visualization
-        graphml_text = self.export_graphml_text(verbose=verbose)
-
-        G = nx.parse_graphml(graphml_text, force_multigraph=True)
-
-        # get info needed for labels and node colours
-        new_node_labels = {}
-        article_nodes = []
-        category_nodes = []
-        resource_nodes = []
-        agent_nodes = []
-        other_nodes = []
-        for node in G.nodes.items():
-            key, d = node
-            wrapped_label = "\n".join(key.split(" "))
-            if d["desc"] == "ARTICLE":
-                # convert labels to be Author-Date, i.e. "Einstein (1912)"
-                new_node_labels[key] = (
-                    d["author"].split(";")[0].split(",")[0]
-                    + "\n("
-                    + str(dateparser.parse(d["year"]).year)
-                    + ")"
-                )
-                article_nodes.append(key)
-            elif d["desc"] == "CATEGORY":
-                # wrap lines at spaces
-                new_node_labels[key] = wrapped_label
-                category_nodes.append(key)
-            elif d["desc"] == "RESOURCE":
-                new_node_labels[key] = wrapped_label
-                resource_nodes.append(key)
-            elif d["desc"] == "AGENT":
-                new_node_labels[key] = wrapped_label
-                agent_nodes.append(key)
-            else:
-                new_node_labels[key] = wrapped_label
-                other_nodes.append(key)
+    def write_graphml_file(self, filepath, verbose=False, subgraph=None):
+        # export_graphml_text streamed to filepath one XML fragment at a time,
+        # returns the file path
+        graphdb = self.graphdb if subgraph is None else subgraph
+        with open(filepath, "w") as graphml_file:
+            graphdb.write_graphml_text(graphml_file, graphdb.iter_graphml())
 
-        # generate and save figure as a matplotlib figure
-        pos = nx.spring_layout(G, seed=3113794652)
+        if verbose:
+            print(f"GraphML exported to file: {filepath}")
 
-        node_size = 2000
-        font_size = 8
+        return filepath
 
-        # do nodes first, categories in olive and articles in red
-        nx.draw_networkx_nodes(
-            G, pos, nodelist=category_nodes, node_color="tab:olive", node_size=node_size
-        )
-        nx.draw_networkx_nodes(
-            G, pos, nodelist=article_nodes, node_color="tab:red", node_size=node_size
-        )
-        nx.draw_networkx_nodes(
-            G, pos, nodelist=resource_nodes, node_color="tab:green", node_size=node_size
-        )
-        nx.draw_networkx_nodes(
-            G, pos, nodelist=agent_nodes, node_color="tab:blue", node_size=node_size
+    def figure_layout(self, G, layout="spring", cache_layout=True, verbose=False):
+        # node positions for a figure of G, with the spring layout nodes placed
+        # in the last figure (saved in the graph DB folder) keep their positions
+        # and only new nodes are laid out around them, spectral layouts can't
+        # start from given positions so they are always computed afresh
+        import networkx as nx  # noqa: PLC0415
+
+        if layout not in figure_layouts:
+            error_message = (
+                f"Unknown figure layout '{layout}', expected one of {figure_layouts}"
+            )
+            raise ValueError(error_message)
+        layout_filepath = self.figure_layout_folder / "figure_layouts.dat"
+        cache_layout = cache_layout and layout == "spring"
+        layouts = {}
+        if cache_layout and Path.exists(layout_filepath):
+            with open(layout_filepath, "rb") as layout_file:
+                layouts = pickle.load(layout_file)
+        cached = layouts.get(layout, {})
+        known = [node for node in G if node in cached]
+        if len(known) == len(G):
+            pos = {node: cached[node] for node in G}
+        elif layout == "spring" and len(known) > 0:
+            pos = nx.spring_layout(
+                G,
+                pos={node: cached[node] for node in known},
+                fixed=known,
+                seed=figure_layout_seed,
+            )
+        elif layout == "spring":
+            pos = nx.spring_layout(G, seed=figure_layout_seed)
+        else:
+            pos = nx.spectral_layout(G)
+        pos = {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+        if verbose:
+            print(
+                f"{layout} layout: {len(known)} cached, {len(G) - len(known)} new nodes"
+            )
+
+        if cache_layout:
+            # positions are merged so a subgraph figure doesn't drop the other
+            # nodes, nodes no longer in the graph DB are dropped so the cache
+            # doesn't grow with every node ever drawn
+            cached.update(pos)
+            if self.graphdb is not None:
+                cached = {
+                    node: xy
+                    for node, xy in cached.items()
+                    if node in pos or node[1] in self.graphdb.db[node[0].lower()]
+                }
+            layouts[layout] = cached
+            Path.mkdir(self.figure_layout_folder, exist_ok=True)
+            with open(layout_filepath, "wb") as layout_file:
+                pickle.dump(layouts, layout_file)
+        return pos
+
+    def export_graphml_figure(
+        self,
+        verbose=False,
+        filepath=None,
+        layout="spring",
+        cache_layout=True,
+        edge_label_limit=500,
+        subgraph=None,
+    ):
+        # NetworkX graph for visualization, of the subgraph if given
+        graphdb = self.graphdb if subgraph is None else subgraph
+        G = graphdb.to_networkx()
+        pos = self.figure_layout(
+            G, layout=layout, cache_layout=cache_layout, verbose=verbose
         )
-        nx.draw_networkx_nodes(
-            G, pos, nodelist=other_nodes, node_color="tab:purple", node_size=node_size
+        draw_graph_figure(
+            G, pos, filepath, edge_label_limit=edge_label_limit, verbose=verbose
         )
-        nx.draw_networkx_labels(G, pos, labels=new_node_labels, font_size=font_size)
 
-        # now edges
-        nx.draw_networkx_edges(G, pos, node_size=node_size, alpha=0.3, width=0.7)
-        # can't use `get_edge_attributes()` for multiedge graphs
-        # https://stackoverflow.com/questions/75810397/how-to-draw-edge-labels-when-there-are-multi-edges-in-networkx
-        edge_labels = {(n1, n2): d["label"] for n1, n2, d in G.edges(data=True)}
+        if verbose:
+            print(f"Graph DB figure saved to file: {filepath}")
 
-        nx.draw_networkx_edge_labels(
-            G, pos, edge_labels=edge_labels, font_size=font_size
+    def export_graphml_figures(
+        self,
+        figures,
+        verbose=False,
+        workers=1,
+        layout="spring",
+        cache_layout=True,
+        edge_label_limit=500,
+    ):
+        # one figure per item of figures, a dict of filepath -> GraphDB.subgraph
+        # options (empty for the whole graph), all drawn with the positions of
+        # one layout of the whole graph so nodes stay in place across figures,
+        # with workers > 1 the figures are drawn in worker processes, each
+        # loading the graph DB once from a shared snapshot
+        pos = self.figure_layout(
+            self.graphdb.to_networkx(),
+            layout=layout,
+            cache_layout=cache_layout,
+            verbose=verbose,
         )
+        jobs = [
+            (filepath, options, edge_label_limit)
+            for filepath, options in figures.items()
+        ]
+        if workers > 1:
+            # process pools are only needed (and imported) for parallel figures
+            from concurrent.futures import ProcessPoolExecutor  # noqa: PLC0415
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                snapshot_filepath = Path(tmpdir) / "figure_snapshot.dat"
+                self.graphdb.save_db(snapshot_filepath)
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_figure_worker,
+                    initargs=(snapshot_filepath, pos),
+                ) as executor:
+                    filepaths = list(executor.map(_draw_figure_job, jobs))
+        else:
+            _init_figure_worker(self.graphdb, pos)
+            filepaths = [_draw_figure_job(job) for job in jobs]
+
+        if verbose:
+            print(f"{len(filepaths)} Graph DB figures saved")
 
-        plt.tight_layout()
-        plt.axis("off")
-        plt.savefig(filepath)
+        return filepaths
@@ -2,11 +2,15 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+import re
+from collections import OrderedDict
+
 from pyparsing import (
     Combine,
     Group,
     Literal,
     OneOrMore,
+    ParseException,
     Word,
     ZeroOrMore,
     alphanums,
@@ -17,6 +21,78 @@ from pyparsing import (
 
 import scribl
 
+parse_engines = ["fast", "pyparsing"]
+default_cache_size = 65536
+
+# precompiled patterns for the single-pass tokenizer used by the "fast" engine,
+# these mirror the pyparsing grammar in ScriblParser but only accept input that
+# is unambiguous, anything else is handed back to pyparsing
+_fast_whitespace = re.compile(r"[ \t\n\r]*")
+_fast_charset = re.compile(r"[ \t\n\r!-~]*")
+_fast_boundary = r"(?=[ \t\n\r]|$)"
+_fast_header = re.compile(
+    "(" + "|".join(re.escape(item) for item in scribl.statements) + ")" + _fast_boundary
+)
+_fast_label = re.compile(
+    "(" + "|".join(re.escape(item) for item in scribl.agents) + ")" + _fast_boundary
+)
+_fast_field = re.compile(
+    "("
+    + "|".join(re.escape(item) for item in scribl.fields.values())
+    + ")"
+    + _fast_boundary
+)
+_fast_relationship = re.compile(
+    "[" + "".join(re.escape(item) for item in scribl.relationships) + "]"
+)
+_fast_name_word = re.compile(r"[A-Za-z0-9][^ \t\n\r:,]*")
+_fast_url = re.compile(r"https?://[!-~]+")
+_cache_whitespace = re.compile(r"[ \t\n\r]+")
+
+
+class StatementCache:
+    # bounded LRU cache mapping a normalized statement string to its parsed
+    # (immutable) result, meant to be shared by every parse in a GraphDB build
+    def __init__(self, maxsize=default_cache_size):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.statements = OrderedDict()
+
+    @staticmethod
+    def normalize(line):
+        # runs of whitespace never change how a statement parses
+        return _cache_whitespace.sub(" ", line.strip())
+
+    def lookup(self, key):
+        # returns (found, result), result is None for unparsable statements
+        try:
+            result = self.statements[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+        self.statements.move_to_end(key)
+        self.hits += 1
+        return True, result
+
+    def store(self, key, result):
+        self.statements[key] = result
+        if len(self.statements) > self.maxsize:
+            self.statements.popitem(last=False)
+
+    def clear(self):
+        self.statements.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.statements),
+            "maxsize": self.maxsize,
+        }
+
 
 class ScriblParser:
     header = one_of(scribl.statements).set_results_name("header")
@@ -51,7 +127,15 @@ class ScriblParser:
     statement = header + name.set_results_name("name") + ZeroOrMore(optional_items)
 
     # initiate parser (optionally with scribl_code text block)
-    def __init__(self, scribl_text=None):
+    def __init__(self, scribl_text=None, engine="fast", cache=None):
+        if engine not in parse_engines:
+            error_message = (
+                f"Unknown parse engine '{engine}', expected one of {parse_engines}"
+            )
+            raise ValueError(error_message)
+        self.engine = engine
+        # optional StatementCache, left in place by reset() so it can be shared
+        self.cache = cache
         self.reset()
         if scribl_text is not None:
             self.parse(scribl_text)
@@ -75,40 +159,21 @@ class ScriblParser:
                 warning = f"Line: {nline:d} Statement length exceeds max. for Zotero syncing: {line}"
                 self.data["warnings"].append(warning)
             try:
-                parse_data = ScriblParser.statement.parse_string(line)
+                (
+                    item_type,
+                    item_name,
+                    item_urls,
+                    item_labels,
+                    item_tags,
+                    item_synonyms,
+                    item_notes,
+                    item_relationships,
+                ) = self.parse_statement(line)
             except Exception:
                 error = f"Line: {nline:d} Unable to parse statement [{line}]"
                 self.data["errors"].append(error)
                 continue
 
-            item_type = parse_data.header
-            item_name = " ".join(parse_data.name)
-            # parse urls
-            item_urls = parse_data.url
-            # parse labels
-            item_labels = parse_data.labels
-            # parse tags
-            item_tags = []
-            for field in parse_data.tags:
-                for item in field:
-                    item_tags.append(" ".join(item))
-            # parse synonyms
-            item_synonyms = []
-            for field in parse_data.synonyms:
-                for item in field:
-                    item_synonyms.append(" ".join(item))
-            # parse notes
-            item_notes = []
-            for note_field in parse_data.notes:
-                note = " ".join(note_field)
-                item_notes.append(note)
-            # parse relationships
-            item_relationships = []
-            for field in parse_data.relationships:
-                rtype = field[0]
-                partner = " ".join(field[1])
-                relation = (rtype, partner)
-                item_relationships.append(relation)
             if item_name not in self.data[item_type]:
                 self.data[item_type][item_name] = {}
                 for field in [
@@ -153,6 +218,141 @@ class ScriblParser:
                     self.data[item_type][item_name]["relationships"].append(relation)
         self.validate_relationships()
 
+    def parse_statement(self, line):
+        # returns (type, name, urls, labels, tags, synonyms, notes, relationships)
+        # for a single statement, raising an exception if it can't be parsed
+        if self.cache is None:
+            return self.parse_statement_uncached(line)
+        key = StatementCache.normalize(line)
+        found, statement = self.cache.lookup(key)
+        if not found:
+            try:
+                statement = self.parse_statement_uncached(key)
+            except (ParseException, ValueError):
+                statement = None
+            self.cache.store(key, statement)
+        if statement is None:
+            error_message = f"Unable to parse statement [{line}]"
+            raise ValueError(error_message)
+        return statement
+
+    def parse_statement_uncached(self, line):
+        if self.engine == "fast":
+            statement = self.parse_statement_fast(line)
+            if statement is not None:
+                return statement
+        return self.parse_statement_pyparsing(line)
+
+    def parse_statement_pyparsing(self, line):
+        parse_data = ScriblParser.statement.parse_string(line)
+        item_type = parse_data.header
+        item_name = " ".join(parse_data.name)
+        # parse urls
+        item_urls = parse_data.url
+        # parse labels
+        item_labels = parse_data.labels
+        # parse tags
+        item_tags = []
+        for field in parse_data.tags:
+            for item in field:
+                item_tags.append(" ".join(item))
+        # parse synonyms
+        item_synonyms = []
+        for field in parse_data.synonyms:
+            for item in field:
+                item_synonyms.append(" ".join(item))
+        # parse notes
+        item_notes = []
+        for note_field in parse_data.notes:
+            note = " ".join(note_field)
+            item_notes.append(note)
+        # parse relationships
+        item_relationships = []
+        for field in parse_data.relationships:
+            rtype = field[0]
+            partner = " ".join(field[1])
+            relation = (rtype, partner)
+            item_relationships.append(relation)
+        return (
+            item_type,
+            item_name,
+            tuple(item_urls),
+            tuple(item_labels),
+            tuple(item_tags),
+            tuple(item_synonyms),
+            tuple(item_notes),
+            tuple(item_relationships),
+        )
+
+    def parse_statement_fast(self, line):
+        # single pass tokenizer for the statement grammar, returns None for any
+        # input it does not fully consume so that pyparsing can handle it instead
+        if _fast_charset.fullmatch(line) is None:
+            return None
+        match = _fast_header.match(line)
+        if match is None:
+            return None
+        item_type = match.group(1)
+        words, pos = _fast_scan_name(line, match.end())
+        if words is None:
+            return None
+        item_name = " ".join(words)
+        item_urls = []
+        item_labels = []
+        item_tags = []
+        item_synonyms = []
+        item_notes = []
+        item_relationships = []
+        pos = _fast_whitespace.match(line, pos).end()
+        while pos < len(line):
+            match = _fast_label.match(line, pos)
+            if match is not None:
+                item_labels.append(match.group(1))
+                pos = match.end()
+            elif _fast_relationship.match(line, pos) is not None:
+                rtype = line[pos]
+                words, pos = _fast_scan_name(line, pos + 1)
+                if words is None:
+                    return None
+                item_relationships.append((rtype, " ".join(words)))
+            else:
+                match = _fast_field.match(line, pos)
+                if match is None:
+                    return None
+                field = match.group(1)
+                pos = match.end()
+                if field == scribl.fields["url"]:
+                    pos = _fast_whitespace.match(line, pos).end()
+                    match = _fast_url.match(line, pos)
+                    if match is None:
+                        return None
+                    item_urls.append(match.group())
+                    pos = match.end()
+                elif field == scribl.fields["txt"]:
+                    words, pos = _fast_scan_name(line, pos)
+                    if words is None:
+                        return None
+                    item_notes.append(" ".join(words))
+                else:
+                    names, pos = _fast_scan_name_list(line, pos)
+                    if names is None:
+                        return None
+                    if field == scribl.fields["tag"]:
+                        item_tags.extend(names)
+                    else:
+                        item_synonyms.extend(names)
+            pos = _fast_whitespace.match(line, pos).end()
+        return (
+            item_type,
+            item_name,
+            tuple(item_urls),
+            tuple(item_labels),
+            tuple(item_tags),
+            tuple(item_synonyms),
+            tuple(item_notes),
+            tuple(item_relationships),
+        )
+
     def validate_relationships(self):
         exclude_types = ["errors", "warnings"]
         for item_type in self.data:
@@ -187,3 +387,33 @@ class ScriblParser:
         for item_type in self.data:
             result[item_type] = len(self.data[item_type])
         return result
+
+
+def _fast_scan_name(line, pos):
+    # one or more whitespace separated name words, returns (words, end position)
+    # or (None, pos) if no name starts here
+    words = []
+    while True:
+        start = _fast_whitespace.match(line, pos).end()
+        match = _fast_name_word.match(line, start)
+        if match is None:
+            break
+        words.append(match.group())
+        pos = match.end()
+    if len(words) == 0:
+        return None, pos
+    return words, pos
+
+
+def _fast_scan_name_list(line, pos):
+    # comma delimited list of names, returns (names, end position) or (None, pos)
+    names = []
+    while True:
+        words, pos = _fast_scan_name(line, pos)
+        if words is None:
+            return None, pos
+        names.append(" ".join(words))
+        start = _fast_whitespace.match(line, pos).end()
+        if line[start : start + 1] != ",":
+            return names, pos
+        pos = start + 1
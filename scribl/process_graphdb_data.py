@@ -3,12 +3,357 @@ from __future__ import annotations
 __author__ = "Amber Biology"
 
 import copy
+import csv
+import hashlib
+import itertools
+import json
 import pickle
+import re
+import sys
+from pathlib import Path
 from xml.sax.saxutils import escape
 
 import scribl
-from scribl.parse_scribl import ScriblParser
-from scribl.process_zotero import ZoteroCSV
+from scribl.parse_scribl import ScriblParser, StatementCache, default_cache_size
+from scribl.process_zotero import ZoteroCSV, ZoteroItemCache, ZoteroSQLite
+
+entity_fields = {
+    "category": ["urls", "tags", "notes"],
+    "resource": ["urls", "tags", "notes"],
+    "process": ["urls", "tags", "notes"],
+    "agent": ["urls", "tags", "notes", "labels", "synonyms"],
+}
+
+
+class OrderedSet:
+    # insertion ordered set used for entity fields and relationships, it keeps
+    # the list behaviour GraphDB relies on (ordering, indexing, append) but with
+    # O(1) inserts and membership checks
+    __slots__ = ("items",)
+
+    def __init__(self, iterable=()):
+        self.items = dict.fromkeys(iterable)
+
+    def add(self, item):
+        self.items[item] = None
+
+    append = add
+
+    def extend(self, iterable):
+        for item in iterable:
+            self.items[item] = None
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+    def remove(self, item):
+        try:
+            del self.items[item]
+        except KeyError:
+            error_message = f"{item!r} not in OrderedSet"
+            raise ValueError(error_message) from None
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        return reversed(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if index == 0 and len(self.items) > 0:
+            return next(iter(self.items))
+        return list(self.items)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, OrderedSet):
+            return list(self.items) == list(other.items)
+        if isinstance(other, list):
+            return list(self.items) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __copy__(self):
+        return OrderedSet(self.items)
+
+    def __reduce__(self):
+        return (OrderedSet, (list(self.items),))
+
+    def __repr__(self):
+        return f"OrderedSet({list(self.items)!r})"
+
+
+def new_entity(item_type, item_name):
+    entity = {field: OrderedSet() for field in entity_fields[item_type]}
+    if item_type == "agent":
+        # an agent is always its own first synonym
+        entity["synonyms"].add(item_name)
+    return entity
+
+
+def convert_db_fields(db, container):
+    # copy of db with entity fields and relationships held in `container`
+    # (list for snapshots, OrderedSet in memory), everything else is shared
+    converted = dict(db)
+    for item_type, fields in entity_fields.items():
+        converted[item_type] = {
+            item: {
+                field: container(values) if field in fields else values
+                for field, values in db[item_type][item].items()
+            }
+            for item in db[item_type]
+        }
+    converted["relationships"] = {
+        rtype: container(relations) for rtype, relations in db["relationships"].items()
+    }
+    return converted
+
+
+class ProvenanceIndex:
+    # maps every entity (item_type, name), field value
+    # (item_type, name, field, value) and relationship (rtype, relation) to the
+    # articles supporting it, articles are stored as int ids and a key with a
+    # single supporting article (the common case) holds a bare int, not a set
+    kinds = ("entity", "field", "relationship")
+
+    def __init__(self):
+        self.articles = []
+        self.article_ids = {}
+        self.supporters = {kind: {} for kind in self.kinds}
+        # article id -> keys it contributed, by kind, for O(1) retraction
+        self.contributions = {}
+        # article key -> content hash of the Zotero record it was built from
+        self.hashes = {}
+
+    def article_id(self, article_key):
+        try:
+            return self.article_ids[article_key]
+        except KeyError:
+            article_id = len(self.articles)
+            self.articles.append(article_key)
+            self.article_ids[article_key] = article_id
+            return article_id
+
+    def add(self, kind, key, article_key):
+        article_id = self.article_id(article_key)
+        supporters = self.supporters[kind]
+        current = supporters.get(key)
+        if current is None:
+            supporters[key] = article_id
+        elif isinstance(current, int):
+            if current == article_id:
+                return
+            supporters[key] = {current, article_id}
+        elif article_id in current:
+            return
+        else:
+            current.add(article_id)
+        contributions = self.contributions.setdefault(article_id, ([], [], []))
+        contributions[self.kinds.index(kind)].append(key)
+
+    def articles_for(self, kind, key):
+        # article keys supporting an entity, field value or relationship
+        current = self.supporters[kind].get(key)
+        if current is None:
+            return []
+        if isinstance(current, int):
+            return [self.articles[current]]
+        return [self.articles[article_id] for article_id in sorted(current)]
+
+    def count(self, kind, key):
+        current = self.supporters[kind].get(key)
+        if current is None:
+            return 0
+        if isinstance(current, int):
+            return 1
+        return len(current)
+
+    def __contains__(self, kind_key):
+        kind, key = kind_key
+        return key in self.supporters[kind]
+
+    def retract(self, article_key):
+        # drop an article's support, returning the keys nothing supports any more
+        unsupported = {kind: [] for kind in self.kinds}
+        self.hashes.pop(article_key, None)
+        article_id = self.article_ids.get(article_key)
+        if article_id not in self.contributions:
+            return unsupported
+        for kind, keys in zip(self.kinds, self.contributions.pop(article_id)):
+            supporters = self.supporters[kind]
+            for key in keys:
+                current = supporters[key]
+                if isinstance(current, int):
+                    del supporters[key]
+                    unsupported[kind].append(key)
+                    continue
+                current.discard(article_id)
+                if len(current) == 1:
+                    supporters[key] = current.pop()
+        return unsupported
+
+    def to_state(self):
+        # plain containers for persisting alongside a snapshot, contributions
+        # are rebuilt from the supporters on load
+        return {
+            "articles": self.articles,
+            "supporters": self.supporters,
+            "hashes": self.hashes,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        provenance = cls()
+        provenance.articles = state["articles"]
+        provenance.article_ids = {
+            article_key: article_id
+            for article_id, article_key in enumerate(provenance.articles)
+        }
+        provenance.supporters = state["supporters"]
+        provenance.hashes = state["hashes"]
+        for kind_index, kind in enumerate(cls.kinds):
+            for key, current in provenance.supporters[kind].items():
+                article_ids = [current] if isinstance(current, int) else current
+                for article_id in article_ids:
+                    contributions = provenance.contributions.setdefault(
+                        article_id, ([], [], [])
+                    )
+                    contributions[kind_index].append(key)
+        return provenance
+
+
+def article_hash(record, keymap, scribl_field):
+    # content hash of the mapped fields and scribl tags of a Zotero record
+    content = [record[zotero_key] for zotero_key in keymap.values()]
+    content.append(record[scribl_field])
+    return hashlib.blake2b(
+        "\x1f".join(content).encode("utf-8"), digest_size=16
+    ).digest()
+
+
+def entity_fingerprint(entity):
+    # order independent hash of an entity's content, article fields are single
+    # strings, the fields of other entities are collections of values
+    return hash(
+        frozenset(
+            (field, values if isinstance(values, str) else frozenset(values))
+            for field, values in entity.items()
+        )
+    )
+
+
+def diff_entity(entity, other_entity):
+    # fields of entity with the values other_entity lacks, or None if there are
+    # none, article fields hold only the changed strings, other entity fields
+    # keep every field with a (possibly empty) list of new values
+    diff_found = False
+    current_item = {}
+    for field, values in entity.items():
+        other_values = other_entity.get(field, ())
+        if isinstance(values, str):
+            if values != other_values:
+                diff_found = True
+                current_item[field] = values
+            continue
+        other_values = set(other_values)
+        current_item[field] = [value for value in values if value not in other_values]
+        if len(current_item[field]) > 0:
+            diff_found = True
+    return current_item if diff_found else None
+
+
+def change_additions(changes):
+    # the added side of generate_db_changes in generate_db_diff form, changed
+    # entities become edit entries holding their new values
+    diff_db = {}
+    for item_type, items in changes["added"].items():
+        diff_db[item_type] = dict(items)
+        if item_type == "relationships":
+            continue
+        for item, fields in changes["changed"][item_type].items():
+            if len(fields["added"]) > 0:
+                edit_item = f"{scribl.edit_diff_item_prefix}{item}"
+                diff_db[item_type][edit_item] = fields["added"]
+    return diff_db
+
+
+def cypher_literal(value):
+    # Cypher literal of a string, list or map (with field names as keys), JSON
+    # string escapes are valid in Cypher strings
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, dict):
+        entries = [f"{key}:{cypher_literal(item)}" for key, item in value.items()]
+        return "{" + ", ".join(entries) + "}"
+    return "[" + ", ".join(cypher_literal(item) for item in value) + "]"
+
+
+def unwind_cypher(batch, body, transaction_rows=None):
+    # statement running the body lines once for each row of batch, with
+    # transaction_rows in a subquery committed every transaction_rows rows
+    # (which has to run in an implicit, auto-commit, transaction)
+    cypher_list = [f"""UNWIND {cypher_literal(batch)} AS row"""]
+    if transaction_rows is None:
+        cypher_list.extend(body)
+    else:
+        cypher_list.append("CALL {")
+        cypher_list.append("  WITH row")
+        cypher_list.extend(f"  {line}" for line in body)
+        cypher_list.append(f"}} IN TRANSACTIONS OF {transaction_rows} ROWS")
+    return "\n".join(cypher_list) + ";"
+
+
+def write_lines(file, lines, chunk_size=1000):
+    # writes lines to an open text file exactly as "\n".join(lines) would,
+    # chunk_size lines at a time, so the whole text is never held in memory
+    separator = ""
+    for chunk in batches(lines, chunk_size):
+        file.write(separator + "\n".join(chunk))
+        separator = "\n"
+
+
+def batches(items, batch_size):
+    # consecutive lists of at most batch_size items
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def infer_modifies_binds(graphdb):
+    # modifies implies binds so add binds relationship to all modifies relationships
+    for relation in graphdb.db["relationships"]["MODIFIES"]:
+        graphdb.add_relation("BINDS", relation)
+
+
+default_inference_rules = [infer_modifies_binds]
+
+
+# per-process parser used by the workers of a parallel GraphDB build
+_worker_parser = None
+
+
+def _init_parse_worker(parse_cache_size):
+    global _worker_parser  # noqa: PLW0603
+    cache = StatementCache(maxsize=parse_cache_size) if parse_cache_size else None
+    _worker_parser = ScriblParser(cache=cache)
+
+
+def _parse_article_chunk(scribl_texts):
+    parsed = []
+    for scribl_text in scribl_texts:
+        _worker_parser.reset()
+        _worker_parser.parse(scribl_text, split_text=scribl.tag_delimiter)
+        parsed.append(_worker_parser.data)
+    return parsed
 
 
 class GraphDB:
@@ -19,116 +364,308 @@ class GraphDB:
         scribl_field=scribl.zotero_scribl_field,
         zotero_keys=None,
         cypher_keys=None,
+        parse_cache_size=default_cache_size,
+        workers=1,
+        inference_rules=None,
+        stream=False,
     ):
         if zotero_keys is None:
             zotero_keys = scribl.default_keymap["zotero_keys"]
         if cypher_keys is None:
             cypher_keys = scribl.default_keymap["cypher_keys"]
+        if inference_rules is None:
+            inference_rules = default_inference_rules
+        self.inference_rules = list(inference_rules)
+        self.scribl_field = scribl_field
+        self.zotero_keys = zotero_keys
+        self.cypher_keys = cypher_keys
+        self.stream = stream
+        # process scribl_code tags in exported articles, sharing one statement
+        # cache across all articles since most tags repeat (0 disables it)
+        self.parse_cache = None
+        if parse_cache_size:
+            self.parse_cache = StatementCache(maxsize=parse_cache_size)
+        self.parse_cache_size = parse_cache_size
+        # year -> article keys, built on first use by articles_in_years
+        self.article_years = None
         if export_type == scribl.DB_EXPORT:
-            self.db = self.load_db(db_data_filepath)
+            self.db, self.provenance = self.read_snapshot(db_data_filepath)
+            self.build_adjacency()
             return
         self.db = {}
+        self.adjacency = {}
+        self.provenance = ProvenanceIndex()
         self.db["article"] = {}
         for field in scribl.statement_types:
             self.db[field] = {}
         self.db["warnings"] = {}
         self.db["errors"] = {}
         self.db["relationships"] = {
-            "RELATES": [],
-            "REFERENCES": [],
-            "DESCRIBES": [],
-            "MENTIONS": [],
+            "RELATES": OrderedSet(),
+            "REFERENCES": OrderedSet(),
+            "DESCRIBES": OrderedSet(),
+            "MENTIONS": OrderedSet(),
         }
         for relationship_type in scribl.relationship_types:
             relationship_label = scribl.relationship_types[relationship_type]
-            self.db["relationships"][relationship_label] = []
+            self.db["relationships"][relationship_label] = OrderedSet()
+        # process a Zotero DB csv export, the Zotero desktop database or a
+        # local cache of items synced from the Zotero API, or an open Zotero
+        # source (anything with keymap and records(), e.g. fetched API items)
+        if export_type in [
+            scribl.ZOTERO_EXPORT,
+            scribl.ZOTERO_SQLITE,
+            scribl.ZOTERO_API_CACHE,
+            scribl.ZOTERO_RECORDS,
+        ]:
+            self.zotero_db = self.open_zotero_db(db_data_filepath, export_type)
+        self.parse_and_merge(self.zotero_db.records(), workers)
+        self.infer_relationships()
+        return
+
+    def open_zotero_db(self, db_data_filepath, export_type=scribl.ZOTERO_EXPORT):
+        # when streaming, only the mapped columns and the scribl field are kept
+        columns = None
+        if self.stream:
+            columns = {*self.zotero_keys, self.scribl_field}
+        if export_type == scribl.ZOTERO_RECORDS:
+            zotero_db = db_data_filepath
+            zotero_db.map_keys(self.zotero_keys, self.cypher_keys)
+            return zotero_db
+        if export_type == scribl.ZOTERO_SQLITE:
+            zotero_source = ZoteroSQLite
+        elif export_type == scribl.ZOTERO_API_CACHE:
+            zotero_source = ZoteroItemCache
+        else:
+            zotero_source = ZoteroCSV
+        zotero_db = zotero_source(db_data_filepath, columns=columns, stream=self.stream)
+        zotero_db.map_keys(self.zotero_keys, self.cypher_keys)
+        return zotero_db
+
+    def parse_and_merge(self, records, workers=1):
+        # records are (article_key, record) pairs, consumed as they are parsed
+        if workers > 1:
+            parsed_articles = self.parse_articles_parallel(
+                self.scribl_field, workers, self.parse_cache_size, records
+            )
+        else:
+            parsed_articles = self.parse_articles(self.scribl_field, records)
+        # merge articles in export order, so the db is the same however parsed
+        for article_key, record, parser_data in parsed_articles:
+            self.merge_article(article_key, parser_data, record)
+
+    def parse_articles(self, scribl_field, records=None):
+        if records is None:
+            records = self.zotero_db.records()
+        parser = ScriblParser(cache=self.parse_cache)
+        for article_key, record in records:
+            parser.reset()
+            parser.parse(record[scribl_field], split_text=scribl.tag_delimiter)
+            yield article_key, record, parser.data
+
+    def parse_articles_parallel(
+        self, scribl_field, workers, parse_cache_size, records=None, chunk_size=64
+    ):
+        # hand chunks of articles to worker processes, results come back in order,
+        # only a window of a few chunks per worker is read ahead of the merge
+        # process pools are only needed (and imported) for parallel builds
+        from concurrent.futures import ProcessPoolExecutor  # noqa: PLC0415
+
+        if records is None:
+            records = self.zotero_db.records()
+        records = iter(records)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_parse_worker,
+            initargs=(parse_cache_size,),
+        ) as executor:
+            while True:
+                window = list(itertools.islice(records, chunk_size * workers * 4))
+                if len(window) == 0:
+                    break
+                chunks = [
+                    [
+                        record[scribl_field]
+                        for article_key, record in window[n : n + chunk_size]
+                    ]
+                    for n in range(0, len(window), chunk_size)
+                ]
+                parsed_articles = itertools.chain.from_iterable(
+                    executor.map(_parse_article_chunk, chunks)
+                )
+                for (article_key, record), parser_data in zip(window, parsed_articles):
+                    yield article_key, record, parser_data
+
+    def merge_article(self, article_key, parser_data, record=None):
+        # names and values are interned so that the db (and its pickle) has
+        # the same shape whether the articles were parsed here or in workers
         resource_key = scribl.generate_statement("resource")
         category_key = scribl.generate_statement("category")
         process_key = scribl.generate_statement("process")
         agent_key = scribl.generate_statement("agent")
-        # process a Zotero DB csv export
-        if export_type == scribl.ZOTERO_EXPORT:
-            self.zotero_db = ZoteroCSV(db_data_filepath)
-            self.zotero_db.map_keys(zotero_keys, cypher_keys)
-        # process scribl_code tags in exported articles
-        parser = ScriblParser()
-        for article_key in self.zotero_db.data:
-            parser.reset()
-            scribl_text = self.zotero_db.data[article_key][scribl_field]
-            parser.parse(scribl_text, split_text=scribl.tag_delimiter)
-            # capture article with mapped keys
-            self.db["article"][article_key] = {}
-            for cypher_key in self.zotero_db.keymap:
-                zotero_key = self.zotero_db.keymap[cypher_key]
-                self.db["article"][article_key][cypher_key] = self.zotero_db.data[
-                    article_key
-                ][zotero_key]
-            # capture warnings and errors
-            wekey = (article_key, self.db["article"][article_key]["title"][:50])
-            if len(parser.data["warnings"]) > 0:
-                self.db["warnings"][wekey] = copy.copy(parser.data["warnings"])
-            if len(parser.data["errors"]) > 0:
-                self.db["errors"][wekey] = copy.copy(parser.data["errors"])
-            # capture categories and resources
-            doing = {category_key: "RELATES", resource_key: "REFERENCES"}
-            for item_type, relationship_label in doing.items():
-                item_key = item_type[len(scribl.statement_prefix) :]
-                for item in parser.data[item_type]:
-                    if item not in self.db[item_key]:
-                        self.db[item_key][item] = {"urls": [], "tags": [], "notes": []}
-                    for field in ["urls", "tags", "notes"]:
-                        for field_item in parser.data[item_type][item][field]:
-                            if field_item not in self.db[item_key][item][field]:
-                                self.db[item_key][item][field].append(field_item)
-                    # add article relationship
-                    relation = (article_key, item)
-                    if relation not in self.db["relationships"][relationship_label]:
-                        self.db["relationships"][relationship_label].append(relation)
-            # capture agents
-            for agent in parser.data[agent_key]:
-                if agent not in self.db["agent"]:
-                    self.db["agent"][agent] = {
-                        "urls": [],
-                        "tags": [],
-                        "notes": [],
-                        "labels": [],
-                        "synonyms": [agent],
-                    }
-                for field in ["urls", "tags", "notes", "labels", "synonyms"]:
-                    for field_item in parser.data[agent_key][agent][field]:
-                        if field_item not in self.db["agent"][agent][field]:
-                            self.db["agent"][agent][field].append(field_item)
-                relation = (article_key, agent)
-                if relation not in self.db["relationships"]["MENTIONS"]:
-                    self.db["relationships"]["MENTIONS"].append(relation)
-            # capture processes
-            for process in parser.data[process_key]:
-                if process not in self.db["process"]:
-                    self.db["process"][process] = {"urls": [], "tags": [], "notes": []}
+        if record is None:
+            record = self.zotero_db.data[article_key]
+        self.article_years = None
+        # capture article with mapped keys
+        self.db["article"][article_key] = {}
+        for cypher_key in self.zotero_db.keymap:
+            zotero_key = self.zotero_db.keymap[cypher_key]
+            self.db["article"][article_key][cypher_key] = record[zotero_key]
+        self.provenance.hashes[article_key] = article_hash(
+            record, self.zotero_db.keymap, self.scribl_field
+        )
+        # capture warnings and errors
+        wekey = (article_key, self.db["article"][article_key]["title"][:50])
+        if len(parser_data["warnings"]) > 0:
+            self.db["warnings"][wekey] = copy.copy(parser_data["warnings"])
+        if len(parser_data["errors"]) > 0:
+            self.db["errors"][wekey] = copy.copy(parser_data["errors"])
+        # capture categories and resources
+        doing = {category_key: "RELATES", resource_key: "REFERENCES"}
+        for item_type, relationship_label in doing.items():
+            item_key = item_type[len(scribl.statement_prefix) :]
+            for item_name in parser_data[item_type]:
+                field_data = parser_data[item_type][item_name]
+                item = sys.intern(item_name)
+                if item not in self.db[item_key]:
+                    self.db[item_key][item] = new_entity(item_key, item)
+                self.provenance.add("entity", (item_key, item), article_key)
                 for field in ["urls", "tags", "notes"]:
-                    for field_item in parser.data[process_key][process][field]:
-                        if field_item not in self.db["process"][process][field]:
-                            self.db["process"][process][field].append(field_item)
-                relation = (article_key, process)
-                if relation not in self.db["relationships"]["DESCRIBES"]:
-                    self.db["relationships"]["DESCRIBES"].append(relation)
-            # capture defined relationships
-            for item_type in [resource_key, agent_key, process_key]:
-                for item in parser.data[item_type]:
-                    for relationship in parser.data[item_type][item]["relationships"]:
-                        rtype = relationship[0]
-                        relation_label = scribl.relationship_types[rtype]
-                        partner1 = item
-                        partner2 = relationship[1]
-                        relation = (partner1, partner2)
-                        if relation not in self.db["relationships"][relation_label]:
-                            self.db["relationships"][relation_label].append(relation)
-            # modifies implies binds so add binds relationship to all modifies relationships
-            for relation in self.db["relationships"]["MODIFIES"]:
-                bind_relation = (relation[0], relation[1])
-                if bind_relation not in self.db["relationships"]["BINDS"]:
-                    self.db["relationships"]["BINDS"].append(bind_relation)
-        return
+                    for field_item in field_data[field]:
+                        field_item = sys.intern(field_item)  # noqa: PLW2901
+                        self.db[item_key][item][field].add(field_item)
+                        self.provenance.add(
+                            "field", (item_key, item, field, field_item), article_key
+                        )
+                # add article relationship
+                relation = (article_key, item)
+                self.add_relation(relationship_label, relation)
+                self.provenance.add(
+                    "relationship", (relationship_label, relation), article_key
+                )
+        # capture agents
+        for agent_name in parser_data[agent_key]:
+            field_data = parser_data[agent_key][agent_name]
+            agent = sys.intern(agent_name)
+            if agent not in self.db["agent"]:
+                self.db["agent"][agent] = new_entity("agent", agent)
+            self.provenance.add("entity", ("agent", agent), article_key)
+            for field in ["urls", "tags", "notes", "labels", "synonyms"]:
+                for field_item in field_data[field]:
+                    field_item = sys.intern(field_item)  # noqa: PLW2901
+                    self.db["agent"][agent][field].add(field_item)
+                    self.provenance.add(
+                        "field", ("agent", agent, field, field_item), article_key
+                    )
+            relation = (article_key, agent)
+            self.add_relation("MENTIONS", relation)
+            self.provenance.add("relationship", ("MENTIONS", relation), article_key)
+        # capture processes
+        for process_name in parser_data[process_key]:
+            field_data = parser_data[process_key][process_name]
+            process = sys.intern(process_name)
+            if process not in self.db["process"]:
+                self.db["process"][process] = new_entity("process", process)
+            self.provenance.add("entity", ("process", process), article_key)
+            for field in ["urls", "tags", "notes"]:
+                for field_item in field_data[field]:
+                    field_item = sys.intern(field_item)  # noqa: PLW2901
+                    self.db["process"][process][field].add(field_item)
+                    self.provenance.add(
+                        "field", ("process", process, field, field_item), article_key
+                    )
+            relation = (article_key, process)
+            self.add_relation("DESCRIBES", relation)
+            self.provenance.add("relationship", ("DESCRIBES", relation), article_key)
+        # capture defined relationships
+        for item_type in [resource_key, agent_key, process_key]:
+            for item in parser_data[item_type]:
+                for relationship in parser_data[item_type][item]["relationships"]:
+                    rtype = relationship[0]
+                    relation_label = scribl.relationship_types[rtype]
+                    partner1 = sys.intern(item)
+                    partner2 = sys.intern(relationship[1])
+                    relation = (partner1, partner2)
+                    self.add_relation(relation_label, relation)
+                    self.provenance.add(
+                        "relationship", (relation_label, relation), article_key
+                    )
+
+    def retract_article(self, article_key, keep_article=False):
+        # remove everything only this article supported: relationships first,
+        # then field values, then entities
+        unsupported = self.provenance.retract(article_key)
+        self.article_years = None
+        for rtype, relation in unsupported["relationship"]:
+            self.remove_relation(rtype, relation)
+        for item_key, item, field, value in unsupported["field"]:
+            # an agent is always its own first synonym
+            if field == "synonyms" and value == item:
+                continue
+            self.db[item_key][item][field].discard(value)
+        for item_key, item in unsupported["entity"]:
+            del self.db[item_key][item]
+        for field in ["warnings", "errors"]:
+            for wekey in [wekey for wekey in self.db[field] if wekey[0] == article_key]:
+                del self.db[field][wekey]
+        if not keep_article:
+            del self.db["article"][article_key]
+
+    def retract_inferred(self):
+        # inferred relationships are the ones no article supports directly
+        for rtype, relations in self.db["relationships"].items():
+            inferred = [
+                relation
+                for relation in relations
+                if ("relationship", (rtype, relation)) not in self.provenance
+            ]
+            for relation in inferred:
+                self.remove_relation(rtype, relation)
+
+    def update(self, db_data_filepath, workers=1, export_type=scribl.ZOTERO_EXPORT):
+        # incrementally update from a newer Zotero export: only articles that were
+        # added, removed or changed (by content hash) are retracted and re-merged
+        if self.provenance is None:
+            error_message = "GraphDB has no provenance (snapshot saved without it), so can't be updated incrementally"
+            raise ValueError(error_message)
+        zotero_db = self.open_zotero_db(db_data_filepath, export_type)
+        new_hashes = {
+            article_key: article_hash(record, zotero_db.keymap, self.scribl_field)
+            for article_key, record in zotero_db.records()
+        }
+        summary = {"added": [], "removed": [], "changed": []}
+        old_hashes = self.provenance.hashes
+        for article_key in old_hashes:
+            if article_key not in new_hashes:
+                summary["removed"].append(article_key)
+            elif new_hashes[article_key] != old_hashes[article_key]:
+                summary["changed"].append(article_key)
+        for article_key in new_hashes:
+            if article_key not in old_hashes:
+                summary["added"].append(article_key)
+        for article_key in summary["removed"]:
+            self.retract_article(article_key)
+        for article_key in summary["changed"]:
+            self.retract_article(article_key, keep_article=True)
+        self.zotero_db = zotero_db
+        article_keys = set(summary["changed"] + summary["added"])
+        records = (
+            (article_key, record)
+            for article_key, record in zotero_db.records()
+            if article_key in article_keys
+        )
+        self.parse_and_merge(records, workers)
+        self.retract_inferred()
+        self.infer_relationships()
+        return summary
+
+    def infer_relationships(self, rules=None):
+        # derived relationships are added once over the final edge sets, rather
+        # than inside the article loop, each rule is a function of the GraphDB
+        if rules is None:
+            rules = self.inference_rules
+        for rule in rules:
+            rule(self)
 
     def catalog(self, item_type, relationship=False):
         if relationship:
@@ -140,64 +677,347 @@ class GraphDB:
     def get(self, item_type, item_name):
         return self.db[item_type][item_name]
 
+    def add_relation(self, rtype, relation):
+        # relationships are added (and removed) through here so the adjacency
+        # index stays consistent with the relationship store
+        if relation in self.db["relationships"][rtype]:
+            return
+        self.db["relationships"][rtype].add(relation)
+        for partner in relation:
+            partner_index = self.adjacency.setdefault(partner, {})
+            partner_index.setdefault(rtype, OrderedSet()).add(relation)
+
+    def remove_relation(self, rtype, relation):
+        if relation not in self.db["relationships"][rtype]:
+            return
+        self.db["relationships"][rtype].discard(relation)
+        for partner in relation:
+            partner_index = self.adjacency.get(partner)
+            if partner_index is None or rtype not in partner_index:
+                continue
+            partner_index[rtype].discard(relation)
+            if len(partner_index[rtype]) == 0:
+                del partner_index[rtype]
+            if len(partner_index) == 0:
+                del self.adjacency[partner]
+
+    def build_adjacency(self):
+        # entity -> relationship type -> relations (in either direction) touching it
+        self.adjacency = {}
+        for rtype, relations in self.db["relationships"].items():
+            for relation in relations:
+                for partner in relation:
+                    partner_index = self.adjacency.setdefault(partner, {})
+                    partner_index.setdefault(rtype, OrderedSet()).add(relation)
+
     def show_relationships(self, item_type, item_name):
         try:
             self.db[item_type][item_name]
         except Exception:
             return {}
         result = {"search": (item_type, item_name)}
+        entity_index = self.adjacency.get(item_name, {})
         for rtype in self.db["relationships"]:
-            result[rtype] = []
-            for relation in self.db["relationships"][rtype]:
-                if item_name in relation:
-                    result[rtype].append(relation)
+            result[rtype] = list(entity_index.get(rtype, []))
         return result
 
+    def neighbors(self, entity, rtype=None, direction="both"):
+        # partners of entity (optionally for one relationship type), in the
+        # order the relationships were added, direction is "out", "in" or "both"
+        if direction not in ["out", "in", "both"]:
+            error_message = (
+                f"Unknown direction '{direction}', expected 'out', 'in' or 'both'"
+            )
+            raise ValueError(error_message)
+        entity_index = self.adjacency.get(entity, {})
+        rtypes = list(self.db["relationships"]) if rtype is None else [rtype]
+        result = OrderedSet()
+        for current_rtype in rtypes:
+            for partner1, partner2 in entity_index.get(current_rtype, []):
+                if partner1 == entity and direction in ["out", "both"]:
+                    result.add(partner2)
+                if partner2 == entity and direction in ["in", "both"]:
+                    result.add(partner1)
+        return list(result)
+
+    def relations_of(self, entity, rtype):
+        # relations of one type touching entity, from the adjacency index
+        return list(self.adjacency.get(entity, {}).get(rtype, []))
+
+    def articles_in_years(self, start=None, end=None):
+        # keys of the articles published from start to end (inclusive, either
+        # can be None), the year is the start of the field (Zotero API items
+        # have dates like "2016-04-12", other sources may give an int),
+        # articles without one are left out
+        if self.article_years is None:
+            self.article_years = {}
+            for article_key, article in self.db["article"].items():
+                year = re.match(r"\d{4}", str(article.get("year", "")))
+                if year is None:
+                    continue
+                self.article_years.setdefault(int(year.group()), []).append(article_key)
+        article_keys = []
+        for year in sorted(self.article_years):
+            if (start is None or year >= start) and (end is None or year <= end):
+                article_keys.extend(self.article_years[year])
+        return article_keys
+
+    def subgraph(self, seeds=None, hops=1, category=None, rtypes=None, years=None):
+        # read-only SubGraphDB of everything within hops relationships of the
+        # seeds (entity names or article keys), following only rtypes (all
+        # types if None) and, given a category (or list of categories) or a
+        # (start, end) year range, only through the matching articles, without
+        # seeds those articles are the seeds, the subgraph is walked through
+        # the adjacency index so its cost depends on its size, not the db's
+        relationships = self.db["relationships"]
+        if rtypes is None:
+            rtypes = list(relationships)
+        for rtype in rtypes:
+            if rtype not in relationships:
+                error_message = f"Unknown relationship type '{rtype}', expected one of {list(relationships)}"
+                raise ValueError(error_message)
+        if hops < 0:
+            error_message = f"Subgraph hops must be at least 0, not {hops}"
+            raise ValueError(error_message)
+        articles = None
+        if category is not None:
+            categories = [category] if isinstance(category, str) else category
+            articles = {}
+            for current_category in categories:
+                for article_key, item in self.relations_of(current_category, "RELATES"):
+                    if item == current_category:
+                        articles[article_key] = None
+        if years is not None:
+            year_articles = self.articles_in_years(*years)
+            if articles is None:
+                articles = dict.fromkeys(year_articles)
+            else:
+                articles = {
+                    article_key: None
+                    for article_key in year_articles
+                    if article_key in articles
+                }
+        if seeds is None and articles is None:
+            # just the relationships of the given types
+            seeds = []
+            for rtype in rtypes:
+                for relation in relationships[rtype]:
+                    seeds.extend(relation)
+            seeds = list(dict.fromkeys(seeds))
+        elif seeds is None:
+            seeds = list(articles)
+        elif isinstance(seeds, str):
+            seeds = [seeds]
+        for seed in seeds:
+            if not any(
+                seed in self.db[item_type] for item_type in ["article", *entity_fields]
+            ):
+                error_message = (
+                    f"'{seed}' is not an article key or entity name in the graph DB"
+                )
+                raise ValueError(error_message)
+
+        def followed(rtype, relation):
+            # relations of articles outside the category or year range are skipped
+            if articles is None or scribl.cypher_relationships[rtype][0] != "ARTICLE":
+                return True
+            return relation[0] in articles
+
+        names = dict.fromkeys(seeds)
+        frontier = list(names)
+        for _ in range(hops):
+            next_frontier = []
+            for name in frontier:
+                for rtype in rtypes:
+                    for relation in self.relations_of(name, rtype):
+                        if not followed(rtype, relation):
+                            continue
+                        for partner in relation:
+                            if partner not in names:
+                                names[partner] = None
+                                next_frontier.append(partner)
+            frontier = next_frontier
+        # every relationship between the names found
+        subgraph_relationships = {rtype: OrderedSet() for rtype in relationships}
+        for name in names:
+            for rtype in rtypes:
+                for relation in self.relations_of(name, rtype):
+                    if (
+                        relation[0] in names
+                        and relation[1] in names
+                        and followed(rtype, relation)
+                    ):
+                        subgraph_relationships[rtype].add(relation)
+        return SubGraphDB(self, seeds, subgraph_relationships)
+
     def save_db(self, filepath):
+        # snapshots store plain lists, so they stay readable by older versions,
+        # provenance is appended as a second pickle that older readers never see
+        # (same pickler, so names already in the db are written as memo refs)
         with open(filepath, "wb") as dbfile:
-            pickle.dump(self.db, dbfile)
+            pickler = pickle.Pickler(dbfile)
+            pickler.dump(convert_db_fields(self.db, list))
+            if self.provenance is not None:
+                pickler.dump(self.provenance.to_state())
 
     def load_db(self, filepath):
+        return self.read_snapshot(filepath)[0]
+
+    def read_snapshot(self, filepath):
+        # returns the db and its provenance (None for snapshots saved without)
         with open(filepath, "rb") as dbfile:
-            return pickle.load(dbfile)
+            unpickler = pickle.Unpickler(dbfile)
+            db = convert_db_fields(unpickler.load(), OrderedSet)
+            try:
+                provenance = ProvenanceIndex.from_state(unpickler.load())
+            except EOFError:
+                provenance = None
+        return db, provenance
 
     def generate_db_diff(self, other):
+        # entities and relationships in self that are not in other: whole new
+        # entities, edit entries (prefixed) holding only the new field values of
+        # changed entities, and new relations per relationship type
         db_diff = {}
         for item_type in self.db:
             if item_type in ["relationships", "warnings", "errors"]:
                 continue
             db_diff[item_type] = {}
-            for item in self.db[item_type]:
-                if item not in other.db[item_type]:
-                    db_diff[item_type][item] = copy.copy(self.db[item_type][item])
+            other_items = other.db.get(item_type, {})
+            for item, entity in self.db[item_type].items():
+                if item not in other_items:
+                    db_diff[item_type][item] = copy.copy(entity)
+                    continue
+                other_entity = other_items[item]
+                # only descend into entities whose content differs
+                if entity_fingerprint(entity) == entity_fingerprint(other_entity):
                     continue
-                diff_found = False
-                current_item = copy.copy(self.db[item_type][item])
-                for field in self.db[item_type][item]:
-                    current_item[field] = []
-                    for value in self.db[item_type][item][field]:
-                        if value not in other.db[item_type][item][field]:
-                            diff_found = True
-                            current_item[field].append(value)
-                if diff_found:
+                current_item = diff_entity(entity, other_entity)
+                if current_item is not None:
                     edit_item = f"{scribl.edit_diff_item_prefix}{item}"
                     db_diff[item_type][edit_item] = current_item
-            # compile relationship diffs
-            db_diff["relationships"] = {}
-            for rtype in self.db["relationships"]:
-                db_diff["relationships"][rtype] = []
-                for relation in self.db["relationships"][rtype]:
-                    if relation not in other.db["relationships"][rtype]:
-                        db_diff["relationships"][rtype].append(relation)
+        # compile relationship diffs
+        db_diff["relationships"] = {}
+        other_relationships = other.db["relationships"]
+        for rtype, relations in self.db["relationships"].items():
+            other_relations = set(other_relationships.get(rtype, ()))
+            db_diff["relationships"][rtype] = [
+                relation for relation in relations if relation not in other_relations
+            ]
         return db_diff
 
-    def generate_cypher(self, diff_db=None):
+    def generate_db_changes(self, other):
+        # two sided diff of self against an older other: entities and relations
+        # only in self (added) or only in other (removed), and for entities in
+        # both with different content, the field values each side lacks
+        changes = {"added": {}, "removed": {}, "changed": {}}
+        for item_type in self.db:
+            if item_type in ["relationships", "warnings", "errors"]:
+                continue
+            items = self.db[item_type]
+            other_items = other.db.get(item_type, {})
+            changes["added"][item_type] = {
+                item: copy.copy(entity)
+                for item, entity in items.items()
+                if item not in other_items
+            }
+            changes["removed"][item_type] = {
+                item: copy.copy(entity)
+                for item, entity in other_items.items()
+                if item not in items
+            }
+            changes["changed"][item_type] = {}
+            for item, entity in items.items():
+                other_entity = other_items.get(item)
+                if other_entity is None:
+                    continue
+                if entity_fingerprint(entity) == entity_fingerprint(other_entity):
+                    continue
+                added = diff_entity(entity, other_entity)
+                removed = diff_entity(other_entity, entity)
+                if added is not None or removed is not None:
+                    changes["changed"][item_type][item] = {
+                        "added": added or {},
+                        "removed": removed or {},
+                    }
+        changes["added"]["relationships"] = {}
+        changes["removed"]["relationships"] = {}
+        other_relationships = other.db["relationships"]
+        for rtype in dict.fromkeys([*self.db["relationships"], *other_relationships]):
+            relations = self.db["relationships"].get(rtype, ())
+            other_relations = other_relationships.get(rtype, ())
+            relation_set = set(relations)
+            other_relation_set = set(other_relations)
+            changes["added"]["relationships"][rtype] = [
+                relation for relation in relations if relation not in other_relation_set
+            ]
+            changes["removed"]["relationships"][rtype] = [
+                relation for relation in other_relations if relation not in relation_set
+            ]
+        return changes
+
+    def generate_cypher(
+        self, diff_db=None, changes=None, batch_size=None, transaction_rows=None
+    ):
+        # list of Cypher statements, see iter_cypher
+        return list(
+            self.iter_cypher(
+                diff_db=diff_db,
+                changes=changes,
+                batch_size=batch_size,
+                transaction_rows=transaction_rows,
+            )
+        )
+
+    def iter_cypher(
+        self, diff_db=None, changes=None, batch_size=None, transaction_rows=None
+    ):
+        # Cypher statements one at a time, with changes (from
+        # generate_db_changes) the removals are emitted first, then everything
+        # added, as edits of the nodes that already exist, with a batch_size
+        # nodes and edges are written batch_size at a time (and committed every
+        # transaction_rows rows, if given)
+        if transaction_rows is not None and batch_size is None:
+            error_message = "Cypher transaction rows need a batch size"
+            raise ValueError(error_message)
+        if changes is not None:
+            yield from self.iter_removal_cypher(
+                changes, batch_size=batch_size, transaction_rows=transaction_rows
+            )
+            yield from self.iter_cypher(
+                diff_db=change_additions(changes),
+                batch_size=batch_size,
+                transaction_rows=transaction_rows,
+            )
+            return
         use_db = self.db if diff_db is None else diff_db
-        cypher = []
+        if batch_size is not None:
+            statements = self.iter_batched_cypher(use_db, batch_size, transaction_rows)
+        else:
+            statements = self.iter_statement_cypher(use_db)
+        nstatements = 0
+        for statement in statements:
+            nstatements += 1
+            yield statement
+        # clean up any redundant 'binds' relationships (but if diff cypher contains nothing, skip it)
+        if nstatements > 0:
+            yield """MATCH (a1:AGENT)-[r1:BINDS]->(a2:AGENT) WITH a1,a2 MATCH(a1:AGENT)<-[r2:BINDS]-(a2:AGENT) DELETE r2;"""
+
+    def iter_statement_cypher(self, use_db):
+        # one statement per node and per relationship
         # export articles
         for article_key in use_db["article"]:
             edit = self.edit_only(article_key)
             name = edit["name"]
+            if edit["only"]:
+                # MERGE on changed properties would create a second node
+                cypher_list = [f"""MATCH (a:ARTICLE {{key:"{name}"}})"""]
+                for field in use_db["article"][article_key]:
+                    value = use_db["article"][article_key][field]
+                    cypher_list.append(f'set a.{field} = "{value}"')
+                cypher_list[-1] = cypher_list[-1] + ";"
+                yield "\n".join(cypher_list)
+                continue
             cypher_list = [f"""MERGE (:ARTICLE {{key:"{name}", """]
             for field in use_db["article"][article_key]:
                 value = use_db["article"][article_key][field]
@@ -205,7 +1025,7 @@ class GraphDB:
                 cypher_list.append(", ")
             cypher_list[-1] = "});"
             cypher_text = "".join(cypher_list)
-            cypher.append(cypher_text)
+            yield cypher_text
             # print(cypher_text)
         # export category
         for category in use_db["category"]:
@@ -222,7 +1042,7 @@ class GraphDB:
                     cypher_list.append(f"""set r.{field} = (r.{field} + "{item}")""")
             cypher_list[-1] = cypher_list[-1] + ";"
             cypher_text = "\n".join(cypher_list)
-            cypher.append(cypher_text)
+            yield cypher_text
             # print(cypher_text)
         # export resources
         for resource in use_db["resource"]:
@@ -239,7 +1059,7 @@ class GraphDB:
                     cypher_list.append(f"""set r.{field} = (r.{field} + "{item}")""")
             cypher_list[-1] = cypher_list[-1] + ";"
             cypher_text = "\n".join(cypher_list)
-            cypher.append(cypher_text)
+            yield cypher_text
             # print(cypher_text)
         # export processes
         for process in use_db["process"]:
@@ -256,7 +1076,7 @@ class GraphDB:
                     cypher_list.append(f"""set r.{field} = (r.{field} + "{item}")""")
             cypher_list[-1] = cypher_list[-1] + ";"
             cypher_text = "\n".join(cypher_list)
-            cypher.append(cypher_text)
+            yield cypher_text
             # print(cypher_text)
         # export agents
         for agent in use_db["agent"]:
@@ -273,7 +1093,7 @@ class GraphDB:
                     cypher_list.append(f"""set a.{field} = (a.{field} + "{item}")""")
             cypher_list[-1] = cypher_list[-1] + ";"
             cypher_text = "\n".join(cypher_list)
-            cypher.append(cypher_text)
+            yield cypher_text
             # print(cypher_text)
         # export relationships
         for rtype in use_db["relationships"]:
@@ -292,22 +1112,262 @@ class GraphDB:
                 else:
                     cypher_list.append(f"""MERGE (p1)-[:{rtype}]->(p2);""")
                 cypher_text = "\n".join(cypher_list)
-                cypher.append(cypher_text)
+                yield cypher_text
                 # print(cypher_text)
-        # clean up any redundant 'binds' relationships (but if diff cypher contains nothing, skip it)
-        if len(cypher) > 0:
-            cypher_text = """MATCH (a1:AGENT)-[r1:BINDS]->(a2:AGENT) WITH a1,a2 MATCH(a1:AGENT)<-[r2:BINDS]-(a2:AGENT) DELETE r2;"""
-            cypher.append(cypher_text)
-        return cypher
+
+    def iter_batched_cypher(self, use_db, batch_size, transaction_rows=None):
+        # one UNWIND statement per batch of nodes with the same label (or edges
+        # with the same relationship type), the rows are literal lists so the
+        # output is self contained
+        if batch_size < 1:
+            error_message = f"Cypher batch size must be at least 1, not {batch_size}"
+            raise ValueError(error_message)
+        if transaction_rows is not None and transaction_rows < 1:
+            error_message = (
+                f"Cypher transaction rows must be at least 1, not {transaction_rows}"
+            )
+            raise ValueError(error_message)
+        # export articles, new ones are merged on their key, edited ones matched
+        new_rows = []
+        edit_rows = []
+        for article_key, fields in use_db["article"].items():
+            edit = self.edit_only(article_key)
+            row = {"key": edit["name"], **fields}
+            (edit_rows if edit["only"] else new_rows).append(row)
+        for batch in batches(new_rows, batch_size):
+            cypher_list = ["""MERGE (a:ARTICLE {key:row.key}) SET a += row"""]
+            yield unwind_cypher(batch, cypher_list, transaction_rows)
+        for batch in batches(edit_rows, batch_size):
+            cypher_list = ["""MATCH (a:ARTICLE {key:row.key}) SET a += row"""]
+            yield unwind_cypher(batch, cypher_list, transaction_rows)
+        # export categories, resources, processes and agents, the field values
+        # of a row are appended to the lists on the node
+        for item_type in ["category", "resource", "process", "agent"]:
+            label = item_type.upper()
+            fields = entity_fields[item_type]
+            new_rows = []
+            edit_rows = []
+            for item, entity in use_db[item_type].items():
+                edit = self.edit_only(item)
+                row = {"name": edit["name"]}
+                row.update((field, list(entity.get(field, ()))) for field in fields)
+                (edit_rows if edit["only"] else new_rows).append(row)
+            empty_fields = ", ".join(f"n.{field} = []" for field in fields)
+            append_fields = ", ".join(
+                f"n.{field} = n.{field} + row.{field}" for field in fields
+            )
+            for batch in batches(new_rows, batch_size):
+                cypher_list = [
+                    f"""MERGE (n:{label} {{name:row.name}}) ON CREATE SET {empty_fields}""",
+                    f"""SET {append_fields}""",
+                ]
+                yield unwind_cypher(batch, cypher_list, transaction_rows)
+            for batch in batches(edit_rows, batch_size):
+                cypher_list = [
+                    f"""MATCH (n:{label} {{name:row.name}})""",
+                    f"""SET {append_fields}""",
+                ]
+                yield unwind_cypher(batch, cypher_list, transaction_rows)
+        # export relationships
+        for rtype, relations in use_db["relationships"].items():
+            partner1_type = scribl.cypher_relationships[rtype][0]
+            partner2_type = scribl.cypher_relationships[rtype][1]
+            match_field = "key" if partner1_type == "ARTICLE" else "name"
+            cypher_rtype = rtype[9:] if rtype[:9] == "RESOURCE_" else rtype
+            for batch in batches(relations, batch_size):
+                cypher_list = [
+                    f"""MATCH (p1:{partner1_type} {{{match_field}:row[0]}}), (p2:{partner2_type} {{name:row[1]}})""",
+                    f"""MERGE (p1)-[:{cypher_rtype}]->(p2)""",
+                ]
+                yield unwind_cypher(batch, cypher_list, transaction_rows)
+
+    def iter_removal_cypher(self, changes, batch_size=None, transaction_rows=None):
+        # relations first, then values dropped from the fields of changed
+        # entities, then the nodes that are gone (with anything still attached),
+        # with a batch_size relations and nodes are deleted in UNWIND batches
+        for rtype, relations in changes["removed"]["relationships"].items():
+            partner1_type = scribl.cypher_relationships[rtype][0]
+            partner2_type = scribl.cypher_relationships[rtype][1]
+            match_field = "key" if partner1_type == "ARTICLE" else "name"
+            cypher_rtype = rtype[9:] if rtype[:9] == "RESOURCE_" else rtype
+            # only one direction of a BINDS pair is kept in the graph, so it is
+            # matched either way, and left alone while its reverse remains
+            arrow = "-" if rtype == "BINDS" else "->"
+            removed = relations
+            if rtype == "BINDS":
+                remaining = self.db["relationships"].get(rtype, ())
+                removed = [
+                    relation
+                    for relation in relations
+                    if (relation[1], relation[0]) not in remaining
+                ]
+            if batch_size is not None:
+                for batch in batches(removed, batch_size):
+                    cypher_list = [
+                        f"""MATCH (p1:{partner1_type} {{{match_field}:row[0]}})-[r:{cypher_rtype}]{arrow}(p2:{partner2_type} {{name:row[1]}})""",
+                        "DELETE r",
+                    ]
+                    yield unwind_cypher(batch, cypher_list, transaction_rows)
+                continue
+            for relation in removed:
+                cypher_list = [
+                    f"""MATCH (p1:{partner1_type} {{{match_field}:"{relation[0]}"}})-[r:{cypher_rtype}]{arrow}(p2:{partner2_type} {{name:"{relation[1]}"}})""",
+                    "DELETE r;",
+                ]
+                yield "\n".join(cypher_list)
+        for item_type, items in changes["changed"].items():
+            label = item_type.upper()
+            match_field = "key" if item_type == "article" else "name"
+            for item, fields in items.items():
+                cypher_list = [f"""MATCH (n:{label} {{{match_field}:"{item}"}})"""]
+                for field, values in fields["removed"].items():
+                    if isinstance(values, str):
+                        # changed article fields are simply set to the new value
+                        if field not in fields["added"]:
+                            cypher_list.append(f"""remove n.{field}""")
+                    elif len(values) > 0:
+                        value_list = ", ".join(f'"{value}"' for value in values)
+                        cypher_list.append(
+                            f"""set n.{field} = [value IN n.{field} WHERE NOT value IN [{value_list}]]"""
+                        )
+                if len(cypher_list) > 1:
+                    cypher_list[-1] = cypher_list[-1] + ";"
+                    yield "\n".join(cypher_list)
+        for item_type, items in changes["removed"].items():
+            if item_type == "relationships":
+                continue
+            label = item_type.upper()
+            match_field = "key" if item_type == "article" else "name"
+            if batch_size is not None:
+                for batch in batches(items, batch_size):
+                    cypher_list = [
+                        f"""MATCH (n:{label} {{{match_field}:row}}) DETACH DELETE n"""
+                    ]
+                    yield unwind_cypher(batch, cypher_list, transaction_rows)
+                continue
+            for item in items:
+                yield f"""MATCH (n:{label} {{{match_field}:"{item}"}}) DETACH DELETE n;"""
 
     def edit_only(self, item_name):
         if item_name[:3] == scribl.edit_diff_item_prefix:
             return {"only": True, "name": item_name[3:]}
         return {"only": False, "name": item_name}
 
-    def export_cypher_text(self, cypher):
+    def generate_constraint_cypher(self):
+        # uniqueness constraints (and so indexes) on the properties every
+        # MERGE and MATCH of the exported Cypher looks nodes up by
+        cypher = []
+        for label, field in [
+            ("ARTICLE", "key"),
+            ("CATEGORY", "name"),
+            ("RESOURCE", "name"),
+            ("PROCESS", "name"),
+            ("AGENT", "name"),
+        ]:
+            cypher.append(
+                f"""CREATE CONSTRAINT {label.lower()}_{field} IF NOT EXISTS FOR (n:{label}) REQUIRE n.{field} IS UNIQUE;"""
+            )
+        return cypher
+
+    def export_cypher_text(self, cypher, constraints=False):
+        # with constraints the constraint DDL is put ahead of the statements
+        if constraints:
+            cypher = self.generate_constraint_cypher() + list(cypher)
         return "\n".join(cypher)
 
+    def write_cypher_text(self, file, cypher, constraints=False):
+        # streaming export_cypher_text, cypher can be iter_cypher(...)
+        if constraints:
+            cypher = itertools.chain(self.generate_constraint_cypher(), cypher)
+        write_lines(file, cypher)
+
+    def generate_bulk_import(self, array_delimiter="|"):
+        # neo4j-admin import tables for the same nodes and relationships that
+        # generate_cypher exports, as (filename, rows) with a header first row,
+        # node ids are grouped per label as entity names repeat across labels
+        tables = []
+        articles = self.db["article"]
+        if len(articles) > 0:
+            fields = list(
+                dict.fromkeys(itertools.chain.from_iterable(articles.values()))
+            )
+            rows = [["key:ID(ARTICLE)", *fields, ":LABEL"]]
+            for article_key, article in articles.items():
+                rows.append(
+                    [
+                        article_key,
+                        *[article.get(field, "") for field in fields],
+                        "ARTICLE",
+                    ]
+                )
+            tables.append(("article_nodes.csv", rows))
+        for item_type in ["category", "resource", "process", "agent"]:
+            if len(self.db[item_type]) == 0:
+                continue
+            label = item_type.upper()
+            fields = entity_fields[item_type]
+            rows = [
+                [
+                    f"name:ID({label})",
+                    *[f"{field}:string[]" for field in fields],
+                    ":LABEL",
+                ]
+            ]
+            for item, entity in self.db[item_type].items():
+                row = [item]
+                for field in fields:
+                    for value in entity[field]:
+                        if array_delimiter in value:
+                            error_message = f"Array delimiter '{array_delimiter}' found in {item_type} '{item}' {field}: {value}"
+                            raise ValueError(error_message)
+                    row.append(array_delimiter.join(entity[field]))
+                row.append(label)
+                rows.append(row)
+            tables.append((f"{item_type}_nodes.csv", rows))
+        for rtype, relations in self.db["relationships"].items():
+            partner1_type = scribl.cypher_relationships[rtype][0]
+            partner2_type = scribl.cypher_relationships[rtype][1]
+            cypher_rtype = rtype[9:] if rtype[:9] == "RESOURCE_" else rtype
+            partners1 = self.db[partner1_type.lower()]
+            partners2 = self.db[partner2_type.lower()]
+            rows = [
+                [f":START_ID({partner1_type})", f":END_ID({partner2_type})", ":TYPE"]
+            ]
+            for relation in relations:
+                # the Cypher export can only MATCH nodes that exist, and keeps
+                # one direction of a BINDS pair
+                if relation[0] not in partners1 or relation[1] not in partners2:
+                    continue
+                if (
+                    rtype == "BINDS"
+                    and relation[0] > relation[1]
+                    and (relation[1], relation[0]) in relations
+                ):
+                    continue
+                rows.append([relation[0], relation[1], cypher_rtype])
+            if len(rows) > 1:
+                tables.append((f"{rtype.lower()}_relationships.csv", rows))
+        return tables
+
+    def export_bulk_import(self, dirpath, array_delimiter="|", database="neo4j"):
+        # writes the neo4j-admin import tables into dirpath and returns the
+        # command line that imports them (run from dirpath)
+        command = [
+            "neo4j-admin database import full",
+            f"--array-delimiter='{array_delimiter}'",
+            "--multiline-fields=true",
+        ]
+        for filename, rows in self.generate_bulk_import(array_delimiter):
+            filepath = Path(dirpath) / filename
+            with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
+                csv.writer(csvfile).writerows(rows)
+            if filename.endswith("_nodes.csv"):
+                command.append(f"--nodes={filename}")
+            else:
+                command.append(f"--relationships={filename}")
+        command.append(database)
+        return " ".join(command)
+
     def check_synonyms(self):
         agents = []
         synonyms = {}
@@ -337,9 +1397,11 @@ class GraphDB:
                 no_label.append(agent)
         return no_label
 
-    def _generate_xml_node(self, node_db, node_name=""):
-        xmlnode_list = []
-
+    def _iter_xml_nodes(self, node_db, node_name=""):
+        # one XML fragment per node, or a single empty one if there are none
+        # (the nodes of each type used to be joined into one fragment)
+        if len(node_db) == 0:
+            yield ""
         for node in node_db:
             edit = self.edit_only(node)
             name = edit["name"]
@@ -350,22 +1412,21 @@ class GraphDB:
                 for item in node_db[node][field]:
                     graphml_list.append(f"""<data key="{field}">{item}</data>""")
             graphml_list.append("</node>")
-            graphml_text = "\n".join(graphml_list)
-            xmlnode_list.append(graphml_text)
-
-        return "\n".join(xmlnode_list)
+            yield "\n".join(graphml_list)
 
     def generate_graphml(self):
+        # list of GraphML XML fragments, see iter_graphml
+        return list(self.iter_graphml())
+
+    def iter_graphml(self):
+        # GraphML XML fragments one at a time
         use_db = self.db
-        graphml = []
         # export articles
-        graphml.append("""<?xml version="1.0" encoding="UTF-8"?>
-<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">""")
+        yield """<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">"""
 
         # NODE TYPE
-        graphml.append(
-            """<key id="desc" for="node" attr.name="desc" attr.type="string"/>"""
-        )
+        yield """<key id="desc" for="node" attr.name="desc" attr.type="string"/>"""
 
         # ARTICLE, RESOURCE, AGENT, PROCESS
 
@@ -376,16 +1437,12 @@ class GraphDB:
         ]  # cypher_keys include the Zotero keys
 
         for key in scribl_attributes:
-            graphml.append(
-                f"""<key id="{key}" for="node" attr.name="{key}" attr.type="string"/>"""
-            )
+            yield f"""<key id="{key}" for="node" attr.name="{key}" attr.type="string"/>"""
 
         # RELATIONSHIP
-        graphml.append(
-            """<key id="relationship" for="edge" attr.name="label" attr.type="string"/>"""
-        )
+        yield """<key id="relationship" for="edge" attr.name="label" attr.type="string"/>"""
 
-        graphml.append("<graph id='G' edgedefault='directed'>")
+        yield "<graph id='G' edgedefault='directed'>"
         for article_key in use_db["article"]:
             edit = self.edit_only(article_key)
             name = edit["name"]
@@ -400,21 +1457,17 @@ class GraphDB:
                 graphml_list.append(f"""<data key="{field}">{value}</data>\n""")
             graphml_list.append("</node>")
             graphml_text = "".join(graphml_list)
-            graphml.append(graphml_text)
+            yield graphml_text
 
         # node generation the same for all remaining nodes
 
-        category_xml = self._generate_xml_node(use_db["category"], node_name="CATEGORY")
-        graphml.append(category_xml)
+        yield from self._iter_xml_nodes(use_db["category"], node_name="CATEGORY")
 
-        resource_xml = self._generate_xml_node(use_db["resource"], node_name="RESOURCE")
-        graphml.append(resource_xml)
+        yield from self._iter_xml_nodes(use_db["resource"], node_name="RESOURCE")
 
-        process_xml = self._generate_xml_node(use_db["process"], node_name="PROCESS")
-        graphml.append(process_xml)
+        yield from self._iter_xml_nodes(use_db["process"], node_name="PROCESS")
 
-        agent_xml = self._generate_xml_node(use_db["agent"], node_name="AGENT")
-        graphml.append(agent_xml)
+        yield from self._iter_xml_nodes(use_db["agent"], node_name="AGENT")
 
         for rtype in use_db["relationships"]:
             partner1_type = scribl.cypher_relationships[rtype][0]
@@ -431,11 +1484,89 @@ class GraphDB:
                 graphml_list.append(f"""<data key="relationship">{rtype}</data>""")
                 graphml_list.append("</edge>")
                 graphml_text = "\n".join(graphml_list)
-                graphml.append(graphml_text)
+                yield graphml_text
 
-        graphml.append("</graph>")
-        graphml.append("</graphml>")
-        return graphml
+        yield "</graph>"
+        yield "</graphml>"
 
     def export_graphml_text(self, graphml):
         return "\n".join(graphml)
+
+    def to_networkx(self):
+        # MultiDiGraph of the graph DB, nodes are (type, name) tuples (names
+        # repeat across types) with the type, name and fields as attributes
+        # (a field called type or name, e.g. from custom cypher_keys, is
+        # prefixed with the item type, e.g. article_type), edges are keyed and
+        # labelled by relationship type
+        import networkx as nx  # noqa: PLC0415
+
+        graph = nx.MultiDiGraph()
+        for item_type in ["article", "category", "resource", "process", "agent"]:
+            node_type = item_type.upper()
+            for item, fields in self.db[item_type].items():
+                attributes = {"type": node_type, "name": item}
+                for field, values in fields.items():
+                    if field in ["type", "name"]:
+                        field = f"{item_type}_{field}"  # noqa: PLW2901
+                    attributes[field] = (
+                        values if isinstance(values, str) else list(values)
+                    )
+                graph.add_node((node_type, item), **attributes)
+        for rtype, relations in self.db["relationships"].items():
+            partner1_type = scribl.cypher_relationships[rtype][0]
+            partner2_type = scribl.cypher_relationships[rtype][1]
+            for relation in relations:
+                graph.add_edge(
+                    (partner1_type, relation[0]),
+                    (partner2_type, relation[1]),
+                    key=rtype,
+                    label=rtype,
+                )
+        return graph
+
+    def write_graphml_text(self, file, graphml):
+        # streaming export_graphml_text, graphml can be iter_graphml()
+        write_lines(file, graphml)
+
+
+class SubGraphDB(GraphDB):
+    # read-only part of a GraphDB (see GraphDB.subgraph): the seeds and the
+    # given relationships with the articles and entities they connect, the
+    # rest of the GraphDB API (catalog, neighbors, exporters) works unchanged
+    def __init__(self, graphdb, seeds, relationships):
+        self.inference_rules = []
+        self.provenance = None
+        self.article_years = None
+        nodes = {"article": {}, **{item_type: {} for item_type in entity_fields}}
+        for seed in seeds:
+            for item_type, items in nodes.items():
+                if seed in graphdb.db[item_type]:
+                    items[seed] = None
+        for rtype, relations in relationships.items():
+            partner_types = scribl.cypher_relationships[rtype]
+            for relation in relations:
+                for partner_type, partner in zip(partner_types, relation):
+                    item_type = partner_type.lower()
+                    if partner in graphdb.db[item_type]:
+                        nodes[item_type][partner] = None
+        self.db = {}
+        for item_type, items in nodes.items():
+            self.db[item_type] = {item: graphdb.db[item_type][item] for item in items}
+        for field in ["warnings", "errors"]:
+            self.db[field] = {
+                wekey: value
+                for wekey, value in graphdb.db[field].items()
+                if wekey[0] in nodes["article"]
+            }
+        self.db["relationships"] = relationships
+        self.build_adjacency()
+
+    def add_relation(self, rtype, relation):  # noqa: ARG002
+        error_message = "SubGraphDB is read-only"
+        raise TypeError(error_message)
+
+    remove_relation = add_relation
+
+    def update(self, db_data_filepath, workers=1, export_type=None):  # noqa: ARG002
+        error_message = "SubGraphDB is read-only"
+        raise TypeError(error_message)
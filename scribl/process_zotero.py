@@ -2,47 +2,85 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+import collections
 import csv
+import datetime as dt
+import itertools
 import json
 import re
-from io import StringIO
-
-import pandas as pd
-from pyzotero import zotero
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
 
 import scribl
 
+zotero_api_url = "https://api.zotero.org"
+
 
 class ZoteroCSV:
-    def __init__(self, filepath, newline="\n", delimiter=","):
+    # with stream=True records are read lazily from the file by records() instead
+    # of being held in data, and columns (if given) limits which are kept
+    def __init__(
+        self, filepath, newline="\n", delimiter=",", columns=None, stream=False
+    ):
         self.filepath = filepath
         self.newline = newline
         self.delimiter = delimiter
+        self.columns = columns
+        self.stream = stream
         self.data = {}
         self.keymap = None
         self.nrecords = 0
         self.errors = []
         with open(filepath, encoding="utf-8-sig") as csvfile:
-            rows = []
             csvreader = csv.reader(csvfile, delimiter=self.delimiter)
-            for row in csvreader:
-                rows.append(row)
-            self.keys = rows[0]
-            for row in rows[1:]:
-                this_key = row[0]
-                self.data[this_key] = {"Key": this_key}
-                self.nrecords += 0
-                for n in range(1, len(row)):
-                    if len(row[n]) > 0:
-                        # remove any quotation marks
-                        row[n] = row[n].replace('"', "")
-                        self.data[this_key][self.keys[n]] = row[n]
-                    else:
-                        self.data[this_key][self.keys[n]] = "none"
+            self.keys = next(csvreader)
+            if not stream:
+                for this_key, record in self.read_records(csvreader):
+                    self.data[this_key] = record
         self.map_keys(
             scribl.default_keymap["zotero_keys"], scribl.default_keymap["cypher_keys"]
         )
 
+    def read_records(self, csvreader):
+        # only the projected columns are copied out of each row
+        indices = [
+            n
+            for n in range(1, len(self.keys))
+            if self.columns is None or self.keys[n] in self.columns
+        ]
+        for row in csvreader:
+            this_key = row[0]
+            record = {"Key": this_key}
+            for n in indices:
+                if n >= len(row):
+                    break
+                if len(row[n]) > 0:
+                    # remove any quotation marks
+                    record[self.keys[n]] = row[n].replace('"', "")
+                else:
+                    record[self.keys[n]] = "none"
+            yield this_key, record
+
+    def records(self):
+        # (key, record) pairs, in file order
+        if not self.stream:
+            yield from self.data.items()
+            return
+        with open(self.filepath, encoding="utf-8-sig") as csvfile:
+            csvreader = csv.reader(csvfile, delimiter=self.delimiter)
+            next(csvreader)
+            yield from self.read_records(csvreader)
+
     def map_keys(self, zotero_keys, cypher_keys):
         # enforce essential index key mapping
         if zotero_keys[0] != "Key" and cypher_keys[0] == "zotero_key":
@@ -60,6 +98,166 @@ class ZoteroCSV:
         return
 
 
+class ZoteroSQLite:
+    # reads top-level items straight from the Zotero desktop database, records
+    # have the same shape (column names, "none" for missing values) as ZoteroCSV
+    excluded_item_types = ("note", "attachment", "annotation")
+    batch_size = 500
+
+    def __init__(self, filepath, columns=None, stream=False, library_id=None):
+        self.filepath = filepath
+        self.columns = columns
+        self.stream = stream
+        self.library_id = library_id
+        self.data = {}
+        self.keymap = None
+        # zotero keeps the live database locked, so work on a read-only copy
+        self.copy_dir = tempfile.mkdtemp(prefix="scribl_zotero_")
+        self._cleanup = weakref.finalize(
+            self, shutil.rmtree, self.copy_dir, ignore_errors=True
+        )
+        self.copy_path = Path(self.copy_dir) / "zotero.sqlite"
+        shutil.copyfile(filepath, self.copy_path)
+        wal_path = Path(str(filepath) + "-wal")
+        if wal_path.exists():
+            shutil.copyfile(wal_path, str(self.copy_path) + "-wal")
+        with closing(self.connect()) as connection:
+            tables = {
+                row[0]
+                for row in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )
+            }
+            # custom fields live in fieldsCombined in current Zotero versions
+            self.fields_table = (
+                "fieldsCombined" if "fieldsCombined" in tables else "fields"
+            )
+            field_names = [
+                row[0]
+                for row in connection.execute(
+                    f"SELECT fieldName FROM {self.fields_table} ORDER BY fieldID"
+                )
+            ]
+        self.keys = ["Key", "Item Type", "Publication Year", "Author"]
+        for field_name in field_names:
+            key = normalize_zotero_col_headers(field_name)
+            if key not in self.keys:
+                self.keys.append(key)
+        self.keys += ["Date Added", "Date Modified", "Manual Tags", "Automatic Tags"]
+        if not stream:
+            for this_key, record in self.records():
+                self.data[this_key] = record
+        self.map_keys(
+            scribl.default_keymap["zotero_keys"], scribl.default_keymap["cypher_keys"]
+        )
+
+    map_keys = ZoteroCSV.map_keys
+
+    def connect(self):
+        return sqlite3.connect(f"file:{self.copy_path}?mode=ro", uri=True)
+
+    def close(self):
+        self._cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def records(self, modified_since=None):
+        # (key, record) pairs in item order, optionally only the items modified
+        # after modified_since (a datetime or Zotero "YYYY-MM-DD HH:MM:SS" UTC)
+        if not self.stream and modified_since is None and self.data:
+            yield from self.data.items()
+            return
+        if isinstance(modified_since, dt.datetime):
+            modified_since = modified_since.strftime("%Y-%m-%d %H:%M:%S")
+        query = """SELECT items.itemID, items.key, itemTypes.typeName,
+            items.dateAdded, items.dateModified FROM items
+            JOIN itemTypes ON itemTypes.itemTypeID = items.itemTypeID
+            WHERE itemTypes.typeName NOT IN (?, ?, ?)
+            AND items.itemID NOT IN (SELECT itemID FROM deletedItems)"""
+        parameters = list(self.excluded_item_types)
+        if self.library_id is not None:
+            query += " AND items.libraryID = ?"
+            parameters.append(self.library_id)
+        if modified_since is not None:
+            query += " AND items.dateModified > ?"
+            parameters.append(modified_since)
+        query += " ORDER BY items.itemID"
+        with closing(self.connect()) as connection:
+            items = connection.execute(query, parameters)
+            while True:
+                batch = items.fetchmany(self.batch_size)
+                if len(batch) == 0:
+                    break
+                yield from self.read_batch(connection, batch)
+
+    def read_batch(self, connection, batch):
+        # fields, creators and tags of a batch of items, by primary key lookups
+        item_ids = [row[0] for row in batch]
+        placeholders = ", ".join("?" * len(item_ids))
+        fields = {item_id: {} for item_id in item_ids}
+        for item_id, field_name, value in connection.execute(
+            f"""SELECT itemData.itemID, f.fieldName, itemDataValues.value
+            FROM itemData JOIN {self.fields_table} AS f ON f.fieldID = itemData.fieldID
+            JOIN itemDataValues ON itemDataValues.valueID = itemData.valueID
+            WHERE itemData.itemID IN ({placeholders})""",
+            item_ids,
+        ):
+            fields[item_id][field_name] = str(value)
+        authors = {item_id: [] for item_id in item_ids}
+        for item_id, first_name, last_name, field_mode in connection.execute(
+            f"""SELECT itemCreators.itemID, creators.firstName, creators.lastName,
+            creators.fieldMode FROM itemCreators
+            JOIN creators ON creators.creatorID = itemCreators.creatorID
+            JOIN creatorTypes ON creatorTypes.creatorTypeID = itemCreators.creatorTypeID
+            WHERE itemCreators.itemID IN ({placeholders})
+            AND creatorTypes.creatorType = 'author'
+            ORDER BY itemCreators.itemID, itemCreators.orderIndex""",
+            item_ids,
+        ):
+            if field_mode == 1 or not first_name:
+                authors[item_id].append(last_name)
+            else:
+                authors[item_id].append(f"{last_name}, {first_name}")
+        tags = {item_id: ([], []) for item_id in item_ids}
+        for item_id, name, tag_type in connection.execute(
+            f"""SELECT itemTags.itemID, tags.name, itemTags.type FROM itemTags
+            JOIN tags ON tags.tagID = itemTags.tagID
+            WHERE itemTags.itemID IN ({placeholders})
+            ORDER BY itemTags.itemID, tags.name""",
+            item_ids,
+        ):
+            tags[item_id][1 if tag_type == 1 else 0].append(name)
+        for item_id, item_key, item_type, date_added, date_modified in batch:
+            values = {
+                "Item Type": item_type,
+                "Author": "; ".join(authors[item_id]),
+                "Date Added": date_added,
+                "Date Modified": date_modified,
+                "Manual Tags": "; ".join(tags[item_id][0]),
+                "Automatic Tags": "; ".join(tags[item_id][1]),
+            }
+            for field_name, value in fields[item_id].items():
+                values[normalize_zotero_col_headers(field_name)] = value
+            # zotero stores dates as "YYYY-MM-DD original", like "2016-04-00 2016-04"
+            date = values.get("Date", "")
+            if re.match(r"\d{4}-\d{2}-\d{2} ", date):
+                values["Date"] = date[11:]
+            if re.match(r"\d{4}", date) and date[:4] != "0000":
+                values["Publication Year"] = date[:4]
+            record = {"Key": item_key}
+            for key in self.keys[1:]:
+                if self.columns is not None and key not in self.columns:
+                    continue
+                value = values.get(key, "")
+                # remove any quotation marks, as for the CSV export
+                record[key] = value.replace('"', "") if len(value) > 0 else "none"
+            yield item_key, record
+
+
 def normalize_zotero_col_headers(x):
     # add spaces in between capital letters
     space_str = re.sub(r"([a-z0-9_])([A-Z])", r"\1 \2", x)
@@ -67,44 +265,331 @@ def normalize_zotero_col_headers(x):
     return space_str[0].upper() + space_str[1:]
 
 
-def zotero_library_to_csv(
-    library_id, library_type, api_key=None, zotero_csv_filename=None, verbose=False
-):
-    zot = zotero.Zotero(library_id, library_type, api_key)
-    items = zot.top()  # top(limit=2)
-    zotero_list = []
-
-    for item in items:
-        # flatten 'creators' into 'author' field
-        item["data"]["author"] = ";".join(
-            [
-                tag_item["name"]
-                if "name" in tag_item
-                else tag_item["lastName"] + ", " + tag_item["firstName"]
-                for tag_item in item["data"]["creators"]
-            ]
-        )
-        # delete original 'creators'
-        del item["data"]["creators"]
+def zotero_item_to_record(item_data):
+    # flatten the "data" of a Zotero API item into CSV-style columns, the same
+    # way zotero_library_to_csv does
+    data = dict(item_data)
+    data["author"] = ";".join(
+        [
+            creator["name"]
+            if "name" in creator
+            else creator.get("lastName", "") + ", " + creator.get("firstName", "")
+            for creator in data.pop("creators", [])
+        ]
+    )
+    data["manualTags"] = "; ".join([tag["tag"] for tag in data.pop("tags", [])])
+    data["publicationYear"] = data.pop("date", "")
+    return {
+        normalize_zotero_col_headers(key): "" if value is None else str(value)
+        for key, value in data.items()
+    }
+
+
+class ZoteroLibraryChanged(Exception):
+    # the library changed while its pages were being fetched, so page offsets
+    # may have shifted and the fetch has to start again
+    pass
+
 
-        # flatten tags
-        item["data"]["manualTags"] = "; ".join(
-            [tag_item["tag"] for tag_item in item["data"]["tags"]]
+class ZoteroAPI:
+    # minimal client for the versioned reads of the Zotero web API (v3), pages
+    # after the first are fetched concurrently by a bounded pool of threads,
+    # honouring the server's Backoff/Retry-After and retrying failed requests
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        library_id,
+        library_type,
+        api_key=None,
+        base_url=zotero_api_url,
+        page_size=100,
+        timeout=60,
+        workers=4,
+        retries=5,
+        retry_delay=1.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.prefix = f"/{library_type}s/{library_id}"
+        self.api_key = api_key
+        self.page_size = page_size
+        self.timeout = timeout
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.last_modified_version = None
+        self.nrequests = 0
+        # no request is sent before backoff_until (a time.monotonic() time)
+        self.backoff_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait_for_backoff(self):
+        while True:
+            with self.lock:
+                delay = self.backoff_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def back_off(self, seconds):
+        with self.lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + seconds)
+
+    def get(self, path, params=None, headers=None):
+        url = self.base_url + self.prefix + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = {"Zotero-API-Version": "3", **(headers or {})}
+        if self.api_key:
+            headers["Zotero-API-Key"] = self.api_key
+        request = urllib.request.Request(url, headers=headers)
+        attempt = 0
+        while True:
+            self.wait_for_backoff()
+            with self.lock:
+                self.nrequests += 1
+            retry_after = None
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    if "Backoff" in response.headers:
+                        self.back_off(float(response.headers["Backoff"]))
+                    return json.load(response), response.headers
+            except urllib.error.HTTPError as error:
+                if error.code not in self.retry_statuses or attempt >= self.retries:
+                    raise
+                retry_after = error.headers.get("Retry-After")
+                if retry_after is None:
+                    retry_after = error.headers.get("Backoff")
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt >= self.retries:
+                    raise
+            if retry_after is not None:
+                self.back_off(float(retry_after))
+            else:
+                time.sleep(self.retry_delay * 2**attempt)
+            attempt += 1
+
+    def top_items(self, since=0):
+        # top-level items modified after library version `since`, streamed in
+        # page order, trashed items are included (flagged "deleted") so they
+        # can be dropped, raises ZoteroLibraryChanged if the library changes
+        # while the pages are fetched (their offsets would have shifted)
+        params = {
+            "since": since,
+            "format": "json",
+            "includeTrashed": 1,
+            "limit": self.page_size,
+        }
+        items, headers = self.get("/items/top", dict(params, start=0))
+        # the version at the first page is the one the sync is good to, the
+        # later pages must be of the same version
+        version = int(headers["Last-Modified-Version"])
+        self.last_modified_version = version
+
+        def get_page(start):
+            error_message = (
+                f"{self.prefix} changed from version {version} during the fetch"
+            )
+            try:
+                page_items, page_headers = self.get(
+                    "/items/top",
+                    dict(params, start=start),
+                    headers={"If-Unmodified-Since-Version": str(version)},
+                )
+            except urllib.error.HTTPError as error:
+                # 412 Precondition Failed, the library is past version
+                if error.code == 412:
+                    raise ZoteroLibraryChanged(error_message) from error
+                raise
+            if int(page_headers["Last-Modified-Version"]) != version:
+                raise ZoteroLibraryChanged(error_message)
+            return page_items, page_headers
+
+        yield from items
+        total = int(headers.get("Total-Results", len(items)))
+        starts = iter(range(len(items), total, self.page_size))
+        if len(items) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # keep a bounded number of pages in flight ahead of the consumer
+            pending = collections.deque()
+            for start in itertools.islice(starts, self.workers * 2):
+                pending.append(executor.submit(get_page, start))
+            while pending:
+                items, headers = pending.popleft().result()
+                for start in itertools.islice(starts, 1):
+                    pending.append(executor.submit(get_page, start))
+                yield from items
+
+    def deleted_items(self, since):
+        # keys of items deleted after library version `since`
+        deleted, _ = self.get("/deleted", {"since": since})
+        return deleted.get("items", [])
+
+
+class ZoteroItemCache:
+    # local copy of a Zotero library's items (their API "data"), kept in step
+    # with the library by sync() and read like ZoteroCSV by records(), with
+    # cache_dirpath=None the items are only held in memory
+    cache_filename = "zotero_items.json"
+
+    def __init__(self, cache_dirpath, columns=None, stream=False):
+        self.cache_dirpath = None
+        self.cache_filepath = None
+        if cache_dirpath is not None:
+            self.cache_dirpath = Path(cache_dirpath)
+            self.cache_filepath = self.cache_dirpath / self.cache_filename
+        self.columns = columns
+        self.stream = stream
+        self.library = None
+        self.version = 0
+        self.items = {}
+        self.data = {}
+        self.keymap = None
+        if self.cache_filepath is not None and self.cache_filepath.exists():
+            with open(self.cache_filepath, encoding="utf-8") as cachefile:
+                cache = json.load(cachefile)
+            self.library = cache["library"]
+            self.version = cache["version"]
+            self.items = cache["items"]
+        self.update_keys()
+
+    map_keys = ZoteroCSV.map_keys
+
+    def update_keys(self):
+        # columns are the union over all items, in the order first seen
+        keys = {"Key": None}
+        for item_data in self.items.values():
+            for key in item_data:
+                if key == "creators":
+                    key = "author"  # noqa: PLW2901
+                elif key == "tags":
+                    key = "manualTags"  # noqa: PLW2901
+                elif key == "date":
+                    key = "publicationYear"  # noqa: PLW2901
+                keys[normalize_zotero_col_headers(key)] = None
+        self.keys = list(keys)
+        if not self.stream:
+            self.data = dict(self.records())
+        self.map_keys(
+            scribl.default_keymap["zotero_keys"], scribl.default_keymap["cypher_keys"]
         )
-        # delete original 'tags'
-        del item["data"]["tags"]
 
-        # convert 'date' -> 'publicationYear'
-        item["data"]["publicationYear"] = item["data"]["date"]
-        del item["data"]["date"]
+    def records(self):
+        # (key, record) pairs with the same shape as ZoteroCSV.data
+        if not self.stream and self.data:
+            yield from self.data.items()
+            return
+        for item_key, item_data in self.items.items():
+            values = zotero_item_to_record(item_data)
+            record = {"Key": item_key}
+            for key in self.keys[1:]:
+                if self.columns is not None and key not in self.columns:
+                    continue
+                value = values.get(key, "")
+                # remove any quotation marks, as for the CSV export
+                record[key] = value.replace('"', "") if len(value) > 0 else "none"
+            yield item_key, record
+
+    def sync(self, api, verbose=False):
+        # fetch only what changed since the cached library version
+        if self.library not in (None, api.prefix):
+            error_message = (
+                f"Item cache is for library {self.library}, not {api.prefix}"
+            )
+            raise ValueError(error_message)
+        since = self.version
+        # pages are streamed into a staging dict (item data, or None for an
+        # item in the trash) that is only applied to the cache once the whole
+        # fetch is consistent, a library changed during the fetch is fetched
+        # again from the start, as items may have been skipped when the page
+        # offsets shifted
+        for attempt in itertools.count():
+            staged = {}
+            try:
+                for item in api.top_items(since=since):
+                    staged[item["key"]] = (
+                        None if item["data"].get("deleted") else item["data"]
+                    )
+                break
+            except ZoteroLibraryChanged:
+                if attempt >= api.retries:
+                    raise
+                if verbose:
+                    print(f"{api.prefix} changed during the sync, starting again")
+        updated = []
+        deleted = []
+        for item_key, item_data in staged.items():
+            if item_data is None:
+                if self.items.pop(item_key, None) is not None:
+                    deleted.append(item_key)
+                continue
+            self.items[item_key] = item_data
+            updated.append(item_key)
+        if since > 0:
+            for item_key in api.deleted_items(since):
+                if self.items.pop(item_key, None) is not None:
+                    deleted.append(item_key)
+        self.library = api.prefix
+        self.version = api.last_modified_version
+        self.save()
+        self.data = {}
+        self.update_keys()
+        if verbose:
+            print(
+                f"Synced {api.prefix} to version {self.version}: "
+                f"{len(updated)} items updated, {len(deleted)} deleted"
+            )
+        return {"updated": updated, "deleted": deleted, "version": self.version}
 
-        zotero_list.append(item["data"])
+    def save(self):
+        # written to a temporary file first, so an interrupted sync can't
+        # leave a truncated cache behind
+        if self.cache_filepath is None:
+            return
+        self.cache_dirpath.mkdir(parents=True, exist_ok=True)
+        temp_filepath = self.cache_filepath.with_suffix(".tmp")
+        with open(temp_filepath, "w", encoding="utf-8") as cachefile:
+            json.dump(
+                {"library": self.library, "version": self.version, "items": self.items},
+                cachefile,
+            )
+        temp_filepath.replace(self.cache_filepath)
 
-    json_zotero_output = json.dumps(zotero_list)
-    zotero_df = pd.read_json(StringIO(json_zotero_output))
-    zotero_df.columns = [normalize_zotero_col_headers(col) for col in zotero_df.columns]
-    if verbose:
-        print(zotero_df.columns)
 
-    # generate intermediate CSV file
-    zotero_df.to_csv(zotero_csv_filename, encoding="utf-8", index=False)
+def write_zotero_csv(zotero_db, zotero_csv_filename):
+    # write the records of a Zotero source as a CSV export that ZoteroCSV reads
+    with open(zotero_csv_filename, "w", encoding="utf-8", newline="") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(zotero_db.keys)
+        for _, record in zotero_db.records():
+            csvwriter.writerow([record.get(key, "none") for key in zotero_db.keys])
+
+
+def zotero_library_records(
+    library_id, library_type, api_key=None, base_url=zotero_api_url, verbose=False
+):
+    # fetch a whole library into memory as a source GraphDB can read directly
+    api = ZoteroAPI(library_id, library_type, api_key, base_url=base_url)
+    zotero_db = ZoteroItemCache(None)
+    zotero_db.sync(api, verbose=verbose)
+    return zotero_db
+
+
+def zotero_library_to_csv(
+    library_id,
+    library_type,
+    api_key=None,
+    zotero_csv_filename=None,
+    verbose=False,
+    base_url=zotero_api_url,
+):
+    zotero_db = zotero_library_records(
+        library_id, library_type, api_key, base_url=base_url, verbose=verbose
+    )
+    if verbose:
+        print(zotero_db.keys)
+    # archive the library as a CSV export, if a filename is given
+    if zotero_csv_filename is not None:
+        write_zotero_csv(zotero_db, zotero_csv_filename)
+    return zotero_db
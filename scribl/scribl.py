@@ -7,6 +7,7 @@ __author__ = "Amber Biology"
 # it illustrates how to use the GraphDBInstance features in your own Python code, to create,
 # update, and examine a scribl DB
 
+import re
 import sys
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 from pathlib import Path
@@ -75,6 +76,12 @@ def main(argv=sys.argv):
         help="If accessing a private Zotero library, use this API_KEY. ",
         default=None,
     )
+    gp_zotero_api.add_argument(
+        "--sync",
+        help="incrementally sync the library into a local item cache in the graph DB, fetching only items changed since the last sync",
+        action="store_true",
+        default=False,
+    )
 
     gp_outputs = parser.add_argument_group("Optional generated outputs")
     gp_outputs.add_argument(
@@ -83,6 +90,40 @@ def main(argv=sys.argv):
         default=None,
         required=False,
     )
+    gp_outputs.add_argument(
+        "--cypher-diff-file",
+        help="optional path to Cypher text output file with the additions and removals since the last snapshot",
+        default=None,
+        required=False,
+    )
+    gp_outputs.add_argument(
+        "--cypher-batch-size",
+        metavar="N",
+        help="write Cypher output as UNWIND statements of up to N nodes or relationships each, instead of one statement per node or relationship",
+        type=int,
+        default=None,
+        required=False,
+    )
+    gp_outputs.add_argument(
+        "--cypher-constraints",
+        help="start Cypher output with uniqueness constraints on the node keys and names, so the target database can index them",
+        action="store_true",
+        default=False,
+    )
+    gp_outputs.add_argument(
+        "--cypher-transaction-rows",
+        metavar="N",
+        help="run each batched Cypher statement in transactions of N rows, needs --cypher-batch-size",
+        type=int,
+        default=None,
+        required=False,
+    )
+    gp_outputs.add_argument(
+        "--bulk-import-dir",
+        help="optional path to a folder for CSV files (and the import.sh command) for an initial neo4j-admin database import",
+        default=None,
+        required=False,
+    )
     gp_outputs.add_argument(
         "--graphmlfile",
         help="optional path to GraphML output file",
@@ -95,6 +136,71 @@ def main(argv=sys.argv):
         default=None,
         required=False,
     )
+    gp_outputs.add_argument(
+        "--figure-layout",
+        help="layout of the NetworkX figure, spectral scales better to large graphs, spring node positions are kept between runs",
+        choices=["spring", "spectral"],
+        default="spring",
+    )
+    gp_outputs.add_argument(
+        "--figure-edge-label-limit",
+        metavar="N",
+        help="only draw edge labels in the NetworkX figure for graphs with at most N edges",
+        type=int,
+        default=500,
+    )
+
+    gp_outputs.add_argument(
+        "--figures-dir",
+        help="optional path to a folder for one NetworkX figure (PNG) per category, and per agent in --figure-agents, drawn by --jobs worker processes",
+        default=None,
+        required=False,
+    )
+    gp_outputs.add_argument(
+        "--figure-agents",
+        metavar="AGENT",
+        nargs="+",
+        help="agents to draw a figure of (everything within --subgraph-hops relationships) in --figures-dir",
+        default=None,
+    )
+
+    gp_subgraph = parser.add_argument_group(
+        "Optional subgraph, exported instead of the whole graph to the Cypher text, GraphML and NetworkX figure outputs"
+    )
+    gp_subgraph.add_argument(
+        "--subgraph-seeds",
+        metavar="NAME",
+        nargs="+",
+        help="entity names or article keys the subgraph is grown from",
+        default=None,
+    )
+    gp_subgraph.add_argument(
+        "--subgraph-hops",
+        metavar="N",
+        help="include everything within N relationships of the seeds",
+        type=int,
+        default=1,
+    )
+    gp_subgraph.add_argument(
+        "--subgraph-category",
+        metavar="CATEGORY",
+        nargs="+",
+        help="only go through articles in these categories (the seeds, if none are given)",
+        default=None,
+    )
+    gp_subgraph.add_argument(
+        "--subgraph-rtypes",
+        metavar="RTYPE",
+        nargs="+",
+        help="only follow these relationship types, e.g. BINDS MODIFIES",
+        default=None,
+    )
+    gp_subgraph.add_argument(
+        "--subgraph-years",
+        metavar="START:END",
+        help="only go through articles published in these years (inclusive, either can be left out, e.g. '2015:')",
+        default=None,
+    )
 
     gp_checks = parser.add_argument_group("Optional checks")
     gp_checks.add_argument(
@@ -110,6 +216,25 @@ def main(argv=sys.argv):
     parser.add_argument(
         "-v", "--verbose", help="output verbosity", action="store_true", default=False
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of worker processes used to parse Zotero articles and draw --figures-dir figures",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--stream",
+        help="stream the Zotero CSV, keeping only the mapped columns in memory",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="update the graph DB from its last snapshot, only re-processing the articles added, removed or changed since",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument(
         "--overwrite",
         help="overwrite any existing database",
@@ -135,6 +260,13 @@ def main(argv=sys.argv):
 
     # path to optional output files
     cyphertext_filename = args.cyphertextfile
+    cypher_diff_filename = args.cypher_diff_file
+    cypher_options = {
+        "batch_size": args.cypher_batch_size,
+        "constraints": args.cypher_constraints,
+        "transaction_rows": args.cypher_transaction_rows,
+    }
+    bulk_import_dir = args.bulk_import_dir
     graphml_filename = args.graphmlfile
     networkx_fig = args.networkx_fig
 
@@ -143,6 +275,8 @@ def main(argv=sys.argv):
 
     overwrite = args.overwrite
     verbosity = args.verbose
+    jobs = args.jobs
+    stream = args.stream
 
     if args.zotero_library:
         try:
@@ -157,9 +291,39 @@ def main(argv=sys.argv):
             )
     elif args.zotero_api_key and not args.zotero_library:
         parser.error("--zotero-api-key only valid if --zotero-library also supplied")
+    elif args.sync and not args.zotero_library:
+        parser.error("--sync only valid if --zotero-library also supplied")
     else:
         zotero_library_id, zotero_library_type, zotero_api_key = None, None, None
 
+    if args.figure_agents and not args.figures_dir:
+        parser.error("--figure-agents only valid if --figures-dir also supplied")
+
+    if args.cypher_transaction_rows and not args.cypher_batch_size:
+        parser.error(
+            "--cypher-transaction-rows only valid if --cypher-batch-size also supplied"
+        )
+
+    subgraph_years = None
+    if args.subgraph_years:
+        try:
+            subgraph_years = tuple(
+                int(year) if year else None for year in args.subgraph_years.split(":")
+            )
+        except ValueError:
+            subgraph_years = ()
+        if len(subgraph_years) != 2:
+            parser.error(
+                "--subgraph-years must be two years separated by a colon, either can be left out, e.g. '2015:2020' or '2015:'"
+            )
+    subgraph_options = {
+        "seeds": args.subgraph_seeds,
+        "hops": args.subgraph_hops,
+        "category": args.subgraph_category,
+        "rtypes": args.subgraph_rtypes,
+        "years": subgraph_years,
+    }
+
     # end argument parsing
 
     # initialize (or read from existing) graph DB
@@ -175,25 +339,47 @@ def main(argv=sys.argv):
 
     gdb.set_metadata(db_name, db_curator, db_description)
 
+    summary = None
     if default_zotero_export_path:
         # import locally supplied CSV
         gdb.import_zotero_csv(
             default_zotero_export_path, overwrite=overwrite, verbose=verbosity
         )
+    elif zotero_library_id and zotero_library_type and args.sync:
+        # fetch only what changed since the last sync into the local item cache
+        gdb.sync_zotero_library(
+            zotero_library_id, zotero_library_type, zotero_api_key, verbose=verbosity
+        )
     elif zotero_library_id and zotero_library_type:
-        # get CSV generated from remote library:
-        gdb.import_zotero_library(
+        # load straight from the remote library, archiving it as a CSV export
+        summary = gdb.load_zotero_library(
             zotero_library_id,
             zotero_library_type,
             zotero_api_key,
-            overwrite=overwrite,
+            archive_csv=True,
             verbose=verbosity,
+            workers=jobs,
+            incremental=args.incremental,
         )
     elif verbosity:
         print("no Zotero provided, reading from existing database")
 
-    # load graph DB (and report any warnings and errors)
-    summary = gdb.load_zotero_csv(verbose=verbosity)
+    # load graph DB (and report any warnings and errors), unless it was already
+    # loaded straight from the remote library
+    if summary is None and args.sync:
+        summary = gdb.load_zotero_cache(
+            verbose=verbosity,
+            workers=jobs,
+            incremental=args.incremental,
+            stream=stream,
+        )
+    elif summary is None:
+        summary = gdb.load_zotero_csv(
+            verbose=verbosity,
+            workers=jobs,
+            incremental=args.incremental,
+            stream=stream,
+        )
     if summary:
         print("warnings:", summary[0], "errors:", summary[1])
     else:
@@ -211,6 +397,36 @@ def main(argv=sys.argv):
     # inspect graph DB
     gdb.inspect_db(list_contents=[], contents_length=5)
 
+    # subgraph exported instead of the whole graph
+    subgraph = None
+    if any(
+        subgraph_options[option] is not None
+        for option in ["seeds", "category", "rtypes", "years"]
+    ):
+        try:
+            subgraph = gdb.graphdb.subgraph(**subgraph_options)
+        except ValueError as error:
+            print(error)
+            return -1
+
+    # export the changes since the last snapshot, before it is replaced
+    if cypher_diff_filename:
+        if gdb.get_db_snapshots():
+            changes = gdb.generate_db_changes(verbose=verbosity)
+            gdb.write_cypher_file(
+                cypher_diff_filename,
+                verbose=verbosity,
+                changes=changes,
+                **cypher_options,
+            )
+        else:
+            print("no previous snapshot, exporting the full graph as the diff")
+            gdb.write_cypher_file(
+                cypher_diff_filename,
+                verbose=verbosity,
+                **cypher_options,
+            )
+
     # save graph DB snapshot
     gdb.save_db_snapshot(verbose=verbosity)
 
@@ -219,21 +435,61 @@ def main(argv=sys.argv):
 
     # export cypher text file
     if cyphertext_filename:
-        gdb.export_cypher_text(verbose=verbosity, filepath=cyphertext_filename)
+        gdb.write_cypher_file(
+            cyphertext_filename,
+            verbose=verbosity,
+            subgraph=subgraph,
+            **cypher_options,
+        )
 
         # export diff cypher text
         gdb.generate_db_diff(verbose=verbosity)
 
+    # export neo4j-admin bulk import files
+    if bulk_import_dir:
+        gdb.export_bulk_import(bulk_import_dir, verbose=verbosity)
+
     # backup graph DB
     gdb.backup_db(verbose=verbosity)
 
     if graphml_filename:
         # generate GraphML representation (incomplete)
-        gdb.export_graphml_text(verbose=verbosity, filepath=graphml_filename)
+        gdb.write_graphml_file(graphml_filename, verbose=verbosity, subgraph=subgraph)
 
     if networkx_fig:
         # generate visualization using NetworkX
-        gdb.export_graphml_figure(verbose=verbosity, filepath=networkx_fig)
+        gdb.export_graphml_figure(
+            verbose=verbosity,
+            filepath=networkx_fig,
+            layout=args.figure_layout,
+            edge_label_limit=args.figure_edge_label_limit,
+            subgraph=subgraph,
+        )
+
+    if args.figures_dir:
+        # one figure per category and per agent, named after them
+        figures_dir = Path(args.figures_dir)
+        figures_dir.mkdir(parents=True, exist_ok=True)
+        figures = {}
+        for category in gdb.graphdb.catalog("category"):
+            filename = "category_" + re.sub(r"[^\w.-]+", "_", category) + ".png"
+            figures[figures_dir / filename] = {"category": category}
+        for agent in args.figure_agents or []:
+            if agent not in gdb.graphdb.db["agent"]:
+                print(f"'{agent}' is not an agent in the graph DB")
+                return -1
+            filename = "agent_" + re.sub(r"[^\w.-]+", "_", agent) + ".png"
+            figures[figures_dir / filename] = {
+                "seeds": agent,
+                "hops": args.subgraph_hops,
+            }
+        gdb.export_graphml_figures(
+            figures,
+            verbose=verbosity,
+            workers=jobs,
+            layout=args.figure_layout,
+            edge_label_limit=args.figure_edge_label_limit,
+        )
 
     return 0
 
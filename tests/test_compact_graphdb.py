@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+__author__ = "Amber Biology"
+
+from pathlib import Path
+
+import pytest
+
+from scribl.compact_graphdb import (
+    CompactGraphDB,
+    EdgeList,
+    SymbolTable,
+    compare_memory,
+)
+from scribl.process_graphdb_data import GraphDB
+
+test_data_dir = Path("tests/test_data")
+updated_csv_data = test_data_dir / "zotero_export_2.csv"
+
+
+def test_start():
+    print("\n\nTesting compact graph DB ...")
+
+
+def test_edge_list():
+    print("Testing edge list columns ...")
+    symbols = SymbolTable()
+    edges = EdgeList(symbols, [("a", "b"), ("b", "c")])
+    edges.append(("a", "c"))
+    assert len(edges) == 3
+    assert len(symbols) == 3
+    assert list(edges) == [("a", "b"), ("b", "c"), ("a", "c")]
+    assert edges == [("a", "b"), ("b", "c"), ("a", "c")]
+    assert edges[-1] == ("a", "c")
+    assert edges[1:] == [("b", "c"), ("a", "c")]
+    assert ("b", "c") in edges
+    assert ("c", "b") not in edges
+    assert ("a", "zz") not in edges
+    edges.append(("c", "b"))
+    assert ("c", "b") in edges
+    assert edges.sources.itemsize == 4
+    # the CSR index gives the edges touching an id in edge order, and is
+    # rebuilt after an append
+    assert list(edges.incident_to(symbols.lookup("c"))) == [1, 2, 3]
+    edges.append(("b", "b"))
+    assert list(edges.incident_to(symbols.lookup("b"))) == [0, 1, 3, 4]
+    assert edges.offsets.itemsize == edges.incident.itemsize == 4
+    symbols.intern("d")
+    assert list(edges.incident_to(symbols.lookup("d"))) == []
+
+
+def test_compact_graphdb():
+    print("Testing compact graph DB views ...")
+    gdb = GraphDB(updated_csv_data)
+    cdb = CompactGraphDB(gdb)
+    assert list(cdb.db) == list(gdb.db)
+    assert cdb.catalog("process") == gdb.catalog("process")
+    assert cdb.catalog("BINDS", relationship=True) == gdb.catalog(
+        "BINDS", relationship=True
+    )
+    assert cdb.get("agent", "ulk1")["synonyms"] == ("ulk1", "atg1")
+    for rtype, relations in gdb.db["relationships"].items():
+        assert list(cdb.db["relationships"][rtype]) == list(relations)
+    for agent in gdb.db["agent"]:
+        assert cdb.show_relationships("agent", agent) == gdb.show_relationships(
+            "agent", agent
+        )
+        assert cdb.neighbors(agent) == gdb.neighbors(agent)
+    assert cdb.show_relationships("agent", "bloop") == {}
+    # exporters work unchanged on the compact view
+    assert cdb.generate_cypher() == gdb.generate_cypher()
+    assert cdb.generate_graphml() == gdb.generate_graphml()
+    with pytest.raises(TypeError, match="read-only"):
+        cdb.add_relation("BINDS", ("ulk1", "atg13"))
+
+
+def test_compact_memory(tmp_path):
+    print("Testing compact graph DB memory ...")
+    gdb = GraphDB(updated_csv_data)
+    cdb = CompactGraphDB(gdb)
+    memory = compare_memory(gdb, cdb)
+    assert memory["compact"] < memory["dict_of_lists"] < memory["graphdb"]
+    # snapshots of the compact view load back as the original db
+    cdb.save_db(tmp_path / "compact.dat")
+    assert gdb.load_db(tmp_path / "compact.dat") == gdb.db
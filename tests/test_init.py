@@ -2,6 +2,9 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+import subprocess
+import sys
+
 import scribl
 
 
@@ -99,3 +102,24 @@ def test_default_keymap():
         ],
     }
     assert scribl.default_keymap == ref
+
+
+def test_cli_lazy_imports():
+    print("Testing scribl CLI imports ...")
+    # the plotting libraries must only be imported when they are used, so
+    # that starting the command line tool stays fast (timed by
+    # benchmarks/bench_import_time.py)
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, scribl.scribl; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {module.split(".")[0] for module in result.stdout.split()}
+    assert "scribl" in imported
+    for heavy in ["matplotlib", "networkx", "dateutil"]:
+        assert heavy not in imported
@@ -4,6 +4,7 @@ __author__ = "Amber Biology"
 
 
 import os
+import pickle
 import time
 from pathlib import Path
 from xml.etree import ElementTree as ET  # for GraphML checking
@@ -177,6 +178,15 @@ def test_graphml_generation(sandbox_paths):
     assert type(parsed_xml) is ET.Element  # make sure XML is well-formed
     assert len(parsed_xml.findall("gml:graph/gml:node", ns)) == 154  # total nodes
     assert len(parsed_xml.findall("gml:graph/gml:edge", ns)) == 344  # total nodes
+    # saved to a file, or streamed to one
+    graphml_filepath = test_sandbox_dir / "graphdb.xml"
+    assert gdb.export_graphml_text(filepath=graphml_filepath) == graphml_text
+    with open(graphml_filepath) as graphml_file:
+        assert graphml_file.read() == graphml_text
+    streamed_filepath = test_sandbox_dir / "streamed.xml"
+    assert gdb.write_graphml_file(streamed_filepath) == streamed_filepath
+    with open(streamed_filepath) as graphml_file:
+        assert graphml_file.read() == graphml_text
 
 
 def test_graphdb_backup(sandbox_paths):
@@ -222,6 +232,190 @@ def test_cypher_diff(sandbox_paths):
     assert diff_cypher[-50:] == " MATCH(a1:AGENT)<-[r2:BINDS]-(a2:AGENT) DELETE r2;"
 
 
+def test_cypher_changes(sandbox_paths):
+    print("Testing generation of two sided cypher diff text ...")
+    test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(updated_csv_data)
+    gdb.load_zotero_csv()
+    snapshotpath = gdb.save_db_snapshot()
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    changes = gdb.generate_db_changes(snapshotpath)
+    cypher_filepath = test_sandbox_dir / "changes.cypher"
+    # saved to a file with the text returned, or streamed to the file
+    cypher_text = gdb.export_cypher_text(changes=changes)
+    assert (
+        gdb.export_cypher_text(changes=changes, filepath=cypher_filepath) == cypher_text
+    )
+    with open(cypher_filepath) as cypher_file:
+        assert cypher_file.read() == cypher_text
+    streamed_filepath = test_sandbox_dir / "streamed.cypher"
+    assert (
+        gdb.write_cypher_file(streamed_filepath, changes=changes) == streamed_filepath
+    )
+    with open(streamed_filepath) as cypher_file:
+        assert cypher_file.read() == cypher_text
+    assert cypher_text.count("DETACH DELETE") == 18
+    assert cypher_text.count("DELETE r;") == 51
+    # batched, each relationship type and label is one statement
+    cypher_text = gdb.export_cypher_text(changes=changes, batch_size=500)
+    assert cypher_text.count("DETACH DELETE") == 4
+    assert cypher_text.count("DELETE r;") == 8
+    cypher_text = gdb.export_cypher_text(
+        changes=changes, batch_size=500, constraints=True, transaction_rows=50
+    )
+    assert cypher_text.startswith("CREATE CONSTRAINT article_key IF NOT EXISTS")
+    assert cypher_text.count("IN TRANSACTIONS OF 50 ROWS;") == 12
+    assert cypher_text.count("UNWIND") == 12
+
+
+def test_bulk_import_export(sandbox_paths):
+    print("Testing export of a neo4j-admin bulk import bundle ...")
+    test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    bulk_import_dir = test_sandbox_dir / "bulk_import"
+    command = gdb.export_bulk_import(bulk_import_dir, database="scribl")
+    assert command.endswith(" scribl")
+    assert len(list(Path(bulk_import_dir).iterdir())) == 15
+    with open(bulk_import_dir / "import.sh") as script_file:
+        assert script_file.read().split("\n")[2] == command
+
+
+def test_figure_layout(sandbox_paths):
+    print("Testing cached figure layouts ...")
+    _test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    graph = gdb.graphdb.to_networkx()
+    assert not gdb.figure_layout_folder.exists()
+    pos = gdb.figure_layout(graph)
+    assert len(pos) == graph.number_of_nodes()
+    assert len(list(gdb.figure_layout_folder.iterdir())) == 1
+    # the same graph is not laid out again
+    assert gdb.figure_layout(graph) == pos
+    # nodes already placed keep their positions, new ones are placed around them
+    gdb.import_zotero_csv(updated_csv_data)
+    gdb.load_zotero_csv()
+    updated_graph = gdb.graphdb.to_networkx()
+    updated_pos = gdb.figure_layout(updated_graph)
+    assert len(updated_pos) == updated_graph.number_of_nodes()
+    for node in graph:
+        assert updated_pos[node] == pytest.approx(pos[node])
+    # nodes no longer in the graph DB are dropped from the cache
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    gdb.figure_layout(graph)
+    with open(gdb.figure_layout_folder / "figure_layouts.dat", "rb") as layout_file:
+        layouts = pickle.load(layout_file)
+    assert set(layouts["spring"]) == set(graph)
+    # spectral layouts are computed afresh, and not cached
+    spectral_pos = gdb.figure_layout(graph, layout="spectral")
+    assert len(spectral_pos) == graph.number_of_nodes()
+    assert spectral_pos != gdb.figure_layout(graph)
+    with open(gdb.figure_layout_folder / "figure_layouts.dat", "rb") as layout_file:
+        assert list(pickle.load(layout_file)) == ["spring"]
+    with pytest.raises(ValueError, match="Unknown figure layout"):
+        gdb.figure_layout(graph, layout="circular")
+
+
+def test_subgraph_exports(sandbox_paths):
+    print("Testing subgraph exports ...")
+    _test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    subgraph = gdb.graphdb.subgraph(seeds="c9orf72", hops=2)
+    graphml_text = gdb.export_graphml_text(subgraph=subgraph)
+    assert graphml_text.count("<node ") == 51
+    cypher_text = gdb.export_cypher_text(subgraph=subgraph)
+    assert cypher_text == subgraph.export_cypher_text(subgraph.generate_cypher())
+    assert cypher_text.count("MERGE (:ARTICLE") == 2
+    with pytest.raises(ValueError, match="diff can't be restricted"):
+        gdb.export_cypher_text(
+            changes=gdb.graphdb.generate_db_changes(gdb.graphdb), subgraph=subgraph
+        )
+    # subgraph figures keep the positions of the whole graph figure, and then
+    # the whole graph figure keeps the positions of the subgraph nodes
+    pos = gdb.figure_layout(gdb.graphdb.to_networkx())
+    subgraph_pos = gdb.figure_layout(subgraph.to_networkx())
+    assert subgraph_pos == {node: pos[node] for node in subgraph_pos}
+    new_pos = gdb.figure_layout(gdb.graphdb.to_networkx())
+    assert {node: new_pos[node] for node in subgraph_pos} == subgraph_pos
+    # nodes outside the subgraph keep their positions too
+    assert len(subgraph_pos) < len(pos)
+    assert new_pos == pos
+    with open(gdb.figure_layout_folder / "figure_layouts.dat", "rb") as layout_file:
+        assert pickle.load(layout_file)["spring"] == pos
+
+
+def test_figure_batch(sandbox_paths):
+    print("Testing batches of figures ...")
+    test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    figures = {
+        test_sandbox_dir / "binds.png": {"seeds": "c9orf72", "rtypes": ["BINDS"]},
+        test_sandbox_dir / "als.svg": {"category": "als", "hops": 0},
+    }
+    # serially, and in worker processes loading a snapshot of the graph DB
+    assert gdb.export_graphml_figures(figures) == list(figures)
+    for filepath in figures:
+        assert Path(filepath).stat().st_size > 0
+        Path.unlink(filepath)
+    assert gdb.export_graphml_figures(figures, workers=2) == list(figures)
+    for filepath in figures:
+        assert Path(filepath).stat().st_size > 0
+    # the figures are drawn with the positions of the whole graph
+    pos = gdb.figure_layout(gdb.graphdb.to_networkx())
+    assert len(pos) == gdb.graphdb.to_networkx().number_of_nodes()
+    with pytest.raises(ValueError, match="not an article key or entity name"):
+        gdb.export_graphml_figures({test_sandbox_dir / "x.png": {"seeds": "bloop"}})
+
+
+def test_incremental_load(sandbox_paths):
+    print("Testing incremental loading of a new Zotero export ...")
+    _test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    graphdb = gdb.graphdb
+    gdb.import_zotero_csv(updated_csv_data)
+    gdb.load_zotero_csv(incremental=True)
+    assert gdb.graphdb is graphdb
+    assert len(gdb.graphdb.db["article"]) == 13
+    assert len(gdb.graphdb.db["agent"]) == 85
+
+
+def test_incremental_load_from_snapshot(sandbox_paths, capsys):
+    print("Testing incremental loading from the last snapshot ...")
+    _test_sandbox_dir, test_db_dir = sandbox_paths
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.set_metadata("Test DB", "Amber Biology", "incremental loading")
+    gdb.import_zotero_csv(zotero_csv_data)
+    gdb.load_zotero_csv()
+    gdb.save_db_snapshot()
+    # a new instance (like a new scribl run) updates the saved snapshot
+    gdb = GraphDBInstance(test_db_dir)
+    gdb.import_zotero_csv(updated_csv_data)
+    capsys.readouterr()
+    gdb.load_zotero_csv(verbose=True, incremental=True)
+    output = capsys.readouterr().out
+    assert "Updating graph DB snapshot" in output
+    assert "2 articles added" in output
+    assert "11 articles" not in output
+    assert len(gdb.graphdb.db["article"]) == 13
+    assert len(gdb.graphdb.db["agent"]) == 85
+    rebuilt = GraphDBInstance(test_db_dir)
+    rebuilt.load_zotero_csv()
+    for rtype, relations in rebuilt.graphdb.db["relationships"].items():
+        assert set(gdb.graphdb.db["relationships"][rtype]) == set(relations)
+
+
 def test_inspect_db(sandbox_paths):
     print("Testing inspection of db contents ...")
     test_sandbox_dir, test_db_dir = sandbox_paths
@@ -2,8 +2,15 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+from pathlib import Path
+
+import pytest
+
 import scribl
-from scribl.parse_scribl import ScriblParser
+from scribl.parse_scribl import ScriblParser, StatementCache
+from scribl.process_zotero import ZoteroCSV
+
+test_data_dir = Path("tests") / "test_data"
 
 tags = """
 ::category stress granules; ::category tdp-43 aggregation; ::category als
@@ -133,3 +140,67 @@ def test_parser_tools():
         "errors": 0,
         "warnings": 0,
     }
+
+
+def test_parser_engines():
+    print("Testing fast and pyparsing engine equivalence ...")
+    with pytest.raises(ValueError, match="Unknown parse engine"):
+        ScriblParser(engine="bloop")
+    fast = ScriblParser(engine="fast")
+    reference = ScriblParser(engine="pyparsing")
+    for line in parse_text:
+        fast.reset()
+        fast.parse(line, split_text=scribl.tag_delimiter)
+        reference.reset()
+        reference.parse(line, split_text=scribl.tag_delimiter)
+        assert fast.data == reference.data
+    for csv_filepath in sorted(test_data_dir.glob("*.csv")):
+        zotero_db = ZoteroCSV(csv_filepath)
+        for article_key in zotero_db.data:
+            scribl_text = zotero_db.data[article_key][scribl.zotero_scribl_field]
+            fast.reset()
+            fast.parse(scribl_text, split_text=scribl.tag_delimiter)
+            reference.reset()
+            reference.parse(scribl_text, split_text=scribl.tag_delimiter)
+            assert fast.data == reference.data, (csv_filepath.name, article_key)
+    # statements the fast path can't fully consume fall back to pyparsing
+    line = "::agent rapamycin https://pubchem.ncbi.nlm.nih.gov/compound/5284616"
+    assert fast.parse_statement_fast(line) is None
+    assert fast.parse_statement(line) == reference.parse_statement(line)
+    assert fast.parse_statement_fast("::agent ambra :protein | uvrag, beclin1") is None
+
+
+def test_statement_cache():
+    print("Testing statement cache ...")
+    cache = StatementCache(maxsize=2)
+    sp = ScriblParser(cache=cache)
+    line = "::agent ampk :protein :url https://www.uniprot.org/uniprot/Q9Y478"
+    statement = sp.parse_statement(line)
+    assert statement == ScriblParser().parse_statement(line)
+    assert isinstance(statement[2], tuple)
+    # whitespace differences share one cache entry
+    assert sp.parse_statement(line.replace(" ", "   ")) is statement
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+    # unparsable statements are cached too, and still raise
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Unable to parse"):
+            sp.parse_statement("::categry neuroinflammation")
+    assert cache.info() == {"hits": 2, "misses": 2, "size": 2, "maxsize": 2}
+    # least recently used entry is evicted
+    sp.parse_statement(line)
+    sp.parse_statement("::category als")
+    assert cache.info()["size"] == 2
+    assert StatementCache.normalize(line) in cache.statements
+    assert "::categry neuroinflammation" not in cache.statements
+    # reset() keeps the shared cache, and parse results match an uncached parser
+    sp.reset()
+    assert sp.cache is cache
+    reference = ScriblParser()
+    for text in parse_text:
+        sp.reset()
+        sp.parse(text, split_text=scribl.tag_delimiter)
+        reference.reset()
+        reference.parse(text, split_text=scribl.tag_delimiter)
+        assert sp.data == reference.data
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}
@@ -2,13 +2,27 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+import csv
 import datetime
+import io
+import json
+import math
+import pickle
+from collections.abc import Iterator
 from pathlib import Path
 
 import pytest
 
 import scribl
-from scribl.process_graphdb_data import GraphDB
+from scribl.compact_graphdb import CompactGraphDB
+from scribl.process_graphdb_data import (
+    GraphDB,
+    OrderedSet,
+    cypher_literal,
+    entity_fields,
+    infer_modifies_binds,
+    write_lines,
+)
 
 test_data_dir = Path("tests/test_data")
 test_data_file = "zotero_export_1.csv"
@@ -76,6 +90,88 @@ def test_graphdb_processing():
     assert len(gdb.db["relationships"]["RESOURCE_MENTIONS"]) == 0
 
 
+def test_graphdb_parse_cache():
+    print("Testing graph DB statement cache ...")
+    gdb = GraphDB(updated_csv_data)
+    uncached = GraphDB(updated_csv_data, parse_cache_size=0)
+    assert uncached.parse_cache is None
+    assert gdb.db == uncached.db
+    info = gdb.parse_cache.info()
+    assert info["hits"] == 51
+    assert info["misses"] == 169
+
+
+def test_graphdb_parallel_build():
+    print("Testing parallel graph DB build ...")
+    for csv_data in [zotero_csv_data, updated_csv_data, error_csv_data]:
+        gdb = GraphDB(csv_data)
+        pdb = GraphDB(csv_data, workers=2)
+        assert pickle.dumps(pdb.db) == pickle.dumps(gdb.db)
+    # several read-ahead windows of small chunks
+    parsed = gdb.parse_articles_parallel(
+        gdb.scribl_field, 2, gdb.parse_cache_size, chunk_size=2
+    )
+    assert list(parsed) == list(gdb.parse_articles(gdb.scribl_field))
+
+
+def test_graphdb_streaming_build():
+    print("Testing streaming graph DB build ...")
+    for csv_data in [zotero_csv_data, updated_csv_data, error_csv_data]:
+        gdb = GraphDB(csv_data)
+        sdb = GraphDB(csv_data, stream=True)
+        assert len(sdb.zotero_db.data) == 0
+        assert pickle.dumps(sdb.db) == pickle.dumps(gdb.db)
+        pdb = GraphDB(csv_data, stream=True, workers=2)
+        assert pickle.dumps(pdb.db) == pickle.dumps(gdb.db)
+    sdb = GraphDB(zotero_csv_data, stream=True)
+    sdb.update(updated_csv_data)
+    assert db_content(sdb) == db_content(GraphDB(updated_csv_data))
+
+
+def test_ordered_set():
+    print("Testing ordered set storage ...")
+    items = OrderedSet(["b", "a"])
+    items.add("c")
+    items.append("a")
+    assert list(items) == ["b", "a", "c"]
+    assert items == ["b", "a", "c"]
+    assert items[0] == "b"
+    assert items[-1] == "c"
+    assert items[1:] == ["a", "c"]
+    assert "a" in items
+    assert len(items) == 3
+    items.remove("a")
+    items.discard("zz")
+    assert items == OrderedSet(["b", "c"])
+    with pytest.raises(ValueError, match="not in OrderedSet"):
+        items.remove("zz")
+    assert pickle.loads(pickle.dumps(items)) == items
+    gdb = GraphDB(zotero_csv_data)
+    assert isinstance(gdb.db["relationships"]["BINDS"], OrderedSet)
+    assert isinstance(gdb.db["agent"]["ulk1"]["synonyms"], OrderedSet)
+    assert gdb.db["agent"]["ulk1"]["synonyms"][0] == "ulk1"
+
+
+def test_relationship_inference():
+    print("Testing relationship inference ...")
+    gdb = GraphDB(zotero_csv_data, inference_rules=[])
+    assert len(gdb.db["relationships"]["BINDS"]) == 27
+    assert len(gdb.db["relationships"]["MODIFIES"]) == 7
+    calls = []
+
+    def count_rule(graphdb):
+        calls.append(len(graphdb.db["article"]))
+
+    gdb.infer_relationships(rules=[infer_modifies_binds, count_rule])
+    assert len(gdb.db["relationships"]["BINDS"]) == 34
+    for relation in gdb.db["relationships"]["MODIFIES"]:
+        assert relation in gdb.db["relationships"]["BINDS"]
+    # rules run once, after all articles have been merged
+    assert calls == [11]
+    GraphDB(zotero_csv_data, inference_rules=[infer_modifies_binds, count_rule])
+    assert calls == [11, 11]
+
+
 def test_generate_cypher():
     print("Testing generate cypher ...")
     gdb = GraphDB(zotero_csv_data)
@@ -95,6 +191,274 @@ def test_generate_cypher():
     )
 
 
+def test_generate_batched_cypher():
+    print("Testing generate batched cypher ...")
+    gdb = GraphDB(zotero_csv_data)
+    cypher = gdb.generate_cypher(batch_size=7)
+    # one statement per batch of nodes of a label, or of edges of a type
+    groups = [gdb.db[item_type] for item_type in entity_fields]
+    groups += [gdb.db["article"], *gdb.db["relationships"].values()]
+    assert len(cypher) == sum(math.ceil(len(group) / 7) for group in groups) + 1
+    assert cypher[0].startswith('UNWIND [{key:"9JHZ54TS", zotero_key:"9JHZ54TS", ')
+    assert cypher[0].endswith(" AS row\nMERGE (a:ARTICLE {key:row.key}) SET a += row;")
+    assert cypher[-2].endswith(
+        '["smcr8 expression", "smcr8"], ["ulk1 expression", "ulk1"]] AS row\n'
+        "MATCH (p1:PROCESS {name:row[0]}), (p2:AGENT {name:row[1]})\n"
+        "MERGE (p1)-[:GENERATES]->(p2);"
+    )
+    assert cypher[-1] == gdb.generate_cypher()[-1]
+    # every relation is in exactly one batch
+    binds = [
+        json.loads(statement[7 : statement.index(" AS row")])
+        for statement in cypher
+        if statement.endswith("MERGE (p1)-[:BINDS]->(p2);")
+    ]
+    assert [tuple(row) for batch in binds for row in batch] == list(
+        gdb.db["relationships"]["BINDS"]
+    )
+    # diffs are batched too, changed entities are matched rather than merged
+    ddb = GraphDB(updated_csv_data)
+    cypher = ddb.generate_cypher(diff_db=ddb.generate_db_diff(gdb), batch_size=100)
+    assert len(cypher) == 14
+    assert cypher[4] == (
+        'UNWIND [{name:"ambra", urls:[], tags:[], notes:[], labels:[], '
+        'synonyms:["dup_sym"]}, {name:"caspase-1", urls:[], tags:[], notes:[], '
+        'labels:[], synonyms:["dup_sym"]}] AS row\n'
+        "MATCH (n:AGENT {name:row.name})\n"
+        "SET n.urls = n.urls + row.urls, n.tags = n.tags + row.tags, "
+        "n.notes = n.notes + row.notes, n.labels = n.labels + row.labels, "
+        "n.synonyms = n.synonyms + row.synonyms;"
+    )
+    cypher = gdb.generate_cypher(changes=gdb.generate_db_changes(ddb), batch_size=100)
+    assert cypher[-1] == (
+        'UNWIND ["atp6v1g1 expression", "autophagosome acidification", '
+        '"binding of atp6v1g1 and ubqln2", "chaperone-mediated folding of atp6v1g1", '
+        '"formation of ubqln2 inclusions", "inhibition of ubqln2 expression", '
+        '"p62 co-localizes with ubqln2", "ubqln2 expression", "ubqln2 mutation"] '
+        "AS row\nMATCH (n:PROCESS {name:row}) DETACH DELETE n;"
+    )
+    # literal payloads are escaped
+    assert cypher_literal('say "hi"\\n') == '"say \\"hi\\"\\\\n"'
+    assert cypher_literal({"key": "K", "tags": ["a"]}) == '{key:"K", tags:["a"]}'
+    with pytest.raises(ValueError, match="batch size"):
+        gdb.generate_cypher(batch_size=0)
+
+
+def test_cypher_constraints_and_transactions():
+    print("Testing cypher constraints and transactions ...")
+    gdb = GraphDB(zotero_csv_data)
+    constraints = gdb.generate_constraint_cypher()
+    assert constraints[0] == (
+        "CREATE CONSTRAINT article_key IF NOT EXISTS "
+        "FOR (n:ARTICLE) REQUIRE n.key IS UNIQUE;"
+    )
+    assert len(constraints) == 5
+    cypher = gdb.generate_cypher()
+    cypher_text = gdb.export_cypher_text(cypher, constraints=True)
+    assert cypher_text == "\n".join(constraints + cypher)
+    # batched statements wrapped in transaction subqueries
+    cypher = gdb.generate_cypher(batch_size=1000, transaction_rows=100)
+    batched = gdb.generate_cypher(batch_size=1000)
+    assert len(cypher) == len(batched)
+    assert cypher[-2] == (
+        batched[-2].split("\n")[0] + "\n"
+        "CALL {\n"
+        "  WITH row\n"
+        "  MATCH (p1:PROCESS {name:row[0]}), (p2:AGENT {name:row[1]})\n"
+        "  MERGE (p1)-[:GENERATES]->(p2)\n"
+        "} IN TRANSACTIONS OF 100 ROWS;"
+    )
+    assert cypher[-1] == batched[-1]
+    with pytest.raises(ValueError, match="need a batch size"):
+        gdb.generate_cypher(transaction_rows=100)
+    with pytest.raises(ValueError, match="transaction rows"):
+        gdb.generate_cypher(batch_size=1000, transaction_rows=0)
+
+
+def test_bulk_import(sandbox_paths):
+    print("Testing neo4j-admin bulk import export ...")
+    test_sandbox_dir, _test_db_dir = sandbox_paths
+    gdb = GraphDB(zotero_csv_data)
+    command = gdb.export_bulk_import(test_sandbox_dir)
+    assert command.startswith(
+        "neo4j-admin database import full --array-delimiter='|' "
+        "--multiline-fields=true --nodes=article_nodes.csv --nodes=category_nodes.csv"
+    )
+    assert command.endswith("--relationships=generates_relationships.csv neo4j")
+    # one node per entity, with list fields as string arrays
+    with open(test_sandbox_dir / "agent_nodes.csv", newline="") as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0] == [
+        "name:ID(AGENT)",
+        "urls:string[]",
+        "tags:string[]",
+        "notes:string[]",
+        "labels:string[]",
+        "synonyms:string[]",
+        ":LABEL",
+    ]
+    assert len(rows) == len(gdb.db["agent"]) + 1
+    ulk1 = next(row for row in rows if row[0] == "ulk1")
+    assert ulk1[5].split("|") == list(gdb.db["agent"]["ulk1"]["synonyms"])
+    with open(test_sandbox_dir / "article_nodes.csv", newline="") as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0][:3] == ["key:ID(ARTICLE)", "zotero_key", "title"]
+    assert len(rows) == len(gdb.db["article"]) + 1
+    # relationships, only one direction of a BINDS pair
+    with open(test_sandbox_dir / "relates_relationships.csv", newline="") as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0] == [":START_ID(ARTICLE)", ":END_ID(CATEGORY)", ":TYPE"]
+    assert len(rows) == len(gdb.db["relationships"]["RELATES"]) + 1
+    with open(test_sandbox_dir / "binds_relationships.csv", newline="") as csvfile:
+        rows = list(csv.reader(csvfile))
+    # three pairs of agents bind each other
+    assert len(rows) == len(gdb.db["relationships"]["BINDS"]) + 1 - 3
+    assert not (test_sandbox_dir / "resource_nodes.csv").exists()
+    gdb.db["agent"]["ulk1"]["notes"].add("a|b")
+    with pytest.raises(ValueError, match="Array delimiter"):
+        gdb.generate_bulk_import()
+
+
+def test_streaming_export():
+    print("Testing streaming cypher and GraphML export ...")
+    gdb = GraphDB(zotero_csv_data)
+    # the generators yield the same statements and fragments as the lists
+    assert isinstance(gdb.iter_cypher(), Iterator)
+    assert list(gdb.iter_cypher(batch_size=10)) == gdb.generate_cypher(batch_size=10)
+    assert list(gdb.iter_graphml()) == gdb.generate_graphml()
+    # and write the same text as the string exporters, in chunks
+    for chunk_size in [1, 7, 1000]:
+        output = io.StringIO()
+        write_lines(output, gdb.iter_cypher(), chunk_size=chunk_size)
+        assert output.getvalue() == gdb.export_cypher_text(gdb.generate_cypher())
+    output = io.StringIO()
+    gdb.write_cypher_text(output, gdb.iter_cypher(), constraints=True)
+    cypher_text = gdb.export_cypher_text(gdb.generate_cypher(), constraints=True)
+    assert output.getvalue() == cypher_text
+    output = io.StringIO()
+    gdb.write_graphml_text(output, gdb.iter_graphml())
+    assert output.getvalue() == gdb.export_graphml_text(gdb.generate_graphml())
+    output = io.StringIO()
+    write_lines(output, [])
+    assert output.getvalue() == ""
+
+
+def test_to_networkx():
+    print("Testing NetworkX graph generation ...")
+    gdb = GraphDB(zotero_csv_data)
+    graph = gdb.to_networkx()
+    # every node and edge of the GraphML export, names repeated across types
+    # are kept apart
+    assert graph.number_of_nodes() == 154
+    assert graph.number_of_edges() == 344
+    assert ("CATEGORY", "autophagy") in graph
+    assert ("PROCESS", "autophagy") in graph
+    assert graph.nodes["AGENT", "ulk1"] == {
+        "type": "AGENT",
+        "name": "ulk1",
+        "urls": ["https://www.uniprot.org/uniprot/O75385"],
+        "tags": [],
+        "notes": ["ulk1 is phosphorylated by mtor"],
+        "labels": [":protein"],
+        "synonyms": ["ulk1", "atg1"],
+    }
+    article = graph.nodes["ARTICLE", "9JHZ54TS"]
+    assert article["title"] == "Frontotemporal Dementias"
+    assert article["type"] == "ARTICLE"
+    # edges are keyed by relationship type
+    edges = graph.get_edge_data(("PROCESS", "ulk1 expression"), ("AGENT", "ulk1"))
+    assert edges == {"GENERATES": {"label": "GENERATES"}}
+    binds = [key for _, _, key in graph.edges(keys=True) if key == "BINDS"]
+    assert len(binds) == len(gdb.db["relationships"]["BINDS"])
+    # article fields can't replace the type and name of a node
+    cypher_keys = [
+        "type" if key == "url" else "name" if key == "author" else key
+        for key in scribl.default_keymap["cypher_keys"]
+    ]
+    kdb = GraphDB(zotero_csv_data, cypher_keys=cypher_keys)
+    article = kdb.to_networkx().nodes["ARTICLE", "9JHZ54TS"]
+    assert article["type"] == "ARTICLE"
+    assert article["name"] == "9JHZ54TS"
+    assert article["article_type"] == kdb.db["article"]["9JHZ54TS"]["type"]
+    assert article["article_name"] == kdb.db["article"]["9JHZ54TS"]["name"]
+    # compact graph DBs give the same graph
+    compact_graph = CompactGraphDB(gdb).to_networkx()
+    assert list(compact_graph.nodes(data=True)) == list(graph.nodes(data=True))
+    assert list(compact_graph.edges(keys=True)) == list(graph.edges(keys=True))
+
+
+def test_subgraph():
+    print("Testing subgraph extraction ...")
+    import networkx as nx  # noqa: PLC0415
+
+    gdb = GraphDB(zotero_csv_data)
+    graph = gdb.to_networkx()
+    # the same nodes and edges as a search of the whole graph
+    for hops in [0, 1, 2]:
+        subgraph = gdb.subgraph(seeds="c9orf72", hops=hops).to_networkx()
+        ego_graph = nx.ego_graph(
+            graph.to_undirected(as_view=True), ("AGENT", "c9orf72"), radius=hops
+        )
+        assert set(subgraph.nodes) == set(ego_graph.nodes)
+        assert set(subgraph.edges(keys=True)) == set(
+            graph.subgraph(ego_graph.nodes).edges(keys=True)
+        )
+    sdb = gdb.subgraph(seeds="c9orf72", hops=2)
+    assert len(sdb.db["article"]) == 2
+    assert len(sdb.db["agent"]) == 25
+    assert sdb.get("agent", "c9orf72") == gdb.get("agent", "c9orf72")
+    assert sdb.neighbors("c9orf72") == gdb.neighbors("c9orf72")
+    # only through the articles of a category, or of a range of years
+    sdb = gdb.subgraph(category="c9orf72 pathology")
+    assert len(sdb.db["article"]) == 3
+    for article_key in sdb.db["article"]:
+        assert (article_key, "c9orf72 pathology") in gdb.db["relationships"]["RELATES"]
+    sdb = gdb.subgraph(years=(2015, 2019))
+    assert sorted(sdb.db["article"]) == sorted(gdb.articles_in_years(2015, 2019))
+    assert len(sdb.db["article"]) == 5
+    for article in sdb.db["article"].values():
+        assert 2015 <= int(article["year"]) <= 2019
+    assert gdb.articles_in_years() == gdb.articles_in_years(end=2021)
+    assert len(gdb.articles_in_years()) == len(gdb.db["article"])
+    # years that aren't strings are read too
+    article_key = next(iter(gdb.db["article"]))
+    year = int(gdb.db["article"][article_key]["year"])
+    gdb.db["article"][article_key]["year"] = year
+    gdb.article_years = None
+    assert article_key in gdb.articles_in_years(year, year)
+    assert len(gdb.articles_in_years()) == len(gdb.db["article"])
+    gdb.db["article"][article_key]["year"] = str(year)
+    gdb.article_years = None
+    # only some relationship types
+    sdb = gdb.subgraph(rtypes=["BINDS"])
+    assert set(sdb.db["relationships"]["BINDS"]) == set(
+        gdb.db["relationships"]["BINDS"]
+    )
+    assert sum(len(relations) for relations in sdb.db["relationships"].values()) == 34
+    sdb = gdb.subgraph(seeds=["c9orf72"], rtypes=["BINDS", "MODIFIES"])
+    assert len(sdb.db["agent"]) == 4
+    assert len(sdb.db["process"]) == 0
+    # exporters work on the subgraph
+    sdb = gdb.subgraph(category="c9orf72 pathology")
+    assert len(sdb.generate_cypher()) == 165
+    assert "</graphml>" in sdb.generate_graphml()
+    assert sdb.to_networkx().number_of_nodes() == 57
+    # compact graph DBs give the same subgraph
+    cdb = CompactGraphDB(gdb).subgraph(category="c9orf72 pathology")
+    for item_type in ["article", *entity_fields]:
+        assert set(cdb.db[item_type]) == set(sdb.db[item_type])
+    for rtype, relations in sdb.db["relationships"].items():
+        assert set(cdb.db["relationships"][rtype]) == set(relations)
+    with pytest.raises(TypeError, match="read-only"):
+        sdb.add_relation("BINDS", ("c9orf72", "ulk1"))
+    with pytest.raises(ValueError, match="not an article key or entity name"):
+        gdb.subgraph(seeds="bloop")
+    with pytest.raises(ValueError, match="Unknown relationship type"):
+        gdb.subgraph(rtypes=["HUGS"])
+    with pytest.raises(ValueError, match="hops must be at least 0"):
+        gdb.subgraph(seeds="c9orf72", hops=-1)
+
+
 def test_export_cypher_text():
     print("Testing export cypher ...")
     gdb = GraphDB(zotero_csv_data)
@@ -113,9 +477,15 @@ def test_db_snapshots(sandbox_paths):
     snapshot_filename = f"{now}_db_snapshot.dat"
     snapshot_filepath = test_sandbox_dir / snapshot_filename
     gdb.save_db(snapshot_filepath)
-    assert Path(snapshot_filepath).stat().st_size == 35445
+    assert Path(snapshot_filepath).stat().st_size == 42416
     loaded_snapshot = gdb.load_db(snapshot_filepath)
     assert loaded_snapshot == gdb.db
+    # snapshots keep storing plain lists
+    with open(snapshot_filepath, "rb") as snapshot_file:
+        raw_snapshot = pickle.load(snapshot_file)
+    assert type(raw_snapshot["relationships"]["BINDS"]) is list
+    assert type(raw_snapshot["agent"]["ulk1"]["synonyms"]) is list
+    assert isinstance(loaded_snapshot["agent"]["ulk1"]["synonyms"], OrderedSet)
 
 
 def test_db_diff(sandbox_paths):
@@ -213,6 +583,109 @@ def test_db_diff(sandbox_paths):
     )
 
 
+def test_db_diff_changes():
+    print("Testing generate DB diff of changed entities ...")
+    gdb = GraphDB(zotero_csv_data)
+    ddb = GraphDB(updated_csv_data)
+    db_diff = ddb.generate_db_diff(gdb)
+    # changed entities only hold the values the other db lacks
+    assert db_diff["agent"]["---ambra"] == {
+        "urls": [],
+        "tags": [],
+        "notes": [],
+        "labels": [],
+        "synonyms": ["dup_sym"],
+    }
+    edits = [item for item in db_diff["agent"] if item.startswith("---")]
+    assert edits == ["---ambra", "---caspase-1"]
+    # same content in a different order is not a change
+    odb = GraphDB(zotero_csv_data)
+    synonyms = odb.db["agent"]["ulk1"]["synonyms"]
+    odb.db["agent"]["ulk1"]["synonyms"] = OrderedSet(reversed(synonyms))
+    bindings = odb.db["relationships"]["BINDS"]
+    odb.db["relationships"]["BINDS"] = OrderedSet(reversed(bindings))
+    db_diff = odb.generate_db_diff(gdb)
+    assert "---ulk1" not in db_diff["agent"]
+    assert db_diff["relationships"]["BINDS"] == []
+    # changed article fields hold just the new value
+    article_key = next(iter(odb.db["article"]))
+    odb.db["article"][article_key]["title"] = "A new title"
+    db_diff = odb.generate_db_diff(gdb)
+    assert db_diff["article"] == {f"---{article_key}": {"title": "A new title"}}
+    # a compact copy diffs the same way
+    compact_diff = CompactGraphDB(ddb).generate_db_diff(gdb)
+    assert compact_diff["relationships"] == ddb.generate_db_diff(gdb)["relationships"]
+
+
+def test_db_changes():
+    print("Testing two sided DB diff and removal cypher ...")
+    gdb = GraphDB(zotero_csv_data)
+    ddb = GraphDB(updated_csv_data)
+    # the added side matches the one sided diff
+    changes = ddb.generate_db_changes(gdb)
+    db_diff = ddb.generate_db_diff(gdb)
+    assert changes["added"]["relationships"] == db_diff["relationships"]
+    assert list(changes["added"]["agent"]) == [
+        item for item in db_diff["agent"] if not item.startswith("---")
+    ]
+    assert list(changes["changed"]["agent"]) == ["ambra", "caspase-1"]
+    assert changes["changed"]["agent"]["ambra"]["removed"] == {}
+    assert len(changes["removed"]["article"]) == 0
+    # going back from the updated db removes what it added
+    changes = gdb.generate_db_changes(ddb)
+    assert list(changes["removed"]["article"]) == ["255SUP2B", "EZU4QK8B"]
+    assert len(changes["removed"]["agent"]) == 6
+    assert changes["removed"]["relationships"] == db_diff["relationships"]
+    assert changes["changed"]["agent"]["ambra"]["removed"]["synonyms"] == ["dup_sym"]
+    cypher = gdb.generate_cypher(changes=changes)
+    assert cypher[0] == (
+        'MATCH (p1:ARTICLE {key:"255SUP2B"})-[r:RELATES]->(p2:CATEGORY {name:"als"})'
+        "\nDELETE r;"
+    )
+    assert (
+        'MATCH (n:AGENT {name:"ambra"})\n'
+        'set n.synonyms = [value IN n.synonyms WHERE NOT value IN ["dup_sym"]];'
+    ) in cypher
+    assert 'MATCH (n:ARTICLE {key:"255SUP2B"}) DETACH DELETE n;' in cypher
+    # nothing is added, so there is no BINDS clean up either
+    assert len(cypher) == 71
+    assert not any(statement.startswith("MERGE") for statement in cypher)
+    # changed and dropped article fields
+    odb = GraphDB(zotero_csv_data)
+    article_key = next(iter(odb.db["article"]))
+    odb.db["article"][article_key]["title"] = "A new title"
+    del odb.db["article"][article_key]["url"]
+    cypher = odb.generate_cypher(changes=odb.generate_db_changes(gdb))
+    assert cypher[0] == f'MATCH (n:ARTICLE {{key:"{article_key}"}})\nremove n.url;'
+    assert cypher[1] == (
+        f'MATCH (a:ARTICLE {{key:"{article_key}"}})\nset a.title = "A new title";'
+    )
+    # no changes, no cypher
+    assert gdb.generate_cypher(changes=gdb.generate_db_changes(gdb)) == []
+    # removing one direction of a BINDS pair keeps the edge of the other
+    odb = GraphDB(zotero_csv_data)
+    binds = odb.db["relationships"]["BINDS"]
+    mutual = [relation for relation in binds if (relation[1], relation[0]) in binds]
+    single = [relation for relation in binds if relation not in mutual]
+    odb.remove_relation("BINDS", mutual[0])
+    odb.remove_relation("BINDS", single[0])
+    for batch_size in [None, 10]:
+        cypher = odb.generate_cypher(
+            changes=odb.generate_db_changes(gdb), batch_size=batch_size
+        )
+        deletes = [statement for statement in cypher if ":BINDS]-" in statement]
+        assert len(deletes) == 1
+        assert f'"{single[0][0]}"' in deletes[0]
+        assert f'"{single[0][1]}"' in deletes[0]
+    cypher = odb.generate_cypher(changes=odb.generate_db_changes(gdb))
+    assert cypher == [
+        (
+            f'MATCH (p1:AGENT {{name:"{single[0][0]}"}})-[r:BINDS]-(p2:AGENT {{name:"{single[0][1]}"}})'
+            "\nDELETE r;"
+        )
+    ]
+
+
 def test_db_errors():
     print("Testing DB error handling ...")
     ddb = GraphDB(error_csv_data)
@@ -259,6 +732,150 @@ def test_db_tools():
     print(rel_ulk1)
 
 
+def test_adjacency_index(sandbox_paths):
+    print("Testing adjacency index ...")
+    test_sandbox_dir, _test_db_dir = sandbox_paths
+    gdb = GraphDB(updated_csv_data)
+    # index lookups give the same answer as a full scan of the relationships
+    for item_type in ["category", "agent", "process", "resource"]:
+        for item_name in gdb.db[item_type]:
+            scan = {"search": (item_type, item_name)}
+            for rtype, relations in gdb.db["relationships"].items():
+                scan[rtype] = [
+                    relation for relation in relations if item_name in relation
+                ]
+            assert gdb.show_relationships(item_type, item_name) == scan
+    assert gdb.neighbors("ulk1", rtype="INVOLVES", direction="out") == []
+    assert gdb.neighbors("ulk1", rtype="INVOLVES", direction="in")[0] == (
+        "formation of atg1-atg13 complex"
+    )
+    assert len(gdb.neighbors("ulk1", rtype="INVOLVES")) == 4
+    assert set(gdb.neighbors("ulk1")) == set(
+        gdb.neighbors("ulk1", direction="out") + gdb.neighbors("ulk1", direction="in")
+    )
+    assert gdb.neighbors("bloop") == []
+    with pytest.raises(ValueError, match="Unknown direction"):
+        gdb.neighbors("ulk1", direction="sideways")
+    # index is kept consistent when relationships are removed
+    relation = ("formation of atg1-atg13 complex", "ulk1")
+    gdb.remove_relation("INVOLVES", relation)
+    assert relation not in gdb.db["relationships"]["INVOLVES"]
+    assert relation not in gdb.show_relationships("agent", "ulk1")["INVOLVES"]
+    assert len(gdb.neighbors("ulk1", rtype="INVOLVES")) == 3
+    gdb.add_relation("INVOLVES", relation)
+    assert gdb.show_relationships("agent", "ulk1")["INVOLVES"][-1] == relation
+    # index is rebuilt when loading a snapshot
+    snapshot_filepath = test_sandbox_dir / "adjacency_snapshot.dat"
+    gdb.save_db(snapshot_filepath)
+    odb = GraphDB(snapshot_filepath, export_type=scribl.DB_EXPORT)
+    assert odb.adjacency == gdb.adjacency
+
+
+def test_provenance_index(sandbox_paths):
+    print("Testing provenance index ...")
+    test_sandbox_dir, _test_db_dir = sandbox_paths
+    gdb = GraphDB(updated_csv_data)
+    provenance = gdb.provenance
+    # every entity, field value and relationship is supported by some article
+    for item_type in scribl.statement_types:
+        for item_name, fields in gdb.db[item_type].items():
+            assert provenance.count("entity", (item_type, item_name)) > 0
+            for field, values in fields.items():
+                for value in values:
+                    if field == "synonyms" and value == item_name:
+                        continue
+                    key = (item_type, item_name, field, value)
+                    assert provenance.count("field", key) > 0
+    inferred = 0
+    for rtype, relations in gdb.db["relationships"].items():
+        for relation in relations:
+            if ("relationship", (rtype, relation)) not in provenance:
+                inferred += 1
+    assert inferred == 7
+    # evidence lookups
+    relation = ("formation of atg1-atg13 complex", "ulk1")
+    assert provenance.articles_for("relationship", ("INVOLVES", relation)) == [
+        "NP7Q3SDK"
+    ]
+    assert provenance.count("entity", ("category", "als")) == 8
+    assert provenance.articles_for("entity", ("agent", "ulk1")) == [
+        "NP7Q3SDK",
+        "5PJEZC9C",
+    ]
+    assert provenance.articles_for("entity", ("agent", "bloop")) == []
+    # single-article support is held as a bare article id
+    assert isinstance(
+        provenance.supporters["relationship"][("INVOLVES", relation)], int
+    )
+    # retracting an article reports what nothing supports any more
+    unsupported = provenance.retract("NP7Q3SDK")
+    assert ("INVOLVES", relation) in unsupported["relationship"]
+    assert provenance.count("relationship", ("INVOLVES", relation)) == 0
+    assert provenance.articles_for("entity", ("agent", "ulk1")) == ["5PJEZC9C"]
+    # provenance round trips through a snapshot
+    gdb = GraphDB(updated_csv_data)
+    snapshot_filepath = test_sandbox_dir / "provenance_snapshot.dat"
+    gdb.save_db(snapshot_filepath)
+    odb = GraphDB(snapshot_filepath, export_type=scribl.DB_EXPORT)
+    assert odb.provenance.to_state() == gdb.provenance.to_state()
+    assert odb.provenance.contributions.keys() == gdb.provenance.contributions.keys()
+
+
+def db_content(gdb):
+    # order-insensitive view of a db for comparing differently built DBs
+    content = {"article": gdb.db["article"]}
+    for item_type in scribl.statement_types:
+        content[item_type] = {
+            item_name: {field: set(values) for field, values in fields.items()}
+            for item_name, fields in gdb.db[item_type].items()
+        }
+    for field in ["warnings", "errors"]:
+        content[field] = gdb.db[field]
+    content["relationships"] = {
+        rtype: set(relations) for rtype, relations in gdb.db["relationships"].items()
+    }
+    return content
+
+
+def test_incremental_update(sandbox_paths):
+    print("Testing incremental graph DB update ...")
+    test_sandbox_dir, _test_db_dir = sandbox_paths
+    gdb = GraphDB(zotero_csv_data)
+    summary = gdb.update(updated_csv_data)
+    assert summary["added"] == ["255SUP2B", "EZU4QK8B"]
+    assert summary["removed"] == []
+    assert summary["changed"] == ["NP7Q3SDK", "Y8XLSGBY"]
+    assert db_content(gdb) == db_content(GraphDB(updated_csv_data))
+    # nothing changed, nothing to do
+    assert gdb.update(updated_csv_data) == {"added": [], "removed": [], "changed": []}
+    # removed articles are retracted along with everything only they support
+    summary = gdb.update(zotero_csv_data, workers=2)
+    assert summary["removed"] == ["255SUP2B", "EZU4QK8B"]
+    fresh = GraphDB(zotero_csv_data)
+    assert db_content(gdb) == db_content(fresh)
+    for item_name in ["ulk1", "atg13"]:
+        assert set(gdb.neighbors(item_name)) == set(fresh.neighbors(item_name))
+    # articles with errors are re-parsed in place once fixed, and vice versa
+    gdb = GraphDB(error_csv_data)
+    assert len(gdb.db["errors"]) == 3
+    gdb.update(zotero_csv_data)
+    assert len(gdb.db["errors"]) == 0
+    assert db_content(gdb) == db_content(GraphDB(zotero_csv_data))
+    gdb.update(error_csv_data)
+    assert db_content(gdb) == db_content(GraphDB(error_csv_data))
+    # provenance is saved with snapshots, so a loaded snapshot can be updated
+    snapshot_filepath = test_sandbox_dir / "update_snapshot.dat"
+    gdb.save_db(snapshot_filepath)
+    odb = GraphDB(snapshot_filepath, export_type=scribl.DB_EXPORT)
+    odb.update(updated_csv_data)
+    assert db_content(odb) == db_content(GraphDB(updated_csv_data))
+    odb.provenance = None
+    odb.save_db(snapshot_filepath)
+    odb = GraphDB(snapshot_filepath, export_type=scribl.DB_EXPORT)
+    with pytest.raises(ValueError, match="no provenance"):
+        odb.update(zotero_csv_data)
+
+
 def test_synonym_checking():
     print("Testing synonym checking ...")
     gdb = GraphDB(updated_csv_data)
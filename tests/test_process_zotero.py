@@ -2,13 +2,139 @@ from __future__ import annotations
 
 __author__ = "Amber Biology"
 
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
-from scribl.process_zotero import ZoteroCSV
+import pytest
+
+import scribl
+from scribl.manage_graphdb import GraphDBInstance
+from scribl.process_graphdb_data import GraphDB
+from scribl.process_zotero import (
+    ZoteroAPI,
+    ZoteroCSV,
+    ZoteroItemCache,
+    ZoteroLibraryChanged,
+    ZoteroSQLite,
+    zotero_library_records,
+    zotero_library_to_csv,
+)
 
 test_data_dir = "tests/test_data"
 test_data_file = "2022_01_03_171311_zotero_data.csv"
 zotero_csv_data = Path(test_data_dir) / test_data_file
+graphdb_csv_data = Path(test_data_dir) / "zotero_export_1.csv"
+
+# the parts of the Zotero desktop database schema that scribl reads
+zotero_sqlite_schema = """
+CREATE TABLE itemTypes (itemTypeID INTEGER PRIMARY KEY, typeName TEXT);
+CREATE TABLE fieldsCombined (fieldID INTEGER PRIMARY KEY, fieldName TEXT);
+CREATE TABLE items (itemID INTEGER PRIMARY KEY, itemTypeID INT, dateAdded TEXT,
+    dateModified TEXT, libraryID INT, key TEXT);
+CREATE INDEX items_dateModified ON items(dateModified);
+CREATE TABLE itemDataValues (valueID INTEGER PRIMARY KEY, value UNIQUE);
+CREATE TABLE itemData (itemID INT, fieldID INT, valueID INT,
+    PRIMARY KEY (itemID, fieldID));
+CREATE TABLE creatorTypes (creatorTypeID INTEGER PRIMARY KEY, creatorType TEXT);
+CREATE TABLE creators (creatorID INTEGER PRIMARY KEY, firstName TEXT,
+    lastName TEXT, fieldMode INT);
+CREATE TABLE itemCreators (itemID INT, creatorID INT, creatorTypeID INT,
+    orderIndex INT, PRIMARY KEY (itemID, creatorID, creatorTypeID, orderIndex));
+CREATE TABLE tags (tagID INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE itemTags (itemID INT, tagID INT, type INT, PRIMARY KEY (itemID, tagID));
+CREATE TABLE deletedItems (itemID INTEGER PRIMARY KEY);
+"""
+
+sqlite_fields = {
+    "title": "Title",
+    "publicationTitle": "Publication Title",
+    "url": "Url",
+    "abstractNote": "Abstract Note",
+    "journalAbbreviation": "Journal Abbreviation",
+    "date": "Date",
+}
+
+
+def value_id(connection, value):
+    connection.execute(
+        "INSERT OR IGNORE INTO itemDataValues (value) VALUES (?)", [value]
+    )
+    return connection.execute(
+        "SELECT valueID FROM itemDataValues WHERE value = ?", [value]
+    ).fetchone()[0]
+
+
+# utility function to build a small zotero.sqlite fixture from a CSV export
+def build_zotero_sqlite(csv_filepath, sqlite_filepath):
+    zotero_db = ZoteroCSV(csv_filepath)
+    with closing(sqlite3.connect(sqlite_filepath)) as connection:
+        connection.executescript(zotero_sqlite_schema)
+        for type_name in ["journalArticle", "note"]:
+            connection.execute(
+                "INSERT INTO itemTypes (typeName) VALUES (?)", [type_name]
+            )
+        for field_name in sqlite_fields:
+            connection.execute(
+                "INSERT INTO fieldsCombined (fieldName) VALUES (?)", [field_name]
+            )
+        connection.execute("INSERT INTO creatorTypes (creatorType) VALUES ('author')")
+        for key, record in zotero_db.data.items():
+            item_id = connection.execute(
+                "INSERT INTO items (itemTypeID, dateAdded, dateModified, libraryID, key)"
+                " VALUES (1, ?, ?, 1, ?)",
+                [record["Date Added"], record["Date Modified"], key],
+            ).lastrowid
+            for field_id, (field_name, column) in enumerate(sqlite_fields.items(), 1):
+                value = record[column]
+                if value == "none":
+                    continue
+                if field_name == "date":
+                    value = f"{record['Publication Year']}-00-00 {value}"
+                connection.execute(
+                    "INSERT INTO itemData VALUES (?, ?, ?)",
+                    [item_id, field_id, value_id(connection, value)],
+                )
+            authors = [] if record["Author"] == "none" else record["Author"].split("; ")
+            for order_index, author in enumerate(authors):
+                last_name, _, first_name = author.partition(", ")
+                creator_id = connection.execute(
+                    "INSERT INTO creators (firstName, lastName, fieldMode) VALUES (?, ?, ?)",
+                    [first_name, last_name, 0 if first_name else 1],
+                ).lastrowid
+                connection.execute(
+                    "INSERT INTO itemCreators VALUES (?, ?, 1, ?)",
+                    [item_id, creator_id, order_index],
+                )
+            for tag in record["Manual Tags"].split(";"):
+                connection.execute(
+                    "INSERT OR IGNORE INTO tags (name) VALUES (?)", [tag]
+                )
+                tag_id = connection.execute(
+                    "SELECT tagID FROM tags WHERE name = ?", [tag]
+                ).fetchone()[0]
+                connection.execute(
+                    "INSERT OR IGNORE INTO itemTags VALUES (?, ?, 0)", [item_id, tag_id]
+                )
+        # child notes and items in the trash are not articles
+        connection.execute(
+            "INSERT INTO items (itemTypeID, dateAdded, dateModified, libraryID, key)"
+            " VALUES (2, '2022-01-01 00:00:00', '2022-01-01 00:00:00', 1, 'NOTE0001')"
+        )
+        item_id = connection.execute(
+            "INSERT INTO items (itemTypeID, dateAdded, dateModified, libraryID, key)"
+            " VALUES (1, '2022-01-01 00:00:00', '2022-01-01 00:00:00', 1, 'TRASH001')"
+        ).lastrowid
+        connection.execute("INSERT INTO deletedItems VALUES (?)", [item_id])
+        connection.commit()
+    return zotero_db
 
 
 def test_start():
@@ -32,3 +158,374 @@ def test_zotero_csv_processing():
         "abstract": "Abstract Note",
     }
     assert zd.keymap == ref
+
+
+def test_zotero_csv_streaming():
+    print("Testing streaming Zotero csv processing ...")
+    zd = ZoteroCSV(zotero_csv_data)
+    zs = ZoteroCSV(zotero_csv_data, stream=True)
+    assert len(zs.data) == 0
+    assert zs.keymap == zd.keymap
+    assert list(zs.records()) == list(zd.data.items())
+    # records can be read again, lazily
+    records = zs.records()
+    assert next(records)[0] == "FSEFS7AI"
+    # only the projected columns are kept
+    columns = {"Title", "Manual Tags"}
+    zp = ZoteroCSV(zotero_csv_data, columns=columns, stream=True)
+    for key, record in zp.records():
+        assert list(record) == ["Key", "Title", "Manual Tags"]
+        assert record["Title"] == zd.data[key]["Title"]
+        assert record["Manual Tags"] == zd.data[key]["Manual Tags"]
+
+
+def test_zotero_sqlite_processing(tmp_path):
+    print("Testing Zotero sqlite processing ...")
+    sqlite_filepath = tmp_path / "zotero.sqlite"
+    zotero_db = build_zotero_sqlite(graphdb_csv_data, sqlite_filepath)
+    with ZoteroSQLite(sqlite_filepath) as zs:
+        assert list(zs.data) == list(zotero_db.data)
+        assert zs.keymap == zotero_db.keymap
+        for key, record in zs.data.items():
+            for column in zotero_db.keymap.values():
+                assert record[column] == zotero_db.data[key][column]
+            assert record["Date"] == zotero_db.data[key]["Date"]
+            assert record["Automatic Tags"] == "none"
+        # only items modified after a given time
+        modified = sorted(record["Date Modified"] for record in zs.data.values())
+        recent = list(zs.records(modified_since=modified[-3]))
+        assert len(recent) == 2
+        assert all(record["Date Modified"] > modified[-3] for key, record in recent)
+    # the copy is removed once closed
+    assert not zs.copy_path.exists()
+    # projected streaming records
+    zs = ZoteroSQLite(sqlite_filepath, columns={"Title"}, stream=True)
+    assert len(zs.data) == 0
+    assert list(next(zs.records())[1]) == ["Key", "Title"]
+    # a graph DB built from zotero.sqlite matches the one built from the CSV
+    gdb = GraphDB(graphdb_csv_data)
+    sdb = GraphDB(sqlite_filepath, export_type=scribl.ZOTERO_SQLITE, stream=True)
+    assert sdb.db["article"] == gdb.db["article"]
+    for item_type in scribl.statement_types:
+        for item_name, fields in gdb.db[item_type].items():
+            for field, values in fields.items():
+                assert set(sdb.db[item_type][item_name][field]) == set(values)
+    for rtype, relations in gdb.db["relationships"].items():
+        assert set(sdb.db["relationships"][rtype]) == set(relations)
+
+
+class StubZoteroLibrary:
+    # an in-memory group library served like the Zotero web API
+    def __init__(self, csv_filepath):
+        self.version = 0
+        self.items = {}
+        self.deleted = {}
+        self.requests = []
+        # responses to serve instead, by page start: (status, headers) in turn
+        self.faults = {}
+        # functions run (once) before serving a page, by page start
+        self.edits = {}
+        # answer If-Unmodified-Since-Version with 412 when the library is newer
+        self.preconditions = True
+        for key, record in ZoteroCSV(csv_filepath).data.items():
+            authors = [] if record["Author"] == "none" else record["Author"].split("; ")
+            creators = []
+            for author in authors:
+                last_name, _, first_name = author.partition(", ")
+                creators.append(
+                    {
+                        "creatorType": "author",
+                        "firstName": first_name,
+                        "lastName": last_name,
+                    }
+                )
+            self.save_item(
+                {
+                    "key": key,
+                    "itemType": "journalArticle",
+                    "title": record["Title"],
+                    "creators": creators,
+                    "date": record["Publication Year"],
+                    "url": record["Url"],
+                    "publicationTitle": record["Publication Title"],
+                    "journalAbbreviation": record["Journal Abbreviation"],
+                    "abstractNote": record["Abstract Note"],
+                    "tags": [{"tag": tag} for tag in record["Manual Tags"].split("; ")],
+                }
+            )
+
+    def save_item(self, data):
+        self.version += 1
+        data["version"] = self.version
+        self.items[data["key"]] = data
+
+    def delete_item(self, key):
+        self.version += 1
+        del self.items[key]
+        self.deleted[key] = self.version
+
+
+class StubZoteroHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        library = self.server.library
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        library.requests.append((url.path, params, time.monotonic()))
+        edit = library.edits.pop(int(params.get("start", -1)), None)
+        if edit is not None:
+            edit()
+        unmodified_since = self.headers.get("If-Unmodified-Since-Version")
+        if (
+            library.preconditions
+            and unmodified_since is not None
+            and library.version > int(unmodified_since)
+        ):
+            self.send_response(412)
+            self.send_header("Last-Modified-Version", str(library.version))
+            self.end_headers()
+            return
+        since = int(params.get("since", 0))
+        headers = {"Last-Modified-Version": library.version}
+        faults = library.faults.get(int(params.get("start", -1)))
+        if faults:
+            status, fault_headers = faults.pop(0)
+            if status != 200:
+                self.send_response(status)
+                for header, value in fault_headers.items():
+                    self.send_header(header, str(value))
+                self.end_headers()
+                return
+            headers.update(fault_headers)
+        if url.path == "/groups/1/items/top":
+            items = [
+                {"key": data["key"], "version": data["version"], "data": data}
+                for data in library.items.values()
+                if data["version"] > since
+                and (params.get("includeTrashed") == "1" or not data.get("deleted"))
+            ]
+            headers["Total-Results"] = len(items)
+            start = int(params.get("start", 0))
+            body = items[start : start + int(params.get("limit", 25))]
+        elif url.path == "/groups/1/deleted":
+            body = {
+                "items": [
+                    key for key, version in library.deleted.items() if version > since
+                ]
+            }
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        for header, value in headers.items():
+            self.send_header(header, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+# fixture function to serve a stub Zotero library on a local port
+@pytest.fixture
+def stub_zotero_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubZoteroHandler)
+    server.library = StubZoteroLibrary(graphdb_csv_data)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_zotero_item_cache_sync(stub_zotero_server, tmp_path):
+    print("Testing incremental Zotero library sync ...")
+    library = stub_zotero_server.library
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    api = ZoteroAPI(1, "group", base_url=base_url, page_size=4)
+    cache = ZoteroItemCache(tmp_path / "zotero_cache")
+    summary = cache.sync(api)
+    assert summary["version"] == library.version == 11
+    assert len(summary["updated"]) == 11
+    assert api.nrequests == 3  # paged, no deletions asked for on a first sync
+    # the cached items feed a graph DB like the CSV export does
+    cdb = GraphDB(tmp_path / "zotero_cache", export_type=scribl.ZOTERO_API_CACHE)
+    gdb = GraphDB(graphdb_csv_data)
+    assert list(cdb.db["article"]) == list(gdb.db["article"])
+    for rtype, relations in gdb.db["relationships"].items():
+        assert set(cdb.db["relationships"][rtype]) == set(relations)
+    # only changes since the cached version are fetched
+    keys = list(library.items)
+    changed = dict(library.items[keys[0]], title="A changed title")
+    library.save_item(changed)
+    library.delete_item(keys[1])
+    library.save_item(dict(library.items[keys[2]], deleted=1))
+    library.requests.clear()
+    summary = ZoteroItemCache(tmp_path / "zotero_cache").sync(api)
+    assert summary["updated"] == [keys[0]]
+    assert set(summary["deleted"]) == {keys[1], keys[2]}
+    assert summary["version"] == 14
+    assert [request[1]["since"] for request in library.requests] == ["11", "11"]
+    cache = ZoteroItemCache(tmp_path / "zotero_cache")
+    assert cache.version == 14
+    assert len(cache.data) == 9
+    assert cache.data[keys[0]]["Title"] == "A changed title"
+    # and the graph DB is brought up to date incrementally
+    changes = cdb.update(tmp_path / "zotero_cache", export_type=scribl.ZOTERO_API_CACHE)
+    assert changes == {"added": [], "removed": [keys[1], keys[2]], "changed": [keys[0]]}
+    assert cdb.db["article"][keys[0]]["title"] == "A changed title"
+    # nothing new, nothing fetched but the (empty) first page and deletions
+    assert ZoteroItemCache(tmp_path / "zotero_cache").sync(api)["updated"] == []
+    # a cache belongs to one library
+    other_api = ZoteroAPI(2, "user", base_url=base_url)
+    with pytest.raises(ValueError, match="Item cache is for library"):
+        cache.sync(other_api)
+
+
+def test_zotero_sync_library_changes(stub_zotero_server, tmp_path):
+    print("Testing Zotero library changes during a sync ...")
+    library = stub_zotero_server.library
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    api = ZoteroAPI(1, "group", base_url=base_url, page_size=2, workers=1)
+    keys = list(library.items)
+    # an item deleted after the first page shifts the later pages, the
+    # library is fetched again rather than skipping an item
+    library.edits = {4: lambda: library.delete_item(keys[0])}
+    cache = ZoteroItemCache(tmp_path / "zotero_cache")
+    summary = cache.sync(api)
+    assert summary["version"] == library.version == 12
+    assert set(cache.items) == set(keys[1:])
+    starts = [request[1]["start"] for request in library.requests]
+    assert starts.count("0") == 2
+    # a server ignoring the precondition is caught by the page versions
+    library.preconditions = False
+    library.edits = {2: lambda: library.delete_item(keys[1])}
+    library.requests.clear()
+    cache = ZoteroItemCache(tmp_path / "other_cache")
+    cache.sync(api)
+    assert set(cache.items) == set(keys[2:])
+    assert cache.version == 13
+
+    # a library that keeps changing isn't fetched forever
+    def keep_changing():
+        library.save_item(library.items[keys[2]])
+        library.edits[2] = keep_changing
+
+    api.retries = 1
+    library.edits = {2: keep_changing}
+    with pytest.raises(ZoteroLibraryChanged, match="changed from version"):
+        ZoteroItemCache(None).sync(api)
+    # and leaves an existing cache as it was
+    items = dict(cache.items)
+    for key in keys[3:6]:
+        library.save_item(library.items[key])
+    library.edits = {2: keep_changing}
+    with pytest.raises(ZoteroLibraryChanged):
+        cache.sync(api)
+    assert cache.items == items
+    assert cache.version == 13
+
+
+def test_zotero_api_concurrent_fetch(stub_zotero_server):
+    print("Testing concurrent Zotero API page fetching ...")
+    library = stub_zotero_server.library
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    api = ZoteroAPI(1, "group", base_url=base_url, page_size=2, workers=3)
+    api.retry_delay = 0.01
+    # pages stream back in order, with failed pages retried
+    library.faults = {
+        4: [(503, {"Retry-After": 0.2})],
+        6: [(500, {}), (500, {})],
+    }
+    items = list(api.top_items())
+    assert [item["key"] for item in items] == list(library.items)
+    assert api.nrequests == 6 + 3
+    assert api.last_modified_version == 11
+    times = {}
+    for _, params, request_time in library.requests:
+        times.setdefault(int(params["start"]), []).append(request_time)
+    assert times[4][1] - times[4][0] >= 0.2
+    # nothing is asked for while the server wants us to back off
+    api.workers = 1
+    library.faults = {8: [(200, {"Backoff": 0.3})]}
+    library.requests.clear()
+    assert len(list(api.top_items())) == 11
+    times = {
+        int(params["start"]): request_time
+        for path, params, request_time in library.requests
+    }
+    assert times[10] - times[8] >= 0.3
+    # failures that don't go away are raised once the retries are used up
+    api.retries = 1
+    library.faults = {2: [(500, {}), (500, {})]}
+    with pytest.raises(urllib.error.HTTPError):
+        list(api.top_items())
+    library.faults = {0: [(403, {})]}
+    with pytest.raises(urllib.error.HTTPError):
+        list(api.top_items())
+
+
+def test_zotero_library_records(stub_zotero_server, tmp_path):
+    print("Testing Zotero library records without a CSV round trip ...")
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    zotero_db = zotero_library_records(1, "group", base_url=base_url)
+    assert zotero_db.cache_filepath is None
+    assert list(tmp_path.iterdir()) == []
+    # GraphDB reads the fetched items directly
+    rdb = GraphDB(zotero_db, export_type=scribl.ZOTERO_RECORDS)
+    # and the optional CSV archive reads back as the same records and graph
+    csv_filepath = tmp_path / "zotero_library.csv"
+    zotero_library_to_csv(
+        1, "group", zotero_csv_filename=csv_filepath, base_url=base_url
+    )
+    zd = ZoteroCSV(csv_filepath)
+    # without a filename nothing is archived
+    assert zotero_library_to_csv(1, "group", base_url=base_url).data == zd.data
+    assert list(tmp_path.iterdir()) == [csv_filepath]
+    assert zd.keys == zotero_db.keys
+    assert zd.data == zotero_db.data
+    assert zd.data["NP7Q3SDK"]["Author"].startswith("Tavassoly, I;Parmar, J;")
+    assert pickle.dumps(rdb.db) == pickle.dumps(GraphDB(csv_filepath).db)
+    # GraphDBInstance can load a library directly, optionally archiving it
+    gdb = GraphDBInstance(tmp_path / "test_graphdb")
+    gdb.load_zotero_library(1, "group", base_url=base_url)
+    assert gdb.get_zotero_csv_exports() == []
+    assert len(gdb.graphdb.db["article"]) == 11
+    gdb.load_zotero_library(1, "group", base_url=base_url, archive_csv=True)
+    assert gdb.get_zotero_csv_exports() == [gdb.current_zotero_csv.name]
+    assert gdb.load_zotero_csv() == ({}, {})
+
+
+def test_zotero_records_years(stub_zotero_server):
+    print("Testing publication years of Zotero API items ...")
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    library = stub_zotero_server.library
+    article_key = next(iter(library.items))
+    library.save_item(dict(library.items[article_key], date="2016-04-12"))
+    zotero_db = zotero_library_records(1, "group", base_url=base_url)
+    rdb = GraphDB(zotero_db, export_type=scribl.ZOTERO_RECORDS)
+    assert rdb.db["article"][article_key]["year"] == "2016-04-12"
+    assert article_key in rdb.articles_in_years(2010, 2020)
+    assert article_key in rdb.articles_in_years(2016, 2016)
+    assert article_key not in rdb.articles_in_years(2017)
+    assert article_key in rdb.subgraph(years=(2016, 2016)).db["article"]
+
+
+def test_graphdb_instance_sync(stub_zotero_server, tmp_path):
+    print("Testing graph DB loading from a synced Zotero library ...")
+    base_url = f"http://127.0.0.1:{stub_zotero_server.server_address[1]}"
+    gdb = GraphDBInstance(tmp_path / "test_graphdb")
+    assert gdb.load_zotero_cache() is None
+    gdb.sync_zotero_library(1, "group", base_url=base_url)
+    assert gdb.load_zotero_cache() == ({}, {})
+    assert len(gdb.graphdb.db["article"]) == 11
+    snapshot_filepath = gdb.save_db_snapshot()
+    assert snapshot_filepath.name == f"{gdb.current_timestamp}_db_snapshot.dat"
+    library = stub_zotero_server.library
+    library.delete_item(next(iter(library.items)))
+    assert len(gdb.sync_zotero_library(1, "group", base_url=base_url)["deleted"]) == 1
+    graphdb = gdb.graphdb
+    gdb.load_zotero_cache(incremental=True)
+    assert gdb.graphdb is graphdb
+    assert len(gdb.graphdb.db["article"]) == 10